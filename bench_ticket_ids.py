@@ -0,0 +1,32 @@
+import tempfile
+import time
+from pathlib import Path
+
+from ticket_store import CachedTicketStore, JsonTicketStore, TicketIdAllocator
+
+SIZES = [100, 10_000, 100_000]
+SAMPLES = 1000
+
+def make_ticket(ticket_id: str) -> dict:
+    return {"id": ticket_id, "title": "Bench", "query": "Bench", "category": "Others",
+            "status": "Pending", "group_id": ticket_id, "history": [], "notified": True}
+
+def bench(size: int) -> float:
+    """Average microseconds to allocate an id and insert a ticket into a store holding `size` tickets."""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        backing = JsonTicketStore(tmp / "tickets_db.json", compact_bytes=10**12, compact_interval=10**9)
+        backing.replace_all([make_ticket(f"TKT-{1001 + i}") for i in range(size)])
+        store = CachedTicketStore(backing)
+        ids = TicketIdAllocator(tmp / "tickets_db.seq", (t["id"] for t in store.all()))
+
+        start = time.perf_counter()
+        for _ in range(SAMPLES):
+            store.insert(make_ticket(ids.next_id()))
+        elapsed = time.perf_counter() - start
+        store.close()
+    return elapsed / SAMPLES * 1e6
+
+if __name__ == "__main__":
+    for size in SIZES:
+        print(f"{size:>8} tickets: {bench(size):8.1f} µs per create")
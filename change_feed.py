@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+
+class ChangeFeed:
+    """In-process feed of ticket/KB change events with monotonic sequence numbers.
+
+    Keeps the last `capacity` events so clients can resume from the sequence number
+    they last saw. A client asking for a sequence that is no longer buffered (or one
+    from before a server restart) is told to reset, i.e. do one full fetch and resume
+    from `latest`. `publish` may be called from any thread; waiters are woken on the
+    event loop that first waited.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.epoch = int(time.time() * 1000)
+        self._events = deque(maxlen=capacity)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._changed: Optional[asyncio.Event] = None
+
+    @property
+    def latest(self) -> int:
+        return self._seq
+
+    def publish(self, event_type: str, **payload) -> dict:
+        with self._lock:
+            self._seq += 1
+            event = {"seq": self._seq, "type": event_type, **payload}
+            self._events.append(event)
+        self._wake()
+        return event
+
+    def _wake(self) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._notify()
+        else:
+            loop.call_soon_threadsafe(self._notify)
+
+    def _notify(self) -> None:
+        # Swap in a fresh Event so every waiter of the old one wakes exactly once.
+        changed, self._changed = self._changed, asyncio.Event()
+        if changed is not None:
+            changed.set()
+
+    def since(self, seq: int, epoch: Optional[int] = None) -> Tuple[bool, List[dict]]:
+        """Returns (reset_required, events after `seq`). `epoch` guards against server restarts."""
+        with self._lock:
+            if (epoch is not None and epoch != self.epoch) or seq > self._seq:
+                return True, []
+            if seq == self._seq:
+                return False, []
+            oldest = self._events[0]["seq"] if self._events else self._seq + 1
+            if seq < oldest - 1:
+                return True, []
+            return False, [e for e in self._events if e["seq"] > seq]
+
+    async def wait(self, seq: int, epoch: Optional[int], timeout: float) -> Tuple[bool, List[dict]]:
+        """Like `since`, but waits up to `timeout` seconds for at least one new event."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._changed = asyncio.Event()
+        deadline = time.monotonic() + timeout
+        while True:
+            changed = self._changed
+            reset, events = self.since(seq, epoch)
+            remaining = deadline - time.monotonic()
+            if reset or events or remaining <= 0:
+                return reset, events
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+class KBChangePublisher:
+    """KBIndex listener that announces knowledge base changes on a ChangeFeed."""
+
+    def __init__(self, feed: ChangeFeed):
+        self.feed = feed
+
+    def on_kb_add(self, row: dict) -> None:
+        self.feed.publish("kb.updated", entry_id=row["ID"])
+
+    def on_kb_add_many(self, rows: List[dict]) -> None:
+        # One event for a bulk import, so clients refetch once instead of per row.
+        self.feed.publish("kb.updated_many", entry_ids=[row["ID"] for row in rows])
+
+    def on_kb_remove(self, entry_id: str) -> None:
+        self.feed.publish("kb.deleted", entry_id=entry_id)
+
+    def on_kb_rebuild(self, index) -> None:
+        self.feed.publish("kb.reloaded", count=len(index))
@@ -2,241 +2,671 @@
 import discord
 from discord.ext import commands, tasks
 import os
+import json
+import time
 import aiohttp
 import asyncio
+import random
+from collections import OrderedDict
 from dotenv import load_dotenv
+from kb_index import tokenize
 
 load_dotenv()
 
 DISCORD_BOT_TOKEN = os.getenv('DISCORD_BOT_TOKEN')
 DISCORD_CHANNEL_ID = os.getenv('DISCORD_CHANNEL_ID')
 API_URL = "http://localhost:8000"  # Your backend server
+STREAM_EDIT_INTERVAL = 1.0  # Seconds between edits of a streaming reply (Discord rate-limits edits)
+
+# Backend HTTP client: one pooled session for the bot's lifetime (keep-alive, capped sockets)
+BACKEND_MAX_CONNECTIONS = int(os.getenv('BACKEND_MAX_CONNECTIONS', '20'))
+BACKEND_RETRIES = int(os.getenv('BACKEND_RETRIES', '3'))
+BACKEND_RETRY_BACKOFF = 0.5  # Seconds; doubled on each retry, plus jitter
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Per-channel rolling conversation buffer (feeds /chat/analyze and /tickets history)
+CONVERSATION_MAX_MESSAGES = int(os.getenv('CONVERSATION_MAX_MESSAGES', '50'))
+CONVERSATION_MAX_AGE_SECONDS = float(os.getenv('CONVERSATION_MAX_AGE_SECONDS', '3600'))
+CONVERSATION_MAX_CHANNELS = int(os.getenv('CONVERSATION_MAX_CHANNELS', '500'))
+
+# Cheap local checks before a message costs a Gemini call
+MESSAGE_DEBOUNCE_SECONDS = float(os.getenv('MESSAGE_DEBOUNCE_SECONDS', '1.5'))  # Quiet time before a user's burst is analyzed
+MESSAGE_DEBOUNCE_MAX_SECONDS = 6.0  # Never hold a burst longer than this
+PREFILTER_MIN_HITS = int(os.getenv('PREFILTER_MIN_HITS', '1'))  # IT-vocabulary words a message needs; 0 disables the pre-filter
+ESCALATION_WORDS = {"ticket", "admin", "escalate", "human", "help", "support"}
+BASE_IT_TERMS = set("""
+account adapter app application bluetooth boot browser cable calendar camera certificate chrome
+computer connect connection crash crashed crashes database desktop device disk display dns docking
+driver drive email error excel firewall freeze frozen hardware headset install installed internet
+ip keyboard laptop license lock locked login logon mac macbook mailbox malware microphone mfa
+monitor mouse network office onedrive outlook password permission permissions phishing phone
+port printer printing projector reboot reset restart router screen server sharepoint slack slow
+software sso storage sync teams update upgrade usb vpn webcam wifi windows wireless word zoom
+""".split())
 
 # Mapping Discord User ID -> Current Ticket ID (if any)
 # This helps us contextually maintain conversation if needed
 active_sessions = {}
 
+class ConversationBuffer:
+    """
+    Recent messages per channel/thread, filled from the gateway events the bot already
+    receives, so conversation context needs no Discord API calls. Each channel keeps at
+    most `max_messages` messages younger than `max_age` seconds; channels beyond
+    `max_channels` are evicted least-recently-used first.
+    """
+
+    def __init__(self, max_messages, max_age, max_channels):
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.max_channels = max_channels
+        self._channels = OrderedDict()  # channel id -> OrderedDict(message id -> (timestamp, role, content))
+
+    def _touch(self, channel_id):
+        messages = self._channels.get(channel_id)
+        if messages is None:
+            messages = self._channels[channel_id] = OrderedDict()
+            while len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+        self._channels.move_to_end(channel_id)
+        return messages
+
+    def _prune(self, messages):
+        cutoff = time.time() - self.max_age
+        while messages and (len(messages) > self.max_messages or next(iter(messages.values()))[0] < cutoff):
+            messages.popitem(last=False)
+
+    def __contains__(self, channel_id):
+        return channel_id in self._channels
+
+    def record(self, message):
+        if not message.content:
+            return
+        messages = self._touch(message.channel.id)
+        role = "model" if message.author == bot.user else "user"
+        messages[message.id] = (message.created_at.timestamp(), role, message.content)
+        self._prune(messages)
+
+    def update(self, message):
+        """Keeps edited messages (e.g. streamed bot replies) current."""
+        messages = self._channels.get(message.channel.id)
+        if messages and message.id in messages:
+            created, role, _ = messages[message.id]
+            messages[message.id] = (created, role, message.content)
+
+    def discard(self, channel_id, message_id):
+        messages = self._channels.get(channel_id)
+        if messages:
+            messages.pop(message_id, None)
+
+    def history(self, channel_id):
+        """Chronological [{"role", "content"}] for the channel, oldest first."""
+        messages = self._channels.get(channel_id)
+        if not messages:
+            return []
+        self._channels.move_to_end(channel_id)
+        self._prune(messages)
+        cutoff = time.time() - self.max_age
+        return [{"role": role, "content": content} for ts, role, content in messages.values() if ts >= cutoff]
+
+    async def seed(self, channel):
+        """One-off backfill for a channel the bot has not seen since it started."""
+        self._touch(channel.id)
+        async for msg in channel.history(limit=self.max_messages):
+            self.record(msg)
+        messages = self._channels[channel.id]
+        # history() is newest first; restore chronological order
+        for message_id in sorted(messages, key=lambda m: messages[m][0]):
+            messages.move_to_end(message_id)
+
+conversations = ConversationBuffer(CONVERSATION_MAX_MESSAGES, CONVERSATION_MAX_AGE_SECONDS, CONVERSATION_MAX_CHANNELS)
+
+# Words that suggest an IT question: BASE_IT_TERMS plus the Knowledge Base's own
+# vocabulary, refreshed whenever the backend reports a KB change.
+it_vocabulary = set(BASE_IT_TERMS)
+
+def kb_vocabulary(terms):
+    return {t for t in terms if len(t) > 2 and not t.isdigit()}
+
+def worth_analyzing(text, earlier_messages):
+    """Local pre-filter: False for messages that are clearly not IT requests."""
+    if PREFILTER_MIN_HITS <= 0:
+        return True
+    # Follow-ups in a conversation the bot is already part of always go through
+    if any(m["role"] == "model" for m in earlier_messages):
+        return True
+    tokens = set(tokenize(text))
+    if tokens & ESCALATION_WORDS:
+        return True
+    return len(tokens & it_vocabulary) >= PREFILTER_MIN_HITS
+
+# (channel id, author id) -> messages from a burst that is still being collected
+pending_bursts = {}
+
+async def collect_burst(key, message):
+    """
+    Debounces rapid consecutive messages from one user in one channel. Returns the
+    whole burst to the call that started it once the user has been quiet for
+    MESSAGE_DEBOUNCE_SECONDS, and None to every later call (their message was added).
+    """
+    burst = pending_bursts.get(key)
+    if burst is not None:
+        burst.append(message)
+        return None
+    burst = pending_bursts[key] = [message]
+    started = time.monotonic()
+    seen = 0
+    try:
+        while len(burst) != seen and time.monotonic() - started < MESSAGE_DEBOUNCE_MAX_SECONDS:
+            seen = len(burst)
+            await asyncio.sleep(MESSAGE_DEBOUNCE_SECONDS)
+    finally:
+        # Also on cancellation, or this user's later messages would be buffered forever.
+        pending_bursts.pop(key, None)
+    return burst
+
 # 1. Setup Intents
 intents = discord.Intents.default()
 intents.message_content = True 
 
 # 2. Define the bot
-bot = commands.Bot(command_prefix='!', intents=intents)
+class LoopBackBot(commands.Bot):
+    """Bot that keeps one pooled HTTP session to the backend for its whole lifetime."""
+
+    backend: aiohttp.ClientSession = None
+
+    async def setup_hook(self):
+        connector = aiohttp.TCPConnector(
+            limit=BACKEND_MAX_CONNECTIONS,  # A burst of messages queues for a socket instead of opening hundreds
+            keepalive_timeout=60,
+            ttl_dns_cache=300,
+        )
+        # No total timeout: chat answers and the change feed are long-lived streams.
+        timeout = aiohttp.ClientTimeout(total=None, connect=5, sock_read=120)
+        self.backend = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def close(self):
+        if self.backend:
+            await self.backend.close()
+        await super().close()
+
+bot = LoopBackBot(command_prefix='!', intents=intents)
+
+async def backend_call(method, path, idempotent=None, **kwargs):
+    """
+    Calls the backend and returns (status, json_or_None), retrying with exponential
+    backoff on 429/502/503/504 and on connection failures. Non-idempotent requests
+    (POST by default) are only retried when the backend cannot have acted on them
+    (429/503, or the connection could not be opened), so a ticket is never created twice.
+    """
+    if idempotent is None:
+        idempotent = method == "GET"
+    retry_statuses = RETRY_STATUSES if idempotent else (429, 503)
+    retryable = aiohttp.ClientConnectionError if idempotent else aiohttp.ClientConnectorError
+    for attempt in range(BACKEND_RETRIES + 1):
+        delay = BACKEND_RETRY_BACKOFF * (2 ** attempt) + random.uniform(0, 0.1)
+        try:
+            async with bot.backend.request(method, f"{API_URL}{path}", **kwargs) as resp:
+                if resp.status in retry_statuses and attempt < BACKEND_RETRIES:
+                    delay = max(delay, float(resp.headers.get("Retry-After", 0) or 0))
+                    print(f"Backend {method} {path} returned {resp.status}, retrying in {delay:.1f}s")
+                else:
+                    data = await resp.json(content_type=None) if resp.status == 200 else None
+                    return resp.status, data
+        except retryable as e:
+            if attempt == BACKEND_RETRIES:
+                raise
+            print(f"Backend {method} {path} failed ({e}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
 
 @bot.event
 async def on_ready():
     print(f'✅ Logged in as {bot.user.name} (ID: {bot.user.id})')
     print(f'🔌 Connected to Backend: {API_URL}')
-    check_resolved_tickets.start() # Start background polling
+    watch_ticket_changes.start() # Start following the backend change feed
+    retry_notifications.start() # Retry notifications that could not be delivered
     print('------')
 
+async def stream_analysis(session, payload):
+    """Yields (event, data) pairs from the backend's Server-Sent Events chat stream."""
+    async with session.post(f"{API_URL}/chat/analyze/stream", json=payload) as resp:
+        if resp.status != 200:
+            yield "error", {"status": resp.status}
+            return
+        event = None
+        async for raw in resp.content:
+            line = raw.decode("utf-8").rstrip("\r\n")
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event:
+                yield event, json.loads(line[len("data: "):])
+                event = None
+
+async def open_thread(message, summary):
+    """Creates a thread for the conversation, falling back to the channel."""
+    try:
+        return await message.create_thread(name=f"🎫 {summary[:50]}", auto_archive_duration=60)
+    except Exception as ex:
+        print(f"Failed to create thread: {ex}")
+        return message.channel # Fallback
+
+@bot.event
+async def on_message_edit(before, after):
+    conversations.update(after)
+
+@bot.event
+async def on_raw_message_delete(payload):
+    conversations.discard(payload.channel_id, payload.message_id)
+
 @bot.event
 async def on_message(message):
-    # Ignore self
+    # Ignore self (but remember our replies as conversation context)
     if message.author == bot.user:
+        conversations.record(message)
         return
 
+    # Escalations that start in a channel the bot has not seen yet need its earlier messages.
+    cold_channel = message.channel.id not in conversations
+    earlier_messages = conversations.history(message.channel.id)
+    conversations.record(message)
+
     # Only listen in specific channel (optional, remove check to allow DMs)
     # if str(message.channel.id) != DISCORD_CHANNEL_ID:
     #     return
 
-    user_query = message.content
+    # Several quick messages from the same user are analyzed once, together
+    burst = await collect_burst((message.channel.id, message.author.id), message)
+    if burst is None:
+        return
+
+    user_query = "\n".join(m.content for m in burst if m.content)
     user_id = str(message.author.id)
     username = message.author.name
+    is_mentioned = any(bot.user in m.mentions for m in burst)
+
+    if not is_mentioned and not worth_analyzing(user_query, earlier_messages):
+        print(f"Pre-filter skipped message: {user_query[:80]}")
+        return
     
     # Simple "Thinking" indicator
     async with message.channel.typing():
         try:
-            async with aiohttp.ClientSession() as session:
+            session = bot.backend
+
+            # 1. Analyze the chat first (streamed)
+            analyze_payload = {
+                "message": user_query,
+                "history": earlier_messages
+            }
+
+            # A likely direct answer is posted as soon as the metadata arrives and
+            # edited as the text streams in; everything else waits for the final result.
+            analysis = None
+            thread = None
+            reply = None
+            streamed = ""
+            last_edit = 0.0
+            async for event, data in stream_analysis(session, analyze_payload):
+                if event == "error":
+                    await message.channel.send("⚠️ Backend Error: Unable to analyze request.")
+                    return
+                elif event == "meta":
+                    if not data.get("is_it_related", True) and not is_mentioned:
+                        break
+                    if data.get("confidence") == "high" and not data.get("escalation_required"):
+                        thread = await open_thread(message, data.get("summary", "Support Request"))
+                        reply = await thread.send("💭 ...")
+                elif event == "delta" and reply:
+                    streamed += data.get("text", "")
+                    if time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL:
+                        await reply.edit(content=f"{streamed} ▌"[:2000])
+                        last_edit = time.monotonic()
+                elif event == "final":
+                    analysis = data
+
+            if analysis is None:
+                print(f"Skipping unrelated message: {user_query}")
+                return
                 
-                # 1. Analyze the chat first
-                analyze_payload = {
-                    "message": user_query,
-                    "history": [] # TODO: Add history if needed
-                }
+            confidence = analysis.get("confidence")
+            solution = analysis.get("response")
+            escalate = analysis.get("escalation_required")
+            is_related = analysis.get("is_it_related", True)
+            summary = analysis.get("summary", "Support Request")
+
+            # Logic: Is it IT related?
+            # If NOT related -> Only reply if we were explicitly mentioned
+            if not is_related and not is_mentioned:
+                print(f"Skipping unrelated message: {user_query}")
+                if reply:
+                    await reply.delete()
+                return
+
+            # Create Thread for conversation
+            if thread is None:
+                thread = await open_thread(message, summary)
+            
+            # Logic:
+            # If High Confidence & No Escalation -> Respond directly
+            # If Low Confidence OR Escalation Required -> Create Ticket
+            
+            if confidence == "high" and not escalate:
+                # Direct Response (Plain Text)
+                msg = f"**{solution}\n\n*Is this helpful? If not, reply with 'ticket' to talk to a human.*"
+                if reply:
+                    await reply.edit(content=msg)
+                else:
+                    await thread.send(msg)
                 
-                async with session.post(f"{API_URL}/chat/analyze", json=analyze_payload) as resp:
-                    if resp.status != 200:
-                        await message.channel.send("⚠️ Backend Error: Unable to analyze request.")
-                        return
-                    
-                    analysis = await resp.json()
-                    
-                confidence = analysis.get("confidence")
-                solution = analysis.get("response")
-                escalate = analysis.get("escalation_required")
-                is_related = analysis.get("is_it_related", True)
-                summary = analysis.get("summary", "Support Request")
-
-                # Logic: Is it IT related?
-                # If NOT related -> Only reply if we were explicitly mentioned
-                is_mentioned = bot.user in message.mentions
-                if not is_related and not is_mentioned:
-                    print(f"Skipping unrelated message: {user_query}")
-                    return
+            else:
+                # The streamed preview turned out not to be a direct answer
+                if reply:
+                    await reply.delete()
 
-                # Create Thread for conversation
-                try:
-                    thread = await message.create_thread(name=f"🎫 {summary[:50]}", auto_archive_duration=60)
-                except Exception as ex:
-                    print(f"Failed to create thread: {ex}")
-                    thread = message.channel # Fallback
+                # Create Ticket with Context
+                # 1. Conversation so far, from the local buffer (backfilled once after a restart)
+                if cold_channel:
+                    await conversations.seed(message.channel)
+                messages = conversations.history(message.channel.id)
                 
-                # Logic:
-                # If High Confidence & No Escalation -> Respond directly
-                # If Low Confidence OR Escalation Required -> Create Ticket
+                # 2. Determine meaningful query
+                # If user just said "ticket", look back for the last user message that wasn't "ticket"
+                final_query = user_query
+                if len(user_query.split()) < 3 and len(messages) > 1:
+                    for m in reversed(messages[:-1]): # Skip current "ticket" msg
+                        if m["role"] == "user":
+                            final_query = m["content"]
+                            break
+
+                ticket_payload = {
+                    "query": final_query,
+                    "history": messages, # Pass full history
+                    "users": [user_id, username], 
+                    "force_create": True
+                }
                 
-                if confidence == "high" and not escalate:
-                    # Direct Response (Plain Text)
-                    msg = f"**{solution}\n\n*Is this helpful? If not, reply with 'ticket' to talk to a human.*"
-                    await thread.send(msg)
+                status, ticket_data = await backend_call("POST", "/tickets", json=ticket_payload)
+                if status == 200:
+                    t_id = ticket_data.get("ticket_id")
+                    draft_sol = ticket_data.get("solution", "")
                     
-                else:
-                    # Create Ticket with Context
-                    # 1. Fetch History
-                    messages = []
-                    # Check if we are in a thread (best context) or channel
-                    target_ctx = message.channel
-                    
-                    async for msg in target_ctx.history(limit=50):
-                         if msg.content:
-                             role = "model" if msg.author == bot.user else "user"
-                             messages.append({"role": role, "content": msg.content})
-                    
-                    # Reverse so it's chronological
-                    messages.reverse()
-                    
-                    # 2. Determine meaningful query
-                    # If user just said "ticket", look back for the last user message that wasn't "ticket"
-                    final_query = user_query
-                    if len(user_query.split()) < 3 and len(messages) > 1:
-                        for m in reversed(messages[:-1]): # Skip current "ticket" msg
-                            if m["role"] == "user":
-                                final_query = m["content"]
-                                break
-
-                    ticket_payload = {
-                        "query": final_query,
-                        "history": messages, # Pass full history
-                        "users": [user_id, username], 
-                        "force_create": True
-                    }
+                    # Ticket Confirmation (Plain Text)
+                    msg = f"**🎫 Ticket Created: {t_id}**\n\nI've logged this for an admin to review.\n\n**Issue:** {final_query}\n**Status:** Pending"
+                    if draft_sol:
+                        msg += f"\n\n**Preliminary Suggestion:**\n{draft_sol}"
                     
-                    async with session.post(f"{API_URL}/tickets", json=ticket_payload) as resp:
-                        if resp.status == 200:
-                            ticket_data = await resp.json()
-                            t_id = ticket_data.get("ticket_id")
-                            draft_sol = ticket_data.get("solution", "")
-                            
-                            # Ticket Confirmation (Plain Text)
-                            msg = f"**🎫 Ticket Created: {t_id}**\n\nI've logged this for an admin to review.\n\n**Issue:** {final_query}\n**Status:** Pending"
-                            if draft_sol:
-                                msg += f"\n\n**Preliminary Suggestion:**\n{draft_sol}"
-                            
-                            await thread.send(msg)
-                        else:
-                            await thread.send("❌ Error creating ticket.")
+                    await thread.send(msg)
+                else:
+                    await thread.send("❌ Error creating ticket.")
 
         except Exception as e:
             await message.channel.send(f"⚠️ System Error: {str(e)}")
 
 # --- Background Task: Notify Users of Resolution ---
-@tasks.loop(seconds=5)
-async def check_resolved_tickets():
+CHANGE_FEED_RECONNECT_SECONDS = 5  # Wait before reconnecting to the backend change feed
+NOTIFY_EVENTS = ("ticket.resolved", "tickets.resolved", "ticket.awaiting_info", "tickets.reloaded")
+NOTIFY_FALLBACK_SECONDS = float(os.getenv('NOTIFY_FALLBACK_SECONDS', '60'))  # Outbox re-drain for undelivered notifications
+NOTIFY_CONCURRENCY = int(os.getenv('NOTIFY_CONCURRENCY', '8'))  # Destinations notified in parallel
+NOTIFY_ACK_BATCH = 100  # Delivered notifications acked per backend call
+DISCORD_OBJECT_CACHE_SIZE = 1000
+
+# Ticket ids whose notification is being delivered right now; overlapping drains skip them.
+notifications_in_flight = set()
+# Resolved Discord channels/threads and users, so repeat notifications skip the fetch round trip.
+channel_cache = OrderedDict()
+user_cache = OrderedDict()
+drain_task = None
+drain_requested = False
+vocabulary_task = None
+vocabulary_requested = False
+
+def _cache_put(cache, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > DISCORD_OBJECT_CACHE_SIZE:
+        cache.popitem(last=False)
+
+async def resolve_channel(channel_id):
+    channel = channel_cache.get(channel_id) or bot.get_channel(channel_id)
+    if channel is None:
+        channel = await bot.fetch_channel(channel_id)
+    _cache_put(channel_cache, channel_id, channel)
+    return channel
+
+async def resolve_user(user_id):
+    user = user_cache.get(user_id) or bot.get_user(user_id)
+    if user is None:
+        user = await bot.fetch_user(user_id)
+    _cache_put(user_cache, user_id, user)
+    return user
+
+def notification_user_id(n):
+    # Try to find the numeric ID string
+    for u in n.get("users", []):
+        if u.isdigit():
+            return int(u)
+    return None
+
+def notification_bucket(n):
     """
-    Polls backend for tickets requiring notification (Resolved or Awaiting Info).
+    Discord rate-limits message sends per channel, so notifications are grouped by
+    where they will be posted; each group is sent in order by a single worker.
     """
+    if n.get("thread_id"):
+        return ("thread", str(n["thread_id"]))
+    return ("user", notification_user_id(n))
+
+async def notify_ticket(n):
+    """
+    Delivers one pending notification (an entry from /notifications/pending).
+    Returns True if the user was reached.
+    """
+    val_id = n.get("id")
+    status = n.get("status")
+
+    # Determine Message Content based on Status
+    msg_content = ""
+    if status == "Resolved":
+        msg_content = f"**✅ Ticket Resolved: {val_id}**\n\n**Issue:** {n.get('query')}\n**Resolution:** {n.get('final_answer')}"
+    elif status == "Awaiting Info":
+        last_admin_msg = n.get("last_admin_question") or "Please provide more details."
+        msg_content = f"**❓ Admin Question: {val_id}**\n\n{last_admin_msg}\n\n*Reply here to answer.*"
+
+    if not msg_content:
+        return False
+
+    sent = False
+
+    # 1. Try Thread Notification First
+    thread_id = n.get("thread_id")
+    if thread_id:
+        try:
+            thread = await resolve_channel(int(thread_id))
+            if thread:
+                await thread.send(msg_content)
+                sent = True
+                print(f"DTO sent to thread {thread_id} for {val_id}")
+        except Exception as e:
+            print(f"Thread notification failed: {e}")
+
+    # 2. Fallback to DM if not sent to thread
+    discord_user_id = notification_user_id(n)
+    if not sent and discord_user_id:
+        user = None
+        try:
+            user = await resolve_user(discord_user_id)
+        except: pass
+
+        if user:
+            try:
+                await user.send(msg_content)
+                sent = True
+                print(f"DTO sent to DM {user.name} for {val_id}")
+            except:
+                # Fallback to channel if DM fails
+                if DISCORD_CHANNEL_ID:
+                    ch = bot.get_channel(int(DISCORD_CHANNEL_ID))
+                    if ch: await ch.send(content=f"<@{discord_user_id}> \n{msg_content}")
+                    sent = True
+
+    return sent
+
+async def ack_notifications(ids):
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{API_URL}/tickets") as resp:
-                if resp.status == 200:
-                    tickets = await resp.json()
-                    
-                    for t in tickets:
-                        val_id = t.get("id")
-                        status = t.get("status")
-                        notified = t.get("notified", True) # Default to True for old tickets/legacy stability
-                        users = t.get("users", [])
-                        
-                        # Only process if NOT notified
-                        if not notified and (status == "Resolved" or status == "Awaiting Info"):
-                            
-                            # Determine Message Content based on Status
-                            msg_content = ""
-                            if status == "Resolved":
-                                msg_content = f"**✅ Ticket Resolved: {val_id}**\n\n**Issue:** {t.get('query')}\n**Resolution:** {t.get('final_answer')}"
-                            elif status == "Awaiting Info":
-                                # Find the last admin question
-                                history = t.get("history", [])
-                                last_admin_msg = "Please provide more details."
-                                for h in reversed(history):
-                                    if h.get("role") == "admin":
-                                        last_admin_msg = h.get("message")
-                                        break
-                                msg_content = f"**❓ Admin Question: {val_id}**\n\n{last_admin_msg}\n\n*Reply here to answer.*"
-                            
-                            if not msg_content:
-                                continue
-
-                            sent = False
-                            
-                            # 1. Try Thread Notification First
-                            thread_id = t.get("thread_id")
-                            if thread_id:
-                                try:
-                                    thread = bot.get_channel(int(thread_id)) or await bot.fetch_channel(int(thread_id))
-                                    if thread:
-                                        await thread.send(msg_content)
-                                        sent = True
-                                        print(f"DTO sent to thread {thread_id} for {val_id}")
-                                except Exception as e:
-                                    print(f"Thread notification failed: {e}")
-
-                            # 2. Fallback to DM if not sent to thread
-                            if not sent and users:
-                                discord_user_id = None
-                                # Try to find the numeric ID string
-                                for u in users:
-                                    if u.isdigit(): 
-                                        discord_user_id = int(u)
-                                        break
-                                
-                                if discord_user_id:
-                                    user = bot.get_user(discord_user_id)
-                                    if not user:
-                                        try:
-                                            user = await bot.fetch_user(discord_user_id)
-                                        except: pass
-                                    
-                                    if user:
-                                        try:
-                                            await user.send(msg_content)
-                                            sent = True
-                                            print(f"DTO sent to DM {user.name} for {val_id}")
-                                        except:
-                                            # Fallback to channel if DM fails
-                                            if DISCORD_CHANNEL_ID:
-                                                ch = bot.get_channel(int(DISCORD_CHANNEL_ID))
-                                                if ch: await ch.send(content=f"<@{discord_user_id}> \n{msg_content}")
-                                                sent = True
-                            
-                            # 3. ACK Notification to Backend
-                            if sent:
-                                try:
-                                    async with session.post(f"{API_URL}/tickets/{val_id}/ack_notification") as ack_resp:
-                                        if ack_resp.status == 200:
-                                            print(f"✅ Acked notification for {val_id}")
-                                        else:
-                                            print(f"❌ Failed to ack notification for {val_id}: {ack_resp.status}")
-                                except Exception as ex:
-                                    print(f"Exception acking notification: {ex}")
+        # Acking is idempotent, so it is safe to retry on any connection error
+        status, _ = await backend_call("POST", "/notifications/ack", idempotent=True, json={"ids": ids})
+        if status == 200:
+            print(f"✅ Acked notifications for {', '.join(ids)}")
+        else:
+            print(f"❌ Failed to ack notifications for {', '.join(ids)}: {status}")
+    except Exception as ex:
+        print(f"Exception acking notifications: {ex}")
+
+async def notify_pending_tickets():
+    """
+    Delivers everything in the backend's notification outbox. Destinations are served
+    concurrently (at most NOTIFY_CONCURRENCY at once), and delivered ids are acked in
+    batches of NOTIFY_ACK_BATCH.
+    """
+    status, pending = await backend_call("GET", "/notifications/pending")
+    if status != 200:
+        print(f"Pending notification fetch failed: {status}")
+        return
 
+    buckets = {}
+    for n in pending:
+        if n["id"] in notifications_in_flight:
+            continue
+        notifications_in_flight.add(n["id"])
+        buckets.setdefault(notification_bucket(n), []).append(n)
+    if not buckets:
+        return
+
+    limit = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+    delivered = []
+    acks = []
+
+    async def flush_acks(force=False):
+        while delivered and (force or len(delivered) >= NOTIFY_ACK_BATCH):
+            batch = delivered[:NOTIFY_ACK_BATCH]
+            del delivered[:NOTIFY_ACK_BATCH]
+            await ack_notifications(batch)
+
+    async def send_bucket(items):
+        async with limit:
+            for n in items:
+                try:
+                    if await notify_ticket(n):
+                        delivered.append(n["id"])
+                except Exception as e:
+                    print(f"Notification for {n['id']} failed: {e}")
+            if len(delivered) >= NOTIFY_ACK_BATCH:
+                acks.append(asyncio.create_task(flush_acks()))
+
+    try:
+        await asyncio.gather(*(send_bucket(items) for items in buckets.values()))
+        await asyncio.gather(*acks)
+        await flush_acks(force=True)
+    finally:
+        for items in buckets.values():
+            for n in items:
+                notifications_in_flight.discard(n["id"])
+
+async def drain_outbox():
+    global drain_requested
+    while drain_requested:
+        drain_requested = False
+        try:
+            await notify_pending_tickets()
+        except Exception as e:
+            print(f"Notification drain failed: {e}")
+
+def request_drain():
+    """
+    Schedules an outbox drain without blocking the change feed. Requests that arrive
+    while a drain is running are coalesced into one follow-up drain.
+    """
+    global drain_task, drain_requested
+    drain_requested = True
+    if drain_task is None or drain_task.done():
+        drain_task = asyncio.create_task(drain_outbox())
+
+async def stream_changes(session):
+    """Yields (event, data) pairs from the backend's /changes/stream feed until it closes."""
+    async with session.get(f"{API_URL}/changes/stream") as resp:
+        if resp.status != 200:
+            raise RuntimeError(f"change feed returned {resp.status}")
+        event = None
+        async for raw in resp.content:
+            line = raw.decode("utf-8").rstrip("\r\n")
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event:
+                yield event, json.loads(line[len("data: "):])
+                event = None
+
+async def refresh_it_vocabulary():
+    """Rebuilds the pre-filter vocabulary from the current Knowledge Base."""
+    global it_vocabulary
+    try:
+        status, data = await backend_call("GET", "/knowledge-base/terms")
+        if status == 200:
+            it_vocabulary = BASE_IT_TERMS | kb_vocabulary(data["terms"])
+            print(f"🔤 Pre-filter vocabulary: {len(it_vocabulary)} words")
     except Exception as e:
-        print(f"Polling Error: {e}")
+        print(f"KB vocabulary refresh failed: {e}")
+
+async def refresh_vocabulary_loop():
+    global vocabulary_requested
+    while vocabulary_requested:
+        vocabulary_requested = False
+        await refresh_it_vocabulary()
+
+def request_vocabulary_refresh():
+    """
+    Schedules a vocabulary refresh without blocking the change feed. A burst of KB
+    events (e.g. a bulk import) is coalesced into at most one follow-up refresh.
+    """
+    global vocabulary_task, vocabulary_requested
+    vocabulary_requested = True
+    if vocabulary_task is None or vocabulary_task.done():
+        vocabulary_task = asyncio.create_task(refresh_vocabulary_loop())
+
+@tasks.loop(seconds=CHANGE_FEED_RECONNECT_SECONDS)
+async def watch_ticket_changes():
+    """
+    Follows the backend change feed and notifies users as soon as a ticket is
+    Resolved or Awaiting Info. Each (re)connection starts by draining the outbox; if the
+    stream drops, the loop reconnects after CHANGE_FEED_RECONNECT_SECONDS.
+    """
+    try:
+        async for event, data in stream_changes(bot.backend):
+            # On (re)connect the outbox is drained once; afterwards only when a
+            # ticket is resolved or gets a question. Subscribed first, so nothing is missed.
+            if event in ("hello", "reset") or (event == "change" and data.get("type") in NOTIFY_EVENTS):
+                request_drain()
+            if event in ("hello", "reset") or (event == "change" and data.get("type", "").startswith("kb.")):
+                request_vocabulary_refresh()
+    except Exception as e:
+        print(f"Change feed error: {e}")
+
+@watch_ticket_changes.before_loop
+async def before_watching():
+    await bot.wait_until_ready()
+
+@tasks.loop(seconds=NOTIFY_FALLBACK_SECONDS)
+async def retry_notifications():
+    """
+    Failed notifications stay in the outbox but produce no new change event, so the
+    outbox is also drained every NOTIFY_FALLBACK_SECONDS to retry them.
+    """
+    request_drain()
 
-@check_resolved_tickets.before_loop
-async def before_polling():
+@retry_notifications.before_loop
+async def before_retrying():
     await bot.wait_until_ready()
+    # The change feed drains on connect; the first retry is one interval later.
+    await asyncio.sleep(NOTIFY_FALLBACK_SECONDS)
 
 # 3. Run the bot
 if DISCORD_BOT_TOKEN:
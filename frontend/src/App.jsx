@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { motion, AnimatePresence } from 'framer-motion';
 import { ShieldCheck, Send, Trash2, Zap, Search, Bell, HelpCircle, User } from 'lucide-react';
@@ -7,6 +7,8 @@ import DatabaseViewer from './DatabaseViewer';
 import UserPortal from './UserPortal';
 
 const API_URL = 'http://localhost:8000';
+// The list view only needs ticket summaries; full histories are loaded when a ticket's history is opened.
+const LIST_FIELDS = 'title,query,category,subcategory,ai_draft,admin_draft,status,group_id,users,history_length,revision';
 
 function App() {
   const [tickets, setTickets] = useState([]);
@@ -105,21 +107,80 @@ function App() {
 
   useEffect(() => {
     if (viewMode === 'admin') {
-      fetchTickets();
-      const interval = setInterval(fetchTickets, 5000);
-      return () => clearInterval(interval);
+      syncTickets();
+      // Follow the backend change feed instead of re-downloading every ticket on a timer.
+      // EventSource reconnects on its own and resumes from the last event id it saw.
+      const source = new EventSource(`${API_URL}/changes/stream`);
+      source.addEventListener('change', (e) => applyTicketChange(JSON.parse(e.data)));
+      source.addEventListener('reset', syncTickets);
+      return () => source.close();
     }
   }, [viewMode]);
 
+  // Highest ticket revision merged into `tickets` so far; null until the first full load.
+  const revisionRef = useRef(null);
+
+  // Merges changed tickets (newer revisions win) and drops deleted ones.
+  const mergeTickets = (changed, deletedIds = []) => {
+    changed.forEach(t => { revisionRef.current = Math.max(revisionRef.current || 0, t.revision || 0); });
+    setTickets(prev => {
+      const byId = new Map(changed.map(t => [t.id, t]));
+      const merged = prev
+        .filter(t => !deletedIds.includes(t.id))
+        .map(t => {
+          const next = byId.get(t.id);
+          byId.delete(t.id);
+          return next && (next.revision || 0) >= (t.revision || 0) ? next : t;
+        });
+      return [...merged, ...byId.values()];
+    });
+  };
+
+  const applyTicketChange = (event) => {
+    if (event.type === 'ticket.deleted') {
+      mergeTickets([], [event.ticket_id]);
+    } else if (event.type === 'tickets.resolved' || event.type === 'tickets.reloaded') {
+      syncTickets(); // Bulk events carry no tickets; fetch the changes as one delta (or reload)
+    } else if (event.ticket) {
+      mergeTickets([event.ticket]);
+    }
+  };
+
   const fetchTickets = async () => {
     try {
-      const response = await axios.get(`${API_URL}/tickets`);
+      const response = await axios.get(`${API_URL}/tickets`, { params: { fields: LIST_FIELDS } });
+      revisionRef.current = Number(response.headers['x-revision'] || 0);
       setTickets(response.data);
     } catch (error) {
       console.error("Fetch error:", error);
     }
   };
 
+  // Fetches only what changed since the last load; falls back to a full load when told to.
+  const syncTickets = async () => {
+    if (revisionRef.current === null) return fetchTickets();
+    try {
+      const response = await axios.get(`${API_URL}/tickets`, {
+        params: { since: revisionRef.current, fields: LIST_FIELDS }
+      });
+      if (response.data.reset) return fetchTickets();
+      mergeTickets(response.data.tickets, response.data.deleted);
+      revisionRef.current = Math.max(revisionRef.current, response.data.revision);
+    } catch (error) {
+      console.error("Sync error:", error);
+    }
+  };
+
+  const openHistory = async (ticket) => {
+    try {
+      const response = await axios.get(`${API_URL}/tickets/${ticket.id}`);
+      setShowHistoryModal(response.data);
+    } catch (error) {
+      console.error("History fetch error:", error);
+      setShowHistoryModal(ticket);
+    }
+  };
+
   const approveResolution = async (ticketId) => {
     const finalAnswer = document.getElementById(`draft-${ticketId}`)?.value;
     if (!finalAnswer) {
@@ -135,7 +196,7 @@ function App() {
         try {
           await axios.post(`${API_URL}/broadcast`, { ticket_id: ticketId, final_answer: finalAnswer });
           showNotification("Solution broadcasted successfully!");
-          fetchTickets();
+          syncTickets();
           setConfirmPopup(null);
         } catch (err) {
           showNotification("Broadcast failed", "error");
@@ -157,7 +218,7 @@ function App() {
 
     try {
       await axios.delete(`${API_URL}/tickets/${confirmDelete.ticketId}`);
-      await fetchTickets();
+      await syncTickets();
       showNotification("Ticket deleted successfully");
       setConfirmDelete(null);
     } catch (err) {
@@ -209,7 +270,7 @@ function App() {
       setBroadcastAllText('');
       setIsConfirmingBroadcastAll(false);
       setSelectedTicketIds([]); // Clear selection after success
-      fetchTickets();
+      syncTickets();
     } catch (err) {
       console.error('Broadcast all error:', err);
       showNotification('Failed to broadcast solution', 'error');
@@ -223,7 +284,7 @@ function App() {
       showNotification("Question sent to user");
       setShowAskModal(null);
       setAskQuestionText('');
-      fetchTickets();
+      syncTickets();
     } catch (err) {
       showNotification("Failed to send question", "error");
     }
@@ -261,7 +322,7 @@ function App() {
               <button className="refresh-btn" onClick={() => setShowDatabase(true)}>
                 <span>🗄️</span> Database
               </button>
-              <button className="refresh-btn" onClick={fetchTickets}>
+              <button className="refresh-btn" onClick={syncTickets}>
                 <span>🔄</span> Refresh
               </button>
             </div>
@@ -452,10 +513,10 @@ function App() {
                             className="btn-show-history"
                             onClick={(e) => {
                               e.stopPropagation();
-                              setShowHistoryModal(ticket);
+                              openHistory(ticket);
                             }}
                           >
-                            📜 Show Chat History ({ticket.history ? ticket.history.length : 0} msgs)
+                            📜 Show Chat History ({ticket.history ? ticket.history.length : (ticket.history_length || 0)} msgs)
                           </button>
                         </div>
 
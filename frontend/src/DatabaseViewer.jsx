@@ -32,8 +32,13 @@ function DatabaseViewer({ onClose }) {
 
     useEffect(() => {
         fetchData();
-        const interval = setInterval(fetchData, 5000);
-        return () => clearInterval(interval);
+        // Refresh only when the backend reports a knowledge base change
+        const source = new EventSource(`${API_URL}/changes/stream`);
+        source.addEventListener('change', (e) => {
+            if (JSON.parse(e.data).type.startsWith('kb.')) fetchData();
+        });
+        source.addEventListener('reset', fetchData);
+        return () => source.close();
     }, []);
 
     const resetForm = () => {
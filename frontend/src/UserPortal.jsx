@@ -2,6 +2,40 @@ import { useState, useRef, useEffect } from 'react';
 import axios from 'axios';
 import { Send, ArrowLeft, LifeBuoy, MessageSquare, AlertTriangle } from 'lucide-react';
 
+// Reads the Server-Sent Events stream from /chat/analyze/stream.
+// Calls onDelta with each piece of the answer and resolves with the "final" event payload.
+const streamChat = async (payload, onDelta) => {
+    const res = await fetch('http://localhost:8000/chat/analyze/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload)
+    });
+    if (!res.ok || !res.body) throw new Error(`Chat stream failed: ${res.status}`);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let final = null;
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+            const event = raw.match(/^event: (.*)$/m)?.[1];
+            const data = raw.match(/^data: (.*)$/m)?.[1];
+            if (!event || !data) continue;
+            const parsed = JSON.parse(data);
+            if (event === 'delta') onDelta(parsed.text);
+            else if (event === 'final') final = parsed;
+        }
+    }
+    if (!final) throw new Error('Chat stream ended early');
+    return final;
+};
+
 function UserPortal({ onBack }) {
     const [input, setInput] = useState('');
     const [messages, setMessages] = useState([
@@ -50,23 +84,27 @@ function UserPortal({ onBack }) {
         setLoading(true);
 
         try {
-            // 1. Send to Chat Analysis
-            const res = await axios.post('http://localhost:8000/chat/analyze', {
+            // 1. Stream the Chat Analysis into a placeholder AI message
+            setMessages([...newMessages, { role: 'ai', content: '' }]);
+            const result = await streamChat({
                 message: userMsg,
                 history: newMessages.map(m => ({ role: m.role === 'ai' ? 'model' : 'user', content: m.content }))
-            });
+            }, (text) => setMessages(prev => {
+                const last = prev[prev.length - 1];
+                return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+            }));
 
-            const aiMsg = { role: 'ai', content: res.data.response };
+            const aiMsg = { role: 'ai', content: result.response };
             const updatedMessages = [...newMessages, aiMsg];
             setMessages(updatedMessages);
 
             // 2. Check for Escalation
-            if (res.data.escalation_required) {
-                await createTicket(updatedMessages, res.data.summary);
+            if (result.escalation_required) {
+                await createTicket(updatedMessages, result.summary);
             }
 
         } catch (err) {
-            setMessages(prev => [...prev, { role: 'ai', content: "I'm having trouble connecting. You can try asking again." }]);
+            setMessages([...newMessages, { role: 'ai', content: "I'm having trouble connecting. You can try asking again." }]);
         } finally {
             setLoading(false);
         }
@@ -108,7 +146,7 @@ function UserPortal({ onBack }) {
 
                 {/* Chat Area */}
                 <div className="chat-window" style={{ flex: 1, overflowY: 'auto', padding: '20px', display: 'flex', flexDirection: 'column', gap: '15px' }}>
-                    {messages.map((msg, idx) => (
+                    {messages.filter(msg => msg.content).map((msg, idx) => (
                         <div key={idx} style={{
                             alignSelf: msg.role === 'user' ? 'flex-end' : 'flex-start',
                             maxWidth: '80%',
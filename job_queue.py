@@ -0,0 +1,167 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+class JobQueue:
+    """Persistent, retryable background jobs processed by asyncio worker tasks.
+
+    Jobs live in a small SQLite file, so work accepted before a crash or restart is
+    picked up again (jobs left "running" are re-queued on open). Every job has an
+    idempotency key: enqueueing a key that already exists returns the existing job
+    instead of adding a second one, except that a "failed" job is queued again.
+    A failing handler is retried up to `max_attempts` times with exponential backoff
+    (`retry_delay`, doubled per attempt) before the job is marked "failed".
+    """
+
+    def __init__(self, path: Path, handler: Callable[[dict], Awaitable[None]], workers: int = 2,
+                 max_attempts: int = 5, retry_delay: float = 5.0):
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                run_after REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, run_after)")
+        requeued = self._db.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'").rowcount
+        if requeued:
+            print(f"DEBUG: 🔁 Re-queued {requeued} interrupted background jobs")
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    # --- Producer side ---
+    def enqueue(self, key: str, payload: dict) -> dict:
+        """Adds a job unless `key` is already known; returns the job either way."""
+        now = time.time()
+        with self._lock:
+            existing = self._get(key)
+            if existing is None:
+                self._db.execute(
+                    "INSERT INTO jobs (key, payload, status, run_after, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                    (key, json.dumps(payload), now, now, now))
+            elif existing["status"] == "failed":
+                self._db.execute(
+                    "UPDATE jobs SET payload = ?, status = 'queued', attempts = 0, last_error = NULL, run_after = ?, updated_at = ? WHERE key = ?",
+                    (json.dumps(payload), now, now, key))
+            else:
+                return existing
+            job = self._get(key)
+        self._wake()
+        return job
+
+    def _get(self, key: str) -> Optional[dict]:
+        row = self._db.execute("SELECT * FROM jobs WHERE key = ?", (key,)).fetchone()
+        return self._row(row) if row else None
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            return self._get(key)
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[dict]:
+        with self._lock:
+            if status:
+                rows = self._db.execute("SELECT * FROM jobs WHERE status = ? ORDER BY updated_at DESC LIMIT ?", (status, limit))
+            else:
+                rows = self._db.execute("SELECT * FROM jobs ORDER BY updated_at DESC LIMIT ?", (limit,))
+            return [self._row(r) for r in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict.fromkeys(JOB_STATUSES, 0)
+            counts.update(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            return counts
+
+    # --- Workers ---
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _claim(self) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND run_after <= ? ORDER BY run_after LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE key = ?",
+                             (now, row["key"]))
+            return self._get(row["key"])
+
+    def _next_due(self) -> Optional[float]:
+        with self._lock:
+            row = self._db.execute("SELECT MIN(run_after) FROM jobs WHERE status = 'queued'").fetchone()
+            return row[0] if row else None
+
+    def _finish(self, job: dict, error: Optional[str]) -> None:
+        now = time.time()
+        with self._lock:
+            if error is None:
+                self._db.execute("UPDATE jobs SET status = 'done', last_error = NULL, updated_at = ? WHERE key = ?", (now, job["key"]))
+            elif job["attempts"] >= self.max_attempts:
+                self._db.execute("UPDATE jobs SET status = 'failed', last_error = ?, updated_at = ? WHERE key = ?",
+                                 (error, now, job["key"]))
+            else:
+                delay = self.retry_delay * (2 ** (job["attempts"] - 1))
+                self._db.execute("UPDATE jobs SET status = 'queued', last_error = ?, run_after = ?, updated_at = ? WHERE key = ?",
+                                 (error, now + delay, now, job["key"]))
+
+    async def _work(self) -> None:
+        while True:
+            # Cleared before looking, so an enqueue that races with the lookup still wakes us.
+            self._wakeup.clear()
+            job = self._claim()
+            if job is None:
+                due = self._next_due()
+                timeout = max(0.0, due - time.time()) if due is not None else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.handler(job["payload"])
+                self._finish(job, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"DEBUG: ❌ Background job {job['key']} failed (attempt {job['attempts']}): {e}")
+                self._finish(job, str(e) or type(e).__name__)
+
+    def start(self) -> None:
+        """Starts the worker tasks on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # A job interrupted mid-run is re-queued the next time the queue is opened.
+        self._db.close()
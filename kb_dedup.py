@@ -0,0 +1,173 @@
+import hashlib
+import struct
+import threading
+import zlib
+from bisect import bisect_left, bisect_right
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Fields compared when deciding whether a new question is already in the KB.
+DEDUP_FIELDS = ("Question", "Issue")
+
+_PRIME = (1 << 31) - 1
+
+
+def _shingles(text: str, size: int = 3) -> Set[str]:
+    padded = f" {text} "
+    return {padded[i:i + size] for i in range(max(1, len(padded) - size + 1))}
+
+
+class KBDuplicateIndex:
+    """MinHash/LSH index over KB Question and Issue texts for near-duplicate detection.
+
+    Each text is reduced to a MinHash signature of its character trigrams and bucketed
+    by `bands` bands of `rows` hashes each. A lookup only runs the exact
+    SequenceMatcher check against texts that share a bucket, so its cost does not grow
+    with the KB size. With the defaults (20 bands x 3 rows) texts with trigram Jaccard
+    similarity above ~0.5 are found with >90% probability, which covers pairs over the
+    0.85 SequenceMatcher threshold.
+
+    Plugs into KBIndex both as a listener and as a snapshot section builder: the
+    buckets of all compiled rows are stored in the KB snapshot as a sorted hash array,
+    and only texts written since the last compile are bucketed in memory.
+    """
+
+    def __init__(self, threshold: float = 0.85, bands: int = 20, rows: int = 3, seed: int = 1):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=bands * rows, dtype=np.int64)
+        self._b = rng.integers(0, _PRIME, size=bands * rows, dtype=np.int64)
+        self._params = struct.pack("<3q", bands, rows, seed)
+        self._lock = threading.RLock()
+        self.index = None
+        self._texts: Dict[Tuple[str, str], str] = {}
+        self._keys: Dict[Tuple[str, str], List[tuple]] = {}
+        self._buckets: Dict[tuple, Set[Tuple[str, str]]] = {}
+
+    def _band_keys(self, text: str) -> List[tuple]:
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in _shingles(text)), dtype=np.int64)
+        signature = ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+        return [(band,) + tuple(signature[band * self.rows:(band + 1) * self.rows].tolist())
+                for band in range(self.bands)]
+
+    @staticmethod
+    def _bucket_hash(band_key: tuple) -> int:
+        packed = struct.pack(f"<{len(band_key)}q", *band_key)
+        return int.from_bytes(hashlib.blake2b(packed, digest_size=8).digest(), "little")
+
+    # --- KB snapshot sections ---
+    def _row_buckets(self, row: dict) -> List[int]:
+        """Bucket hashes of one row, `bands` per DEDUP_FIELDS entry (0 for an empty field)."""
+        out = []
+        for field in DEDUP_FIELDS:
+            text = row.get(field) or ""
+            out += [self._bucket_hash(key) for key in self._band_keys(text.lower())] if text else [0] * self.bands
+        return out
+
+    def snapshot_sections(self, rows: List[dict], previous=None, reuse: List[int] = ()) -> Dict[str, bytes]:
+        """`dedup.rows` holds each row's bucket hashes, so a row with `reuse[i]` >= 0 copies
+        them from that row of `previous` instead of re-hashing; `dedup.buckets` and
+        `dedup.entries` are the same pairs sorted by hash for lookups."""
+        width = len(DEDUP_FIELDS) * self.bands
+        table = np.zeros((len(rows), width), dtype=np.uint64)
+        fresh = range(len(rows))
+        if previous is not None and self.snapshot_valid(previous) and len(rows):
+            old = np.frombuffer(previous.section("dedup.rows"), dtype=np.uint64).reshape(-1, width)
+            reuse = np.asarray(reuse, dtype=np.int64)
+            hit = reuse >= 0
+            table[hit] = old[reuse[hit]]
+            fresh = np.flatnonzero(~hit)
+        for i in fresh:
+            table[i] = self._row_buckets(rows[i])
+        flat = table.reshape(-1)
+        # Entry = row * len(DEDUP_FIELDS) + field index, as in the flattened table.
+        entries = (np.arange(flat.size, dtype=np.uint64) // self.bands).astype(np.uint32)
+        used = flat != 0
+        order = np.argsort(flat[used], kind="stable")
+        return {
+            "dedup.params": self._params,
+            "dedup.rows": table.astype("<u8").tobytes(),
+            "dedup.buckets": flat[used][order].astype("<u8").tobytes(),
+            "dedup.entries": entries[used][order].astype("<u4").tobytes(),
+        }
+
+    def snapshot_valid(self, snapshot) -> bool:
+        params = snapshot.section("dedup.params")
+        return (params is not None and bytes(params) == self._params
+                and snapshot.section("dedup.rows") is not None)
+
+    # --- KBIndex listener ---
+    def _remove(self, entry_id: str) -> None:
+        for field in DEDUP_FIELDS:
+            key = (entry_id, field)
+            self._texts.pop(key, None)
+            for band_key in self._keys.pop(key, ()):
+                bucket = self._buckets.get(band_key)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band_key]
+
+    def on_kb_add(self, row: dict) -> None:
+        with self._lock:
+            self._remove(row["ID"])
+            for field in DEDUP_FIELDS:
+                text = row.get(field) or ""
+                if not text:
+                    continue
+                key = (row["ID"], field)
+                self._texts[key] = text
+                self._keys[key] = self._band_keys(text.lower())
+                for band_key in self._keys[key]:
+                    self._buckets.setdefault(band_key, set()).add(key)
+
+    def on_kb_remove(self, entry_id: str) -> None:
+        with self._lock:
+            self._remove(entry_id)
+
+    def on_kb_rebuild(self, index) -> None:
+        with self._lock:
+            self.index = index
+            self.on_kb_compact(index)
+
+    def on_kb_compact(self, index) -> None:
+        # Rows compiled into the new snapshot are found through its buckets from now on.
+        pending = index.overlay_ids()
+        with self._lock:
+            for entry_id in {entry_id for entry_id, _ in self._texts} - pending:
+                self._remove(entry_id)
+
+    # --- Querying ---
+    def find_duplicate(self, text: str) -> Optional[Tuple[str, float]]:
+        """Returns (existing text, similarity ratio) for the first KB text above the threshold."""
+        text = (text or "").lower()
+        if not text:
+            return None
+        band_keys = self._band_keys(text)
+        candidates = []
+        if self.index is not None:
+            base, masked = self.index.view()
+            buckets = base.section("dedup.buckets").cast("Q")
+            entries = base.section("dedup.entries").cast("I")
+            for band_key in band_keys:
+                h = self._bucket_hash(band_key)
+                for j in range(bisect_left(buckets, h), bisect_right(buckets, h)):
+                    row, f = divmod(entries[j], len(DEDUP_FIELDS))
+                    if row not in masked:
+                        candidates.append((row, f))
+            candidates = [base.value(DEDUP_FIELDS[f], row) for row, f in dict.fromkeys(candidates)]
+        with self._lock:
+            keys = set()
+            for band_key in band_keys:
+                keys |= self._buckets.get(band_key, set())
+            candidates += [self._texts[key] for key in keys]
+        for existing in candidates:
+            ratio = SequenceMatcher(None, text, existing.lower()).ratio()
+            if ratio > self.threshold:
+                return existing, ratio
+        return None
@@ -0,0 +1,404 @@
+import hashlib
+import heapq
+import json
+import math
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from kb_snapshot import KBSnapshot, read_header, write_snapshot
+
+# Fields that are searched and their BM25F weights; Resolution is returned but not matched against.
+FIELD_WEIGHTS = {"Question": 3.0, "Issue": 2.0, "Tags": 1.5, "Category": 1.0}
+SEARCH_FIELDS = tuple(FIELD_WEIGHTS)
+
+TOKEN_RE = re.compile(r"\w+")
+
+STOPWORDS = frozenset("""
+a about after all am an and any are as at be been but by can cannot could did do does doing
+for from get got had has have having he her hi hello his how i if in into is it its just me
+my no not of on or our please she so some than thanks that the their them then there these
+they this to too up us was we were what when where which who why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens with stopwords removed."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS] if text else []
+
+
+class KBIndex:
+    """Knowledge Base search index ranked with BM25F, backed by a memory-mapped snapshot.
+
+    The bulk of the index (rows, posting lists, document lengths) lives in a compiled
+    KBSnapshot at `snapshot_path`, so opening it costs the same for any KB size and
+    all server processes share its pages. Writes made through the API (`add`,
+    `update`, `remove`) go into a small in-memory overlay that hides the snapshot rows
+    it replaces; shortly after a write the snapshot is recompiled from the store in the
+    background and the overlay is emptied. A recompile reuses the previous snapshot's
+    data for rows whose content hash is unchanged, and requests keep being served from
+    the old snapshot plus the overlay until it is done.
+
+    Term frequencies are weighted per field (Question > Issue > Tags > Category)
+    before BM25 saturation and length normalisation are applied. A background thread
+    asks the store every `check_interval` seconds whether it was changed outside this
+    process (a hand-edited CSV, another worker); reads never wait for that check.
+    """
+
+    def __init__(self, store, snapshot_path: Path, fields: List[str], check_interval: float = 1.0,
+                 compact_delay: float = 1.0, k1: float = 1.2, b: float = 0.75,
+                 field_weights: Optional[Dict[str, float]] = None, section_builders=()):
+        self.store = store
+        self.snapshot_path = Path(snapshot_path)
+        self.fields = list(fields)
+        self.check_interval = check_interval
+        self.compact_delay = compact_delay
+        self.k1 = k1
+        self.b = b
+        self.field_weights = field_weights or FIELD_WEIGHTS
+        # Objects with snapshot_sections(rows, previous, reuse) / snapshot_valid(snapshot)
+        # that store their own data in the snapshot (e.g. the duplicate detector's buckets).
+        self.section_builders = list(section_builders)
+        self._params = json.dumps({"fields": self.fields, "weights": self.field_weights}).encode("utf-8")
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        # A snapshot from before the last shutdown is served as is (even if the store has
+        # moved on since) and brought up to date in the background; only a missing or
+        # incompatible one is compiled before starting.
+        snapshot = self._map()
+        self._outdated = snapshot is not None and snapshot.generation != self.store.generation
+        self._reset(snapshot or self._compile())
+        print(f"DEBUG: 📇 KB index mapped with {self._count} entries, {self.base.term_count} terms")
+        if self._outdated:
+            self._wake.set()
+        self._compactor = threading.Thread(target=self._compact_loop, name="kb-compact", daemon=True)
+        self._compactor.start()
+
+    def subscribe(self, listener) -> None:
+        """Registers a secondary index that mirrors this one.
+
+        `listener` implements on_kb_add(row), on_kb_remove(entry_id) and
+        on_kb_rebuild(index); it is synced with the current rows immediately. It may
+        also implement on_kb_add_many(rows), called instead of on_kb_add for a batch,
+        and on_kb_compact(index), called after the overlay was folded into a new
+        snapshot.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            listener.on_kb_rebuild(self)
+
+    # --- Snapshot ---
+    def _usable(self, snapshot: KBSnapshot) -> bool:
+        params = snapshot.section("index.params")
+        return (params is not None and bytes(params) == self._params
+                and all(builder.snapshot_valid(snapshot) for builder in self.section_builders))
+
+    def _map(self) -> Optional[KBSnapshot]:
+        """The snapshot on disk, if there is one compiled with this index's settings."""
+        if read_header(self.snapshot_path) is None:
+            return None
+        snapshot = KBSnapshot(self.snapshot_path, self.fields)
+        return snapshot if self._usable(snapshot) else None
+
+    def _compile(self, previous: Optional[KBSnapshot] = None) -> KBSnapshot:
+        """Compiles the store's rows. Rows whose hash is also in `previous` reuse its term
+        counts (and builders reuse their sections), so only changed rows are re-indexed."""
+        started = time.perf_counter()
+        generation, rows = self.store.dump()
+        hashes = [self._row_hash(row) for row in rows]
+        if previous is not None and not self._usable(previous):
+            previous = None
+        reuse = [-1] * len(rows)
+        if previous is not None:
+            old_rows = {h: i for i, h in enumerate(previous.row_hashes())}
+            reuse = [old_rows.get(h, -1) for h in hashes]
+            old_terms = list(previous.terms())
+        counts = [self._term_counts(row) if i < 0 else previous.term_counts(i, old_terms)
+                  for row, i in zip(rows, reuse)]
+        fingerprint = 0
+        for h in hashes:
+            fingerprint ^= h
+        extra = {"index.params": self._params}
+        for builder in self.section_builders:
+            extra.update(builder.snapshot_sections(rows, previous, reuse))
+        snapshot = write_snapshot(self.snapshot_path, self.fields, rows, counts, hashes, generation,
+                                  f"{fingerprint:016x}", extra)
+        print(f"DEBUG: 🗜️ Compiled KB snapshot ({len(rows)} entries, {reuse.count(-1)} re-indexed) "
+              f"in {time.perf_counter() - started:.3f}s")
+        return snapshot
+
+    def _open_current(self) -> KBSnapshot:
+        """A snapshot of the store's current rows: the one on disk if another process
+        already compiled it, else a new compile reusing what it can."""
+        snapshot = self._map()
+        if snapshot is not None and snapshot.generation == self.store.generation:
+            return snapshot
+        return self._compile(snapshot if snapshot is not None else self.base)
+
+    def _reset(self, snapshot: KBSnapshot) -> None:
+        self.base = snapshot
+        self._fingerprint = int(snapshot.version, 16)
+        self._total_len = snapshot.total_len
+        self._count = snapshot.rows
+        # Overlay: entry id -> row (None once deleted) and the write number that set it.
+        self._overlay: Dict[str, Optional[dict]] = {}
+        self._overlay_mod: Dict[str, int] = {}
+        self._masked: Set[int] = set()
+        self._order: Dict[str, int] = {}
+        self._next_order = snapshot.rows
+        self._mods = 0
+        self.postings: Dict[str, Dict[str, float]] = {}
+        self._doc_tokens: Dict[str, Dict[str, float]] = {}
+        self._doc_len: Dict[str, float] = {}
+
+    def _sync(self, reload: bool) -> None:
+        """Maps a snapshot of the store's current rows, keeping overlay writes made meanwhile.
+
+        `reload` means the store was changed outside the API, so listeners are told to
+        resync (on_kb_rebuild); otherwise the overlay was just folded in (on_kb_compact).
+        """
+        with self._lock:
+            if not reload and not self._overlay:
+                return
+            folded = self._mods
+        # Every overlay write numbered <= `folded` was committed to the store first,
+        # so the store's rows from here on include it.
+        snapshot = self._open_current()
+        with self._lock:
+            if snapshot.generation == self.base.generation:
+                return
+            keep = [(entry_id, self._overlay[entry_id], mod)
+                    for entry_id, mod in self._overlay_mod.items() if mod > folded]
+            self._reset(snapshot)
+            for entry_id, row, mod in keep:
+                if row is None:
+                    self._drop(entry_id)
+                else:
+                    self._put(row)
+                self._overlay_mod[entry_id] = mod
+            self._mods = max([folded] + [mod for _, _, mod in keep])
+            if reload:
+                print(f"DEBUG: 📇 KB index remapped with {self._count} entries")
+            for listener in self._listeners:
+                if reload:
+                    listener.on_kb_rebuild(self)
+                elif hasattr(listener, "on_kb_compact"):
+                    listener.on_kb_compact(self)
+
+    def _compact_loop(self) -> None:
+        """Compiles API writes into the snapshot `compact_delay` seconds after the first
+        one wakes it (later writes in that window are batched), and every
+        `check_interval` seconds asks the store about outside changes (a hand-edited
+        CSV, another worker), which are compiled in and announced as a rebuild."""
+        last_check = time.monotonic()
+        while not self._closed.is_set():
+            woken = self._wake.wait(max(0.0, last_check + self.check_interval - time.monotonic()))
+            if woken:
+                self._wake.clear()
+                if self._closed.wait(self.compact_delay):
+                    break
+            # A snapshot mapped at startup that predates the store counts as an outside change.
+            reload, self._outdated = self._outdated, False
+            try:
+                if time.monotonic() - last_check >= self.check_interval:
+                    last_check = time.monotonic()
+                    if self.store.refresh():
+                        reload = True
+                        print("DEBUG: 🔄 Knowledge Base changed outside the API, recompiling snapshot")
+                self._sync(reload)
+            except Exception as e:
+                # Retried on the next check (an outside change would otherwise be forgotten).
+                self._outdated = reload
+                print(f"DEBUG: ❌ KB snapshot compile failed: {e}")
+
+    def close(self) -> None:
+        self._closed.set()
+        self._wake.set()
+        self._compactor.join(timeout=5)
+
+    def snapshot_json(self) -> Optional[memoryview]:
+        """The whole KB as JSON straight from the mapping, or None while writes are not yet compiled in."""
+        with self._lock:
+            return None if self._overlay else self.base.json()
+
+    @property
+    def version(self) -> str:
+        """Content hash of all rows; changes whenever any entry is added, edited or removed."""
+        return f"{self._fingerprint:016x}"
+
+    @staticmethod
+    def _row_hash(row: dict) -> int:
+        digest = hashlib.blake2b(json.dumps(row, sort_keys=True).encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    # --- Incremental maintenance ---
+    def _term_counts(self, row: dict) -> Dict[str, float]:
+        """Field-weighted term frequencies for one row."""
+        counts: Dict[str, float] = {}
+        for field, weight in self.field_weights.items():
+            for token in tokenize(row.get(field, "")):
+                counts[token] = counts.get(token, 0.0) + weight
+        return counts
+
+    def _hide_base(self, entry_id: str) -> bool:
+        """Masks the snapshot row for `entry_id`; False if there is no visible one."""
+        i = self.base.find(entry_id)
+        if i < 0 or i in self._masked:
+            return False
+        self._masked.add(i)
+        self._fingerprint ^= self.base.row_hash(i)
+        self._total_len -= self.base.doc_len(i)
+        self._count -= 1
+        self._order.setdefault(entry_id, i)
+        return True
+
+    def _unindex(self, entry_id: str) -> None:
+        self._total_len -= self._doc_len.pop(entry_id, 0.0)
+        for token in self._doc_tokens.pop(entry_id, {}):
+            docs = self.postings.get(token)
+            if docs is not None:
+                docs.pop(entry_id, None)
+                if not docs:
+                    del self.postings[token]
+
+    def _put(self, row: dict) -> None:
+        entry_id = row["ID"]
+        previous = self._overlay.get(entry_id)
+        if previous is not None:
+            self._fingerprint ^= self._row_hash(previous)
+            self._unindex(entry_id)
+            self._count -= 1
+        elif entry_id not in self._overlay:
+            self._hide_base(entry_id)
+        if entry_id not in self._order:
+            self._order[entry_id] = self._next_order
+            self._next_order += 1
+        self._mods += 1
+        self._overlay[entry_id] = row
+        self._overlay_mod[entry_id] = self._mods
+        self._fingerprint ^= self._row_hash(row)
+        counts = self._term_counts(row)
+        self._doc_tokens[entry_id] = counts
+        self._doc_len[entry_id] = sum(counts.values())
+        self._total_len += self._doc_len[entry_id]
+        self._count += 1
+        for token, tf in counts.items():
+            self.postings.setdefault(token, {})[entry_id] = tf
+
+    def _drop(self, entry_id: str) -> bool:
+        previous = self._overlay.get(entry_id)
+        if previous is not None:
+            self._fingerprint ^= self._row_hash(previous)
+            self._unindex(entry_id)
+            self._count -= 1
+        elif entry_id in self._overlay or not self._hide_base(entry_id):
+            return False
+        self._mods += 1
+        self._overlay[entry_id] = None
+        self._overlay_mod[entry_id] = self._mods
+        return True
+
+    def add(self, row: dict) -> None:
+        self.add_many([row])
+
+    def add_many(self, rows: List[dict]) -> None:
+        """Adds or replaces rows; listeners with on_kb_add_many(rows) hear about them in one call."""
+        if not rows:
+            return
+        with self._lock:
+            for row in rows:
+                self._put(row)
+            for listener in self._listeners:
+                if len(rows) > 1 and hasattr(listener, "on_kb_add_many"):
+                    listener.on_kb_add_many(rows)
+                else:
+                    for row in rows:
+                        listener.on_kb_add(row)
+        self._wake.set()
+
+    def update(self, row: dict) -> None:
+        self.add(row)
+
+    def remove(self, entry_id: str) -> bool:
+        with self._lock:
+            if not self._drop(entry_id):
+                return False
+            for listener in self._listeners:
+                listener.on_kb_remove(entry_id)
+        self._wake.set()
+        return True
+
+    # --- Querying ---
+    def view(self) -> Tuple[KBSnapshot, frozenset]:
+        """The current snapshot and the row numbers in it hidden by later writes."""
+        with self._lock:
+            return self.base, frozenset(self._masked)
+
+    def overlay_ids(self) -> Set[str]:
+        """IDs written since the snapshot was compiled (including deletions)."""
+        with self._lock:
+            return set(self._overlay)
+
+    def doc_freq(self, token: str) -> int:
+        rows, _ = self.base.postings(token)
+        return sum(1 for i in rows if i not in self._masked) + len(self.postings.get(token, ()))
+
+    def idf(self, token: str) -> float:
+        n, df = self._count, self.doc_freq(token)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[float, dict]]:
+        """Returns up to `k` (BM25F score, row) pairs for the best matching rows."""
+        with self._lock:
+            if not self._count:
+                return []
+            base, masked = self.base, self._masked
+            avg_len = self._total_len / self._count or 1.0
+            # Keys are snapshot row numbers (int) or overlay entry ids (str).
+            scores: Dict[object, float] = {}
+            for token in set(tokenize(query)):
+                rows, tfs = base.postings(token)
+                matches = [(i, tf, base.doc_len(i)) for i, tf in zip(rows, tfs) if i not in masked]
+                matches += [(entry_id, tf, self._doc_len[entry_id])
+                            for entry_id, tf in self.postings.get(token, {}).items()]
+                if not matches:
+                    continue
+                idf = math.log(1 + (self._count - len(matches) + 0.5) / (len(matches) + 0.5))
+                for key, tf, doc_len in matches:
+                    norm = self.k1 * (1 - self.b + self.b * doc_len / avg_len)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            # Ties keep KB order.
+            order = lambda key: key if isinstance(key, int) else self._order[key]
+            top = heapq.nsmallest(k, scores.items(), key=lambda item: (-item[1], order(item[0])))
+            return [(score, base.row(key) if isinstance(key, int) else self._overlay[key]) for key, score in top]
+
+    def get(self, entry_id: str) -> Optional[dict]:
+        with self._lock:
+            if entry_id in self._overlay:
+                return self._overlay[entry_id]
+            i = self.base.find(entry_id)
+            return self.base.row(i) if i >= 0 else None
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        """(entry id, row) for every entry; materialises rows from the snapshot one at a time."""
+        with self._lock:
+            base, masked, overlay = self.base, set(self._masked), dict(self._overlay)
+        for i in range(base.rows):
+            if i not in masked:
+                yield base.value("ID", i), base.row(i)
+        for entry_id, row in overlay.items():
+            if row is not None:
+                yield entry_id, row
+
+    def terms(self) -> List[str]:
+        """Sorted vocabulary of the searchable fields. Terms only used by rows deleted
+        since the last compile linger until the next one."""
+        with self._lock:
+            return sorted(set(self.base.terms()) | set(self.postings))
+
+    def __len__(self) -> int:
+        return self._count
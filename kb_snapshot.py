@@ -0,0 +1,224 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# File layout (little-endian, every section 8-byte aligned; arrays are read with native
+# memoryview casts, so readers assume a little-endian host):
+#   header    MAGIC, row count, term count, section count, store generation,
+#             total document length, KB version (16 ASCII hex chars)
+#   sections  (name, offset, length) entries, one per section
+# A string column is a uint32[n + 1] offset array plus a UTF-8 blob; string i is
+# blob[offsets[i]:offsets[i + 1]]. "json" is the whole KB as one JSON array, ready to
+# serve. The token index is the sorted terms (a string column) with, per term, a range
+# of posting_rows/posting_tfs given by posting_offsets, plus the same data per row
+# (row_term_offsets into row_terms/row_tfs, as term numbers) so the next compile can
+# reuse an unchanged row's counts. Other modules may add their own sections (see
+# `extra`), e.g. the duplicate detector's LSH buckets.
+MAGIC = b"LBKBSNP3"
+HEADER = struct.Struct("<8sIIIQd16s")
+SECTION = struct.Struct("<32sQQ")
+
+
+class SnapshotHeader(NamedTuple):
+    rows: int
+    terms: int
+    generation: int
+    total_len: float
+    version: str
+
+
+def _strings(values: List[str]) -> Tuple[bytes, bytes]:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets, pos = [0], 0
+    for item in encoded:
+        pos += len(item)
+        offsets.append(pos)
+    return struct.pack(f"<{len(offsets)}I", *offsets), b"".join(encoded)
+
+
+def write_snapshot(path: Path, fields: List[str], rows: List[dict], counts: List[Dict[str, float]],
+                   hashes: List[int], generation: int, version: str,
+                   extra: Optional[Dict[str, bytes]] = None) -> "KBSnapshot":
+    """Compiles KB rows into `path` and returns it mapped.
+
+    `counts[i]` are row i's field-weighted term frequencies and `hashes[i]` its
+    fingerprint (both as computed by KBIndex); `extra` holds additional named sections.
+    The file is mapped before it replaces `path`, so the result is this compile even if
+    another process replaces the file right after.
+    """
+    path = Path(path)
+    sections: Dict[str, bytes] = {}
+    for field in fields:
+        sections[f"{field}.offsets"], sections[f"{field}.blob"] = _strings([row.get(field) or "" for row in rows])
+    ids = [row["ID"] for row in rows]
+    sections["id_order"] = struct.pack(f"<{len(rows)}I", *sorted(range(len(rows)), key=ids.__getitem__))
+    sections["json"] = json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    postings: Dict[str, List[Tuple[int, float]]] = {}
+    for i, row_counts in enumerate(counts):
+        for term, tf in row_counts.items():
+            postings.setdefault(term, []).append((i, tf))
+    terms = sorted(postings)
+    sections["term_offsets"], sections["terms"] = _strings(terms)
+    posting_offsets, posting_rows, posting_tfs = [0], [], []
+    for term in terms:
+        posting_rows += [i for i, _ in postings[term]]
+        posting_tfs += [tf for _, tf in postings[term]]
+        posting_offsets.append(len(posting_rows))
+    sections["posting_offsets"] = struct.pack(f"<{len(posting_offsets)}I", *posting_offsets)
+    sections["posting_rows"] = struct.pack(f"<{len(posting_rows)}I", *posting_rows)
+    sections["posting_tfs"] = struct.pack(f"<{len(posting_tfs)}f", *posting_tfs)
+    term_no = {term: n for n, term in enumerate(terms)}
+    row_offsets, row_terms, row_tfs = [0], [], []
+    for row_counts in counts:
+        row_terms += [term_no[term] for term in row_counts]
+        row_tfs += row_counts.values()
+        row_offsets.append(len(row_terms))
+    sections["row_term_offsets"] = struct.pack(f"<{len(row_offsets)}I", *row_offsets)
+    sections["row_terms"] = struct.pack(f"<{len(row_terms)}I", *row_terms)
+    sections["row_tfs"] = struct.pack(f"<{len(row_tfs)}f", *row_tfs)
+    doc_len = [sum(row_counts.values()) for row_counts in counts]
+    sections["doc_len"] = struct.pack(f"<{len(rows)}f", *doc_len)
+    sections["row_hash"] = struct.pack(f"<{len(rows)}Q", *hashes)
+    sections.update(extra or {})
+
+    pos = HEADER.size + SECTION.size * len(sections)
+    table, chunks = [], []
+    for name, data in sections.items():
+        pad = -pos % 8
+        chunks += [b"\0" * pad, data]
+        pos += pad
+        table.append(SECTION.pack(name.encode("ascii"), pos, len(data)))
+        pos += len(data)
+
+    # Unique per process and thread, since every server worker may compile its own copy.
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(rows), len(terms), len(sections), generation, float(sum(doc_len)),
+                            version.encode("ascii")))
+        f.write(b"".join(table))
+        f.write(b"".join(chunks))
+    snapshot = KBSnapshot(tmp, fields)
+    tmp.replace(path)
+    return snapshot
+
+
+def read_header(path: Path) -> Optional[SnapshotHeader]:
+    """The header of the snapshot at `path`, or None if there is no valid file."""
+    try:
+        with open(path, "rb") as f:
+            magic, rows, terms, _, generation, total_len, version = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC:
+        return None
+    return SnapshotHeader(rows, terms, generation, total_len, version.decode("ascii"))
+
+
+class KBSnapshot:
+    """Read-only view of one compiled snapshot file.
+
+    Nothing is parsed up front: columns, the JSON body and the token index are sliced
+    out of the memory mapping when asked for, so opening costs the same for any KB
+    size and every process mapping the file shares its pages.
+    """
+
+    def __init__(self, path: Path, fields: List[str]):
+        self.fields = list(fields)
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.rows, self.term_count, count, self.generation, self.total_len, version = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("not a KB snapshot")
+        self.version = version.decode("ascii")
+        self._view = memoryview(self._map)
+        self._sections = {}
+        for i in range(count):
+            name, offset, length = SECTION.unpack_from(self._map, HEADER.size + i * SECTION.size)
+            self._sections[name.rstrip(b"\0").decode("ascii")] = (offset, length)
+        self._id_order = self._array("id_order", "I")
+        self._term_offsets, self._terms = self._array("term_offsets", "I"), self.section("terms")
+        self._posting_offsets = self._array("posting_offsets", "I")
+        self._posting_rows = self._array("posting_rows", "I")
+        self._posting_tfs = self._array("posting_tfs", "f")
+        self._doc_len = self._array("doc_len", "f")
+        self._row_hash = self._array("row_hash", "Q")
+        self._row_term_offsets = self._array("row_term_offsets", "I")
+        self._row_terms = self._array("row_terms", "I")
+        self._row_tfs = self._array("row_tfs", "f")
+
+    def section(self, name: str) -> Optional[memoryview]:
+        if name not in self._sections:
+            return None
+        offset, length = self._sections[name]
+        return self._view[offset:offset + length]
+
+    def _array(self, name: str, fmt: str) -> memoryview:
+        return self.section(name).cast(fmt)
+
+    # --- Rows ---
+    def json(self) -> memoryview:
+        """The whole KB as a JSON array, straight out of the mapping."""
+        return self.section("json")
+
+    def value(self, field: str, i: int) -> str:
+        offsets = self._array(f"{field}.offsets", "I")
+        return str(self.section(f"{field}.blob")[offsets[i]:offsets[i + 1]], "utf-8")
+
+    def row(self, i: int) -> dict:
+        return {field: self.value(field, i) for field in self.fields}
+
+    def find(self, entry_id: str) -> int:
+        """Row number of `entry_id`, or -1."""
+        order = self._id_order
+        lo, hi = 0, self.rows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.value("ID", order[mid]) < entry_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.rows and self.value("ID", order[lo]) == entry_id:
+            return order[lo]
+        return -1
+
+    def doc_len(self, i: int) -> float:
+        return self._doc_len[i]
+
+    def row_hash(self, i: int) -> int:
+        return self._row_hash[i]
+
+    def row_hashes(self) -> List[int]:
+        return self._row_hash.tolist()
+
+    def term_counts(self, i: int, terms: List[str]) -> Dict[str, float]:
+        """Row i's field-weighted term frequencies; `terms` is `list(self.terms())`."""
+        start, end = self._row_term_offsets[i], self._row_term_offsets[i + 1]
+        return dict(zip([terms[t] for t in self._row_terms[start:end]], self._row_tfs[start:end].tolist()))
+
+    # --- Token index ---
+    def term(self, i: int) -> str:
+        return str(self._terms[self._term_offsets[i]:self._term_offsets[i + 1]], "utf-8")
+
+    def terms(self) -> Iterator[str]:
+        for i in range(self.term_count):
+            yield self.term(i)
+
+    def postings(self, term: str) -> Tuple[memoryview, memoryview]:
+        """(row numbers, field-weighted tfs) of the rows containing `term`."""
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term(mid) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.term_count or self.term(lo) != term:
+            return self._posting_rows[:0], self._posting_tfs[:0]
+        start, end = self._posting_offsets[lo], self._posting_offsets[lo + 1]
+        return self._posting_rows[start:end], self._posting_tfs[start:end]
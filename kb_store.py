@@ -0,0 +1,287 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class KBStore:
+    """Knowledge Base rows in an embedded SQLite table, mirrored to the CSV for editing.
+
+    Each entry is one row keyed by `ID`, so adding, editing or deleting an entry is a
+    single keyed statement in its own transaction and concurrent writers never undo
+    each other's changes. The CSV stays the human-editable format: it is imported when
+    the store is first created and whenever it changes on disk (checked by `refresh`),
+    and it is re-exported in the background `export_delay` seconds after the last API
+    write. Every API write is also logged in `kb_log` until an export has written it
+    out; importing a hand-edited CSV re-applies those logged writes on top of it, so
+    edits made on either side are kept.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS kb (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS kb_log (
+            op INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL,
+            deleted INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path: Path, csv_path: Path, fields: List[str], export_delay: float = 1.0):
+        self.path = Path(path)
+        self.csv_path = Path(csv_path)
+        self.fields = list(fields)
+        self.export_delay = export_delay
+        self._lock = threading.RLock()
+        # Held while the CSV is written or re-imported, so neither sees the other half-done.
+        self._csv_lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._import_if_changed()
+        self._writer = threading.Thread(target=self._export_loop, name="kb-csv-export", daemon=True)
+        self._writer.start()
+        if self._pending():
+            # API writes from before a restart that never reached the CSV.
+            self._wake.set()
+
+    # --- CSV mirror ---
+    def _csv_stat(self) -> Optional[str]:
+        try:
+            st = self.csv_path.stat()
+            return f"{st.st_mtime_ns}:{st.st_size}"
+        except FileNotFoundError:
+            return None
+
+    def _record_stat(self) -> None:
+        stat = self._csv_stat()
+        if stat is not None:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('csv_stat', ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (stat,))
+
+    def _bump_generation(self) -> None:
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('generation', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+    @property
+    def generation(self) -> int:
+        """Counter that moves with every committed change, from any process."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _csv_changed(self) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'csv_stat'").fetchone()
+            stat = self._csv_stat()
+        return stat is not None and stat != (row[0] if row else None)
+
+    def _pending(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM kb_log LIMIT 1").fetchone() is not None
+
+    def _import_if_changed(self) -> bool:
+        with self._csv_lock:
+            # Checked again under the lock: an export may have just replaced the file.
+            if not self._csv_changed():
+                return False
+            self._import()
+        return True
+
+    def import_csv(self) -> int:
+        """Loads the CSV's rows, keeping API writes not yet exported; returns how many rows were read."""
+        with self._csv_lock:
+            return self._import()
+
+    def _import(self) -> int:
+        rows = []
+        with open(self.csv_path, "r", encoding="utf-8") as f:
+            for n, row in enumerate(csv.DictReader(f)):
+                if not row.get("ID"):
+                    row["ID"] = f"row-{n}"
+                rows.append(row)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Latest logged operation per entry: True if it was deleted.
+                logged: Dict[str, bool] = {}
+                for entry_id, deleted in self._conn.execute("SELECT id, deleted FROM kb_log ORDER BY op"):
+                    logged[entry_id] = bool(deleted)
+                kept = {}
+                for entry_id, data in self._conn.execute("SELECT id, data FROM kb ORDER BY seq"):
+                    if logged.get(entry_id) is False:
+                        kept[entry_id] = json.loads(data)
+                merged = []
+                for row in rows:
+                    if row["ID"] not in logged:
+                        merged.append(row)
+                    elif row["ID"] in kept:
+                        merged.append(kept.pop(row["ID"]))
+                merged += kept.values()
+                self._conn.execute("DELETE FROM kb")
+                self._upsert(merged)
+                self._record_stat()
+                self._bump_generation()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        print(f"DEBUG: 📥 Imported {len(rows)} KB entries from {self.csv_path.name}")
+        if logged:
+            print(f"DEBUG: 🔀 Kept {len(logged)} KB changes made through the API since the last export")
+            self._wake.set()
+        return len(rows)
+
+    def export_csv(self) -> None:
+        """Writes every entry to the CSV (via a temp file, so readers never see a partial file)."""
+        with self._csv_lock:
+            with self._lock:
+                last_op = self._conn.execute("SELECT COALESCE(MAX(op), 0) FROM kb_log").fetchone()[0]
+                rows = self.all()
+            tmp = self.csv_path.with_suffix(".tmp")
+            with open(tmp, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=self.fields, extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(rows)
+                f.flush()
+                os.fsync(f.fileno())
+            # Replace, record the new stat and clear the exported log entries as one step,
+            # so `refresh` never mistakes our own file for a hand edit.
+            with self._lock:
+                tmp.replace(self.csv_path)
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._record_stat()
+                    self._conn.execute("DELETE FROM kb_log WHERE op <= ?", (last_op,))
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+
+    def _export_loop(self) -> None:
+        while not self._closed.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed.wait(self.export_delay):
+                break
+            if self._pending():
+                try:
+                    self.export_csv()
+                except Exception as e:
+                    print(f"DEBUG: ❌ KB CSV export failed: {e}")
+
+    def refresh(self) -> bool:
+        """Picks up outside changes (a hand-edited CSV or another process writing the
+        database); returns True if the entries may have changed."""
+        if self._csv_changed() and self._import_if_changed():
+            print("DEBUG: 🔄 KB CSV changed on disk, imported it")
+            return True
+        with self._lock:
+            # data_version only moves when a *different* connection commits.
+            current = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            changed, self._data_version = current != self._data_version, current
+        return changed
+
+    # --- Reads ---
+    def all(self) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM kb ORDER BY seq").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def dump(self) -> Tuple[int, List[dict]]:
+        """(generation, all rows) read as one consistent view."""
+        with self._lock:
+            return self.generation, self.all()
+
+    def get(self, entry_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM kb WHERE id = ?", (entry_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM kb").fetchone()[0]
+
+    # --- Writes ---
+    def _upsert(self, rows: Iterable[dict]) -> None:
+        self._conn.executemany(
+            "INSERT INTO kb (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+            [(row["ID"], json.dumps(row)) for row in rows],
+        )
+
+    def _write(self, apply: Callable[[], Iterable[tuple]]):
+        """Runs `apply` in a transaction; it returns the (id, deleted) pairs to log for the export."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                changes = list(apply())
+                if changes:
+                    self._conn.executemany("INSERT INTO kb_log (id, deleted) VALUES (?, ?)", changes)
+                    self._bump_generation()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if changes:
+            self._wake.set()
+        return changes
+
+    def add(self, row: dict) -> dict:
+        self.add_many([row])
+        return row
+
+    def add_many(self, rows: List[dict]) -> None:
+        """Inserts (or replaces, by ID) all rows in one transaction."""
+        def apply():
+            self._upsert(rows)
+            return [(row["ID"], 0) for row in rows]
+        self._write(apply)
+
+    def update(self, entry_id: str, mutate: Callable[[dict], None]) -> Optional[dict]:
+        """Applies `mutate` to one entry in place; returns the new row, or None if unknown."""
+        updated = []
+
+        def apply():
+            current = self._conn.execute("SELECT data FROM kb WHERE id = ?", (entry_id,)).fetchone()
+            if current is None:
+                return []
+            row = json.loads(current[0])
+            mutate(row)
+            row["ID"] = entry_id
+            self._conn.execute("UPDATE kb SET data = ? WHERE id = ?", (json.dumps(row), entry_id))
+            updated.append(row)
+            return [(entry_id, 0)]
+        self._write(apply)
+        return updated[0] if updated else None
+
+    def delete(self, entry_id: str) -> bool:
+        def apply():
+            if self._conn.execute("DELETE FROM kb WHERE id = ?", (entry_id,)).rowcount:
+                return [(entry_id, 1)]
+            return []
+        return bool(self._write(apply))
+
+    def close(self) -> None:
+        """Stops the exporter after writing any pending changes to the CSV."""
+        self._closed.set()
+        self._wake.set()
+        self._writer.join(timeout=5)
+        if self._pending():
+            self.export_csv()
+        self._conn.close()
@@ -0,0 +1,239 @@
+import json
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from kb_index import tokenize
+
+# Fields that make up the text a KB row is embedded from.
+EMBED_FIELDS = ("Question", "Issue", "Tags", "Category")
+
+
+def row_text(row: dict) -> str:
+    return " ".join(row.get(field, "") or "" for field in EMBED_FIELDS)
+
+
+def _hashed_features(text: str, dim: int) -> Tuple[List[int], List[float]]:
+    """Signed feature hashing of word unigrams and character trigrams."""
+    indices, values = [], []
+    for token in tokenize(text):
+        grams = [(token, 1.0)]
+        padded = f"#{token}#"
+        grams += [(padded[i:i + 3], 0.5) for i in range(len(padded) - 2)]
+        for gram, weight in grams:
+            h = zlib.crc32(gram.encode("utf-8"))
+            indices.append(h % dim)
+            values.append(weight if (h >> 31) & 1 else -weight)
+    return indices, values
+
+
+def embed(texts: Iterable[str], dim: int) -> np.ndarray:
+    """Embeds texts as L2-normalised hashed n-gram vectors (CPU only, no model download)."""
+    texts = list(texts)
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        indices, values = _hashed_features(text, dim)
+        if indices:
+            np.add.at(out[row], indices, values)
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    np.divide(out, norms, out=out, where=norms > 0)
+    return out
+
+
+class KBVectorIndex:
+    """Semantic KB retrieval over a memory-mapped matrix of hashed n-gram vectors.
+
+    The matrix lives in `<path>.npy` (opened with mmap, grown by doubling) and the row
+    ids plus a fingerprint of each row's text live in `<path>.json`. It subscribes to a
+    KBIndex, so rows added, updated or removed through the KB write paths are
+    re-embedded one at a time. The KB version the vectors match is saved with them, so
+    a rebuild of unchanged content reads no rows; otherwise only rows whose text
+    changed are re-embedded.
+
+    `<path>.json` is rewritten by a background thread `save_delay` seconds after the
+    last change (and on `close`), not on every change. Until then `<path>.dirty`
+    exists; finding it at startup means the two files may disagree, so everything is
+    re-embedded.
+    """
+
+    def __init__(self, path: Path, dim: int = 512, save_delay: float = 1.0):
+        self.matrix_path = Path(path).with_suffix(".npy")
+        self.meta_path = Path(path).with_suffix(".json")
+        self.dirty_path = Path(path).with_suffix(".dirty")
+        self.dim = dim
+        self.save_delay = save_delay
+        self._lock = threading.RLock()
+        self.ids: List[str] = []
+        self.fingerprints: List[int] = []
+        self._matrix: Optional[np.ndarray] = None
+        self.index = None
+        self.kb_version: Optional[str] = None
+        self._changes = 0
+        self._saved = 0
+        self._load()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._saver = threading.Thread(target=self._save_loop, name="kb-vector-save", daemon=True)
+        self._saver.start()
+
+    # --- Persistence ---
+    def _load(self) -> None:
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            if meta.get("dim") != self.dim:
+                raise ValueError("dimension changed")
+            if self.dirty_path.exists():
+                raise ValueError("not saved after its last changes")
+            self._matrix = open_memmap(self.matrix_path, mode="r+")
+            self.ids, self.fingerprints = meta["ids"], meta["fingerprints"]
+            self.kb_version = meta.get("kb_version")
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            print(f"DEBUG: 🧮 Starting a new KB vector index ({e})")
+            self._matrix = open_memmap(self.matrix_path, mode="w+", dtype=np.float32, shape=(64, self.dim))
+            self.ids, self.fingerprints = [], []
+            self.kb_version = None
+        self._row_of: Dict[str, int] = {entry_id: i for i, entry_id in enumerate(self.ids)}
+
+    def _changed(self) -> None:
+        if self._changes == self._saved:
+            self.dirty_path.touch()
+        self._changes += 1
+        self._wake.set()
+
+    def save(self) -> None:
+        """Writes the ids and fingerprints for the current matrix, if anything changed."""
+        with self._lock:
+            changes = self._changes
+            if changes == self._saved:
+                return
+            self._matrix.flush()
+            meta = {"dim": self.dim, "kb_version": self.kb_version, "ids": list(self.ids),
+                    "fingerprints": list(self.fingerprints)}
+        tmp = self.meta_path.with_suffix(".json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        tmp.replace(self.meta_path)
+        with self._lock:
+            self._saved = changes
+            # Changes made while writing need another save; keep the marker until then.
+            if self._changes == changes:
+                self.dirty_path.unlink(missing_ok=True)
+
+    def _save_loop(self) -> None:
+        while not self._closed.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed.wait(self.save_delay):
+                break
+            try:
+                self.save()
+            except Exception as e:
+                print(f"DEBUG: ❌ Saving KB vector ids failed: {e}")
+
+    def close(self) -> None:
+        """Stops the background saver after saving any pending changes."""
+        self._closed.set()
+        self._wake.set()
+        self._saver.join(timeout=5)
+        self.save()
+
+    def _ensure_capacity(self, rows: int) -> None:
+        capacity = self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        old = np.array(self._matrix[:len(self.ids)])
+        del self._matrix
+        self._matrix = open_memmap(self.matrix_path, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        self._matrix[:len(old)] = old
+
+    # --- Incremental maintenance (KBIndex listener) ---
+    def _put(self, rows: List[dict]) -> None:
+        if not rows:
+            return
+        vectors = embed([row_text(r) for r in rows], self.dim)
+        self._ensure_capacity(len(self.ids) + len(rows))
+        for row, vector in zip(rows, vectors):
+            entry_id = row["ID"]
+            i = self._row_of.get(entry_id)
+            if i is None:
+                i = len(self.ids)
+                self.ids.append(entry_id)
+                self.fingerprints.append(0)
+                self._row_of[entry_id] = i
+            self._matrix[i] = vector
+            self.fingerprints[i] = zlib.crc32(row_text(row).encode("utf-8"))
+
+    def _delete(self, entry_id: str) -> None:
+        i = self._row_of.pop(entry_id, None)
+        if i is None:
+            return
+        # Swap the last row into the hole so the live rows stay contiguous.
+        last = len(self.ids) - 1
+        if i != last:
+            self._matrix[i] = self._matrix[last]
+            self.ids[i], self.fingerprints[i] = self.ids[last], self.fingerprints[last]
+            self._row_of[self.ids[i]] = i
+        self.ids.pop()
+        self.fingerprints.pop()
+
+    def on_kb_add(self, row: dict) -> None:
+        self.on_kb_add_many([row])
+
+    def on_kb_add_many(self, rows: List[dict]) -> None:
+        with self._lock:
+            self._put(rows)
+            self.kb_version = self.index.version
+            self._changed()
+
+    def on_kb_remove(self, entry_id: str) -> None:
+        with self._lock:
+            self._delete(entry_id)
+            self.kb_version = self.index.version
+            self._changed()
+
+    def on_kb_rebuild(self, index) -> None:
+        with self._lock:
+            self.index = index
+            # Already embedded from this exact KB content: nothing to read.
+            if self.kb_version == index.version:
+                return
+            rows = dict(index.items())
+            for entry_id in [e for e in self.ids if e not in rows]:
+                self._delete(entry_id)
+            stale = [
+                row for entry_id, row in rows.items()
+                if entry_id not in self._row_of
+                or self.fingerprints[self._row_of[entry_id]] != zlib.crc32(row_text(row).encode("utf-8"))
+            ]
+            self._put(stale)
+            self.kb_version = index.version
+            self._changed()
+            if stale:
+                print(f"DEBUG: 🧮 Re-embedded {len(stale)} KB rows ({len(self.ids)} total)")
+
+    # --- Querying ---
+    def search_many(self, queries: List[str], k: int = 3) -> List[List[Tuple[float, str]]]:
+        """Cosine top-k for a batch of queries with one matrix product. Returns (score, ID) lists."""
+        with self._lock:
+            n = len(self.ids)
+            if n == 0 or not queries:
+                return [[] for _ in queries]
+            scores = self._matrix[:n] @ embed(queries, self.dim).T  # (n, len(queries))
+            k = min(k, n)
+            results = []
+            for col in range(scores.shape[1]):
+                column = scores[:, col]
+                top = np.argpartition(-column, k - 1)[:k]
+                top = top[np.argsort(-column[top], kind="stable")]
+                results.append([(float(column[i]), self.ids[i]) for i in top if column[i] > 0])
+            return results
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[float, str]]:
+        return self.search_many([query], k)[0]
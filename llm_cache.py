@@ -0,0 +1,94 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+
+def normalize_prompt(text: str) -> str:
+    """Case, punctuation and whitespace-insensitive form of a query, used in cache keys."""
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+
+class LLMCache:
+    """LRU + TTL cache for Gemini results with an optional on-disk tier.
+
+    Keys are built by the caller (normally kind, mode, normalized query and the KB
+    version), so any KB change naturally misses. The memory tier holds at most
+    `max_entries` results; when `disk_path` is set, results are also written to a
+    small SQLite file and promoted back into memory on a memory miss, so the cache
+    survives restarts. Values must be JSON-serialisable.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 86400.0, disk_path: Optional[Path] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._disk = None
+        if disk_path:
+            self._disk = sqlite3.connect(str(disk_path), check_same_thread=False, isolation_level=None)
+            self._disk.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+            self._disk.execute("DELETE FROM llm_cache WHERE expires < ?", (time.time(),))
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        return json.dumps(parts, separators=(",", ":"))
+
+    def _remember(self, key: str, value: Any, expires: float) -> None:
+        self._memory[key] = (value, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                value, expires = item
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return json.loads(value)
+                del self._memory[key]
+            if self._disk is not None:
+                row = self._disk.execute("SELECT value, expires FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row and row[1] > now:
+                    self._remember(key, row[0], row[1])
+                    self.stats["disk_hits"] += 1
+                    return json.loads(row[0])
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        expires = time.time() + self.ttl
+        # Stored serialised so callers can never mutate a cached result in place.
+        payload = json.dumps(value)
+        with self._lock:
+            self._remember(key, payload, expires)
+            self.stats["stores"] += 1
+            if self._disk is not None:
+                self._disk.execute("INSERT OR REPLACE INTO llm_cache (key, value, expires) VALUES (?, ?, ?)",
+                                   (key, payload, expires))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM llm_cache")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._memory),
+                "hit_rate": round((self.stats["hits"] + self.stats["disk_hits"]) / lookups, 3) if lookups else 0.0,
+                "persistent": self._disk is not None,
+            }
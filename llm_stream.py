@@ -0,0 +1,74 @@
+import json
+import re
+from typing import Optional
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class JsonFieldStream:
+    """Incrementally decodes one string field from a JSON object that arrives in chunks.
+
+    `feed(chunk)` returns the newly decoded characters of `field` (possibly ""), so a
+    streamed `solution_draft` can be forwarded while the model is still generating it.
+    Once the field's key has been seen, `prefix` holds the fields generated before it
+    as a dict (the model emits short metadata fields first).
+    """
+
+    def __init__(self, field: str):
+        self._key = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._pos: Optional[int] = None
+        self.done = False
+        self.prefix: Optional[dict] = None
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        if self._pos is None:
+            match = self._key.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+            self.prefix = self._parse_prefix(self._buffer[:match.start()])
+        return self._decode()
+
+    @staticmethod
+    def _parse_prefix(text: str) -> dict:
+        text = text.strip().rstrip(",")
+        if text.startswith("```"):
+            text = text.split("\n", 1)[-1]
+        try:
+            return json.loads(text + "}") if text.startswith("{") and len(text) > 1 else {}
+        except json.JSONDecodeError:
+            return {}
+
+    def _decode(self) -> str:
+        out = []
+        buf, i = self._buffer, self._pos
+        while i < len(buf) and not self.done:
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+            elif ch == "\\":
+                if i + 1 >= len(buf):
+                    break
+                esc = buf[i + 1]
+                if esc == "u":
+                    if i + 6 > len(buf):
+                        break
+                    out.append(chr(int(buf[i + 2:i + 6], 16)))
+                    i += 6
+                else:
+                    out.append(_ESCAPES.get(esc, esc))
+                    i += 2
+            else:
+                out.append(ch)
+                i += 1
+        self._pos = i
+        return "".join(out)
+
+
+def sse_event(event: str, data, event_id: Optional[str] = None) -> str:
+    """Formats one Server-Sent Events message with a JSON payload."""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
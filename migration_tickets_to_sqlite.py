@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from ticket_store import SqliteTicketStore, import_json
+
+DB_FILE = Path("tickets_db.json")
+SQLITE_FILE = Path("tickets.db")
+
+def migrate():
+    if not DB_FILE.exists():
+        print("Ticket DB file not found.")
+        return
+
+    store = SqliteTicketStore(SQLITE_FILE)
+    imported = import_json(store, DB_FILE)
+    print(f"Migration complete: Imported {imported} tickets into {SQLITE_FILE}. Start the server with TICKET_STORE=sqlite.")
+
+if __name__ == "__main__":
+    migrate()
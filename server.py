@@ -1,19 +1,33 @@
 import os
 import json
-import csv
+import base64
+import hashlib
+import asyncio
+import functools
 import time
 import datetime
 import uuid
 import requests
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import Response as RawResponse  # `Response` is the chat analysis model below
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 from google import genai
 from langsmith import wrappers
-from difflib import SequenceMatcher
+from ticket_store import CachedTicketStore, TicketIdAllocator, open_store
+from kb_index import KBIndex
+from kb_store import KBStore
+from kb_vectors import KBVectorIndex, embed
+from kb_dedup import KBDuplicateIndex
+from llm_cache import LLMCache, normalize_prompt
+from llm_stream import JsonFieldStream, sse_event
+from change_feed import ChangeFeed, KBChangePublisher
+from job_queue import JobQueue
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
@@ -41,6 +55,11 @@ if LANGSMITH_TRACING:
 else:
     client = gemini_client
 
+# Gemini calls are blocking; they run on this bounded pool so the event loop keeps serving
+# other requests. LLM_MAX_CONCURRENCY caps how many calls are in flight at once.
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+
 app = FastAPI(title="LoopBack AI IT Hub API")
 
 # Enable CORS
@@ -50,6 +69,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Revision"],
 )
 
 # --- Paths ---
@@ -57,6 +77,105 @@ BASE_DIR = Path(__file__).parent
 KB_DIR = BASE_DIR / "knowledge_base"
 DB_FILE = BASE_DIR / "tickets_db.json"
 KB_CSV = KB_DIR / "Workplace_IT_Support_Database.csv"
+KB_SQLITE = KB_DIR / "kb.db"
+KB_SNAPSHOT = KB_DIR / "kb.snapshot"
+TICKETS_SQLITE = BASE_DIR / "tickets.db"
+TICKET_SEQ_FILE = BASE_DIR / "tickets_db.seq"
+LLM_CACHE_FILE = BASE_DIR / "llm_cache.db"
+KB_ANSWER_AUDIT_LOG = BASE_DIR / "kb_answer_audit.jsonl"
+KB_JOBS_DB = BASE_DIR / "kb_jobs.db"
+
+# --- Ticket Storage ---
+# "json" keeps tickets in tickets_db.json plus an append-only journal that is periodically
+# compacted into it; "sqlite" uses an indexed embedded database (seeded once from tickets_db.json).
+TICKET_STORE_BACKEND = os.getenv('TICKET_STORE', 'json').lower()
+# Either way, tickets are served from an in-memory cache and persisted in the background.
+ticket_store = CachedTicketStore(
+    open_store(
+        TICKET_STORE_BACKEND, DB_FILE, TICKETS_SQLITE,
+        fsync_interval=float(os.getenv('TICKET_JOURNAL_FSYNC_SECONDS', '0.05')),
+        compact_bytes=int(os.getenv('TICKET_JOURNAL_COMPACT_BYTES', '1000000')),
+        compact_interval=float(os.getenv('TICKET_JOURNAL_COMPACT_SECONDS', '300')),
+    ),
+    check_interval=float(os.getenv('TICKET_CACHE_CHECK_SECONDS', '1')),
+)
+ticket_ids = TicketIdAllocator(TICKET_SEQ_FILE, (t.get("id") for t in ticket_store.all()))
+
+# --- Knowledge Base Storage ---
+# Entries live in kb.db (one keyed row each); the CSV is imported from when it is edited
+# by hand and re-exported in the background after API writes.
+KB_FIELDS = ['ID', 'Category', 'Issue', 'Question', 'Resolution', 'Tags']
+kb_store = KBStore(KB_SQLITE, KB_CSV, KB_FIELDS, export_delay=float(os.getenv('KB_CSV_EXPORT_SECONDS', '1')))
+
+# Near-duplicate detection for KB learning (SequenceMatcher ratio on Question/Issue)
+KB_DUPLICATE_THRESHOLD = float(os.getenv('KB_DUPLICATE_THRESHOLD', '0.85'))
+kb_duplicates = KBDuplicateIndex(threshold=KB_DUPLICATE_THRESHOLD)
+
+# --- Knowledge Base Index ---
+# Serves from kb.snapshot, a compiled and memory-mapped copy of the store (rows, JSON
+# body, BM25 postings and the duplicate detector's buckets) shared by all workers.
+# Writes below are applied to an in-memory overlay and compiled in KB_SNAPSHOT_SECONDS later.
+kb_index = KBIndex(
+    kb_store, KB_SNAPSHOT, KB_FIELDS,
+    check_interval=float(os.getenv('KB_INDEX_CHECK_SECONDS', '1')),
+    compact_delay=float(os.getenv('KB_SNAPSHOT_SECONDS', '1')),
+    section_builders=[kb_duplicates],
+)
+kb_index.subscribe(kb_duplicates)
+
+# "keyword" ranks with BM25, "semantic" with hashed n-gram vectors, "hybrid" fuses both rankings.
+KB_RETRIEVAL_MODE = os.getenv('KB_RETRIEVAL_MODE', 'keyword').lower()
+kb_vectors = None
+if KB_RETRIEVAL_MODE in ("semantic", "hybrid"):
+    kb_vectors = KBVectorIndex(KB_DIR / "kb_vectors", dim=int(os.getenv('KB_VECTOR_DIM', '512')),
+                               save_delay=float(os.getenv('KB_VECTOR_SAVE_SECONDS', '1')))
+    kb_index.subscribe(kb_vectors)
+
+# Chats whose message is this similar (cosine of hashed n-gram vectors) to a KB Question
+# are answered with the stored Resolution without calling Gemini. Set above 1 to disable.
+KB_ANSWER_THRESHOLD = float(os.getenv('KB_ANSWER_THRESHOLD', '0.85'))
+
+# --- Change Feed ---
+# Ticket and KB writes are announced here so the dashboard and the bot can react
+# immediately instead of re-downloading every ticket on a timer.
+change_feed = ChangeFeed(capacity=int(os.getenv('CHANGE_FEED_BUFFER', '10000')))
+kb_index.subscribe(KBChangePublisher(change_feed))
+# A reload after an outside edit has no per-ticket events; clients resync on this one.
+ticket_store.subscribe(lambda: change_feed.publish("tickets.reloaded", count=ticket_store.count()))
+
+# --- LLM Response Cache ---
+# Repeat questions are answered from this cache. Keys include the KB version, so any KB
+# change invalidates them. LLM_CACHE_PERSIST=true also keeps results in llm_cache.db.
+llm_cache = LLMCache(
+    max_entries=int(os.getenv('LLM_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('LLM_CACHE_TTL_SECONDS', '86400')),
+    disk_path=LLM_CACHE_FILE if os.getenv('LLM_CACHE_PERSIST', 'false').lower() == 'true' else None,
+)
+
+# Shutdown handlers run in registration order. The KB learning jobs (kb_jobs, set up
+# further down) write to the KB and call the LLM executor, so they are stopped first.
+@app.on_event("shutdown")
+async def stop_kb_jobs():
+    await kb_jobs.stop()
+
+@app.on_event("shutdown")
+def close_ticket_store():
+    ticket_store.close()
+
+@app.on_event("shutdown")
+def close_kb_store():
+    kb_index.close()
+    if kb_vectors:
+        kb_vectors.close()
+    kb_store.close()
+
+@app.on_event("shutdown")
+def close_llm_executor():
+    llm_executor.shutdown(wait=False, cancel_futures=True)
+
+@app.on_event("shutdown")
+def close_audit_executor():
+    audit_executor.shutdown(wait=True)  # Writes out queued audit records
 
 # --- Data Models ---
 class Ticket(BaseModel):
@@ -88,6 +207,9 @@ class BroadcastAllRequest(BaseModel):
     category: Optional[str] = None
     ticket_ids: Optional[List[str]] = None
     final_answer: str
+    # Extra filters for the category selection (all must match)
+    subcategory: Optional[str] = None
+    max_age_minutes: Optional[float] = None # Only tickets created within this many minutes
 
 class AskRequest(BaseModel):
     question: str
@@ -105,68 +227,101 @@ class Response(BaseModel):
     escalation_required: bool = Field(default=False, description="True if escalation is required")
     is_it_related: bool = Field(default=True, description="True if query is IT Support related (hardware, software, network, account, etc.). False for chit-chat, weather, general knowledge.")
 
+class StreamResponse(BaseModel):
+    # Same fields as Response, declared in generation order: the short fields come first so
+    # they are known before solution_draft starts streaming.
+    is_it_related: bool = Field(default=True, description="True if query is IT Support related (hardware, software, network, account, etc.). False for chit-chat, weather, general knowledge.")
+    confidence: str = Field(description="high|medium|low")
+    escalation_required: bool = Field(default=False, description="True if escalation is required")
+    summary: str = Field(description="Concise 1-sentence summary of the issue (e.g. 'User needs a smaller keyboard due to injury')")
+    solution_draft: str = Field(description="Admin draft solution or Chat response")
+    ticket_metadata: TicketMetadata
+
 class MessageAppendRequest(BaseModel):
     role: str
     message: str
 
 
 # --- Database Ops ---
-def load_db():
-    if not DB_FILE.exists(): return []
-    try:
-        with open(DB_FILE, "r") as f: return json.load(f)
-    except: return []
-
-def save_db(data):
-    with open(DB_FILE, "w") as f: json.dump(data, f, indent=4)
+def _history_entry(role: str, message: str) -> dict:
+    return {"role": role, "message": message, "time": time.strftime("%H:%M")}
 
 # --- Helper Functions ---
+def search_kb(query: str, k: int = 3):
+    """Returns up to k (score, row) pairs using the configured retrieval mode."""
+    if not kb_vectors:
+        return kb_index.search(query, k=k)
+
+    semantic = [(score, kb_index.get(entry_id)) for score, entry_id in kb_vectors.search(query, k=k * 3)]
+    semantic = [(score, row) for score, row in semantic if row]
+    if KB_RETRIEVAL_MODE == "semantic":
+        return semantic[:k]
+
+    # Hybrid: reciprocal rank fusion of the keyword and semantic rankings
+    fused = {}
+    for ranking in (kb_index.search(query, k=k * 3), semantic):
+        for rank, (_, row) in enumerate(ranking):
+            score, _ = fused.get(row['ID'], (0.0, row))
+            fused[row['ID']] = (score + 1 / (60 + rank), row)
+    return sorted(fused.values(), key=lambda item: item[0], reverse=True)[:k]
+
+def match_kb_answer(message: str):
+    """Returns (similarity, row) for the best KB Question matching `message`, or None."""
+    best = None
+    candidates = [row for _, row in search_kb(message, k=3) if row.get('Question') and row.get('Resolution')]
+    if not candidates:
+        return None
+    vectors = embed([message] + [row['Question'] for row in candidates], kb_vectors.dim if kb_vectors else 512)
+    for row, similarity in zip(candidates, vectors[1:] @ vectors[0]):
+        if best is None or similarity > best[0]:
+            best = (float(similarity), row)
+    return best
+
+# Audit records are appended by one background thread (in order), so chats never wait on file I/O.
+audit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kb-audit")
+
+def audit_kb_answer(message: str, match, answered: bool):
+    """Records every fast-path decision so KB-only answers can be reviewed later."""
+    record = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "message": message,
+        "answered_from_kb": answered,
+        "similarity": round(match[0], 4) if match else None,
+        "kb_id": match[1].get('ID') if match else None,
+        "kb_question": match[1].get('Question') if match else None,
+        "threshold": KB_ANSWER_THRESHOLD,
+    }
+    print(f"DEBUG: 📋 KB fast path {'used' if answered else 'skipped'} (similarity: {record['similarity']}, KB: {record['kb_id']})")
+    audit_executor.submit(_append_audit_record, record)
+
+def _append_audit_record(record: dict):
+    try:
+        with open(KB_ANSWER_AUDIT_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+    except Exception as e:
+        print(f"DEBUG: ❌ Failed to write KB answer audit: {e}")
+
 def get_kb_context_summary(query: str = ""):
     """Returns top relevant KB items based on query keywords."""
-    if not KB_CSV.exists():
-        print("DEBUG: ⚠️ KB CSV not found")
-        return ""
-    
+    print(f"DEBUG: 🔍 KB Search Query: '{query}'")
+
     summary = []
-    # robust tokenization: strip punctuation and lowercase
-    import re
-    query_words = set(re.findall(r'\w+', query.lower())) if query else set()
-    print(f"DEBUG: 🔍 KB Search Query: '{query}' Tokens: {query_words}")
-    
     try:
-        with open(KB_CSV, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            scored_rows = []
-            for row in reader:
-                # Search robustly across multiple fields
-                search_text = (
-                    f"{row.get('Category','')} "
-                    f"{row.get('Issue','')} "
-                    f"{row.get('Question','')} "
-                    f"{row.get('Tags','')}"
-                ).lower()
-                
-                match_count = sum(1 for w in query_words if w in search_text)
-                
-                if match_count > 0:
-                    # Provide FULL resolution for better context
-                    content = f"Issue: {row['Issue']}\nQuestion: {row['Question']}\nResolution: {row['Resolution']}\n"
-                    scored_rows.append((match_count, content))
-            
-            # Sort by score desc
-            scored_rows.sort(key=lambda x: x[0], reverse=True)
-            
-            # Log top matches for debugging
-            print(f"DEBUG: 🔢 Found {len(scored_rows)} matches.")
-            for i, (score, content) in enumerate(scored_rows[:3]):
-                print(f"DEBUG:   Match #{i+1} (Score: {score}): {content.splitlines()[0]}")
+        matches = search_kb(query, k=3) if query else []
 
-            summary = [item[1] for item in scored_rows[:3]] # Top 3 is enough if full content
-            
+        # Log top matches for debugging
+        print(f"DEBUG: 🔢 Found {len(matches)} matches.")
+        for i, (score, row) in enumerate(matches):
+            print(f"DEBUG:   Match #{i+1} (Score: {score:.2f}): {row.get('Question', '')}")
+
+        # Provide FULL resolution for better context; top 3 is enough
+        summary = [
+            f"Issue: {row.get('Issue', '')}\nQuestion: {row.get('Question', '')}\nResolution: {row.get('Resolution', '')}\n"
+            for _, row in matches
+        ]
     except Exception as e:
         print(f"DEBUG: ❌ KB Search Error: {e}")
-        pass
-        
+
     return "\n---\n".join(summary)
 
 def is_quality_solution(text: str) -> bool:
@@ -190,16 +345,12 @@ def is_quality_solution(text: str) -> bool:
     return any(i in lower for i in indicators) or len(text) > 40
 
 # --- Gemini Logic ---
-def analyze_with_gemini(query: str, mode: str = "ticket") -> Dict[str, Any]:
-    """Analyzes query using Gemini with optimized context."""
-    if not GOOGLE_API_KEY:
-        return {"confidence": "low", "reasoning": "No API Key", "ticket_metadata": {"title": "Error"}, "solution_draft": "System Error: No API Key.", "summary": "Error"}
-
-    try:
-        kb_context = get_kb_context_summary(query)
-        
-        if mode == "chat":
-            prompt = f"""You are a Tier 1 IT Support AI.
+def build_analysis_prompt(query: str, mode: str = "ticket") -> str:
+    """Builds the Gemini prompt for a chat or ticket analysis, with KB context."""
+    kb_context = get_kb_context_summary(query)
+    
+    if mode == "chat":
+        prompt = f"""You are a Tier 1 IT Support AI.
 Context:
 {kb_context}
 
@@ -215,13 +366,13 @@ Return JSON:
   "is_it_related": true|false,
   "summary": "Standardized, professional issue title (e.g. 'VPN Access Failure' or 'Laptop Screen Replacement Request'). Avoid 'User reports' or 'Customer needs'. Just state the issue.",
   "ticket_metadata": {{
-    "title": "Title",
-    "category": "Category",
-    "subcategory": "Subcategory"
+"title": "Title",
+"category": "Category",
+"subcategory": "Subcategory"
   }}
 }}"""
-        else:
-            prompt = f"""You are an IT Support AI.
+    else:
+        prompt = f"""You are an IT Support AI.
 Context:
 {kb_context}
 
@@ -233,14 +384,58 @@ Return JSON:
   "confidence": "high|medium|low",
   "summary": "Standardized, professional issue title (e.g. 'VPN Access Failure'). Avoid 'User reports'. Just state the issue.",
   "ticket_metadata": {{
-    "title": "Issue Summary",
-    "category": "Network|Hardware|Software|Account|Others",
-    "subcategory": "Subcategory (Max 2 words)"
+"title": "Issue Summary",
+"category": "Network|Hardware|Software|Account|Others",
+"subcategory": "Subcategory (Max 2 words)"
   }},
   "solution_draft": "Admin draft...",
   "escalation_required": true,
   "is_it_related": true
 }}"""
+    return prompt
+
+def parse_gemini_json(content_text: str) -> Optional[Dict[str, Any]]:
+    """Parses a Gemini JSON response. Returns None if it is not valid JSON."""
+    try:
+        # Clean possible markdown
+        content_text = content_text.strip()
+        if content_text.startswith("```json"):
+            content_text = content_text.split("\n", 1)[1].rsplit("\n", 1)[0]
+        elif content_text.startswith("```"):
+            content_text = content_text.split("\n", 1)[1].rsplit("\n", 1)[0]
+        return json.loads(content_text)
+    except Exception:
+        return None
+
+def gemini_error_result(e: Exception) -> Dict[str, Any]:
+    error_str = str(e)
+    print(f"Gemini Error: {error_str}")
+    
+    if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower():
+        msg = "⚠️ AI Service Busy: quota exhausted. Please try again in a few minutes."
+    else:
+        msg = f"System Error: {error_str}"
+        
+    return {
+        "confidence": "low", 
+        "solution_draft": msg, 
+        "ticket_metadata": {"title": "Error", "category": "Others", "subcategory": "System Error"}, 
+        "summary": "System Error"
+    }
+
+def analyze_with_gemini(query: str, mode: str = "ticket") -> Dict[str, Any]:
+    """Analyzes query using Gemini with optimized context."""
+    if not GOOGLE_API_KEY:
+        return {"confidence": "low", "reasoning": "No API Key", "ticket_metadata": {"title": "Error"}, "solution_draft": "System Error: No API Key.", "summary": "Error"}
+
+    cache_key = LLMCache.make_key("analyze", mode, normalize_prompt(query), kb_index.version)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        print(f"DEBUG: ⚡ LLM cache hit ({mode})")
+        return cached
+
+    try:
+        prompt = build_analysis_prompt(query, mode)
             
         # Use the wrapped client to call the new API
         response = client.models.generate_content(
@@ -262,91 +457,373 @@ Return JSON:
         except Exception:
             content_text = str(response)
 
-        try:
-            # Clean possible markdown
-            content_text = content_text.strip()
-            if content_text.startswith("```json"):
-                content_text = content_text.split("\n", 1)[1].rsplit("\n", 1)[0]
-            elif content_text.startswith("```"):
-                content_text = content_text.split("\n", 1)[1].rsplit("\n", 1)[0]
-                
-            return json.loads(content_text)
-        except Exception:
+        result = parse_gemini_json(content_text)
+        if result is None:
             print("Gemini Error: Failed to parse response as JSON. Returning raw content.")
             return {"confidence": "low", "solution_draft": content_text, "ticket_metadata": {}, "summary": query}
+        llm_cache.put(cache_key, result)
+        return result
 
     except Exception as e:
-        error_str = str(e)
-        print(f"Gemini Error: {error_str}")
-        
-        if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower():
-            msg = "⚠️ AI Service Busy: quota exhausted. Please try again in a few minutes."
-        else:
-            msg = f"System Error: {error_str}"
-            
-        return {
-            "confidence": "low", 
-            "solution_draft": msg, 
-            "ticket_metadata": {"title": "Error", "category": "Others", "subcategory": "System Error"}, 
-            "summary": "System Error"
-        }
+        return gemini_error_result(e)
+
+# StreamResponse fields generated before solution_draft, i.e. the body of the "meta" event.
+STREAM_META_FIELDS = ("is_it_related", "confidence", "escalation_required", "summary")
+
+def stream_chat_analysis(query: str, emit) -> Dict[str, Any]:
+    """
+    Chat-mode analyze_with_gemini that streams the answer as it is generated.
+    Calls emit("meta", {...}) once the short fields are known and emit("delta", {"text": ...})
+    for each piece of solution_draft. Returns the full parsed result.
+    """
+    if not GOOGLE_API_KEY:
+        return analyze_with_gemini(query, mode="chat")
+
+    cache_key = LLMCache.make_key("analyze", "chat", normalize_prompt(query), kb_index.version)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        print("DEBUG: ⚡ LLM cache hit (chat stream)")
+        # Same events as a live answer, with the whole draft as one delta.
+        emit("meta", {k: cached[k] for k in STREAM_META_FIELDS if k in cached})
+        emit("delta", {"text": cached.get("solution_draft", "")})
+        return cached
+
+    try:
+        prompt = build_analysis_prompt(query, "chat")
+        draft = JsonFieldStream("solution_draft")
+        chunks = []
+        for chunk in client.models.generate_content_stream(
+            model="gemini-3-pro",
+            contents=prompt,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": StreamResponse.model_json_schema(),
+            },
+        ):
+            text = getattr(chunk, "text", None) or ""
+            chunks.append(text)
+            had_prefix = draft.prefix is not None
+            delta = draft.feed(text)
+            if draft.prefix is not None and not had_prefix:
+                emit("meta", draft.prefix)
+            if delta:
+                emit("delta", {"text": delta})
+
+        content_text = "".join(chunks)
+        result = parse_gemini_json(content_text)
+        if result is None:
+            print("Gemini Error: Failed to parse streamed response as JSON. Returning raw content.")
+            return {"confidence": "low", "solution_draft": content_text, "ticket_metadata": {}, "summary": query}
+        llm_cache.put(cache_key, result)
+        return result
+
+    except Exception as e:
+        return gemini_error_result(e)
+
+async def run_llm(func, *args, **kwargs):
+    """Runs a blocking Gemini helper on the LLM pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(llm_executor, functools.partial(func, *args, **kwargs))
+
+# --- Ticket Listing ---
+TICKET_SORT_FIELDS = ("id", "created_at", "status", "category", "group_id")
+TICKET_PAGE_MAX = 500
+# Distinguishes ETags across restarts, since the store version starts from zero again.
+TICKETS_ETAG_SALT = uuid.uuid4().hex[:8]
+
+def _ticket_fields(t: dict, fields: Optional[List[str]]) -> dict:
+    """Projects a ticket onto `fields`; "history_length" is available as a derived field."""
+    if not fields:
+        return t
+    out = {"id": t.get("id")}
+    for f in fields:
+        if f == "history_length":
+            out[f] = len(t.get("history", []))
+        elif f in t:
+            out[f] = t[f]
+    return out
+
+def _sort_key(t: dict, field: str) -> tuple:
+    """Sort key with the ticket id as tie-breaker (numerically, so TKT-999 < TKT-1000)."""
+    tid = str(t.get("id") or "")
+    id_key = (TicketIdAllocator.parse(tid) or 0, tid)
+    return id_key if field in ("", "id") else (str(t.get(field) or ""),) + id_key
+
+def _encode_cursor(sort: str, key) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"sort": sort, "key": list(key)}).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str, sort: str) -> tuple:
+    """The sort key a cursor resumes after. 400 unless it was issued for this same `sort`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        data = None
+    # Same shape as _sort_key: (id number, id) or (field value, id number, id).
+    types = (int, str) if sort.lstrip("-") in ("", "id") else (str, int, str)
+    key = data.get("key") if isinstance(data, dict) and data.get("sort") == sort else None
+    if not isinstance(key, list) or len(key) != len(types) or \
+            not all(type(value) is expected for value, expected in zip(key, types)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return tuple(key)
 
 # --- Endpoints ---
 @app.get("/tickets")
-async def get_tickets():
-    return load_db()
+async def get_tickets(
+    request: Request,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    group_id: Optional[str] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+    sort: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=TICKET_PAGE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    since: Optional[int] = None,
+):
+    """
+    Lists tickets. With no parameters this is every ticket in storage order, as before.
+    - status / category / group_id filter via the ticket cache indexes.
+    - created_after / created_before compare against `created_at` (ISO 8601).
+    - sort is one of TICKET_SORT_FIELDS, prefixed with "-" for descending.
+    - limit + cursor page through the results; the next cursor is in X-Next-Cursor.
+    - fields is a comma-separated projection (id is always included).
+    - since=<revision> switches to delta mode: {"revision", "reset", "tickets", "deleted"}
+      with only the tickets changed and ids deleted after that revision. On "reset" the
+      client must reload the full list. Full lists report their revision in X-Revision.
+    Responses carry an ETag; a matching If-None-Match gets 304 Not Modified.
+    """
+    # Pick up outside edits first, so the ETag never vouches for a stale cache.
+    ticket_store.refresh()
+    etag = 'W/"%s-%d-%s"' % (TICKETS_ETAG_SALT, ticket_store.version,
+                             hashlib.sha1(str(request.query_params).encode()).hexdigest()[:12])
+    if request.headers.get("if-none-match") == etag:
+        return RawResponse(status_code=304, headers={"ETag": etag})
+
+    projection = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    if since is not None:
+        revision = ticket_store.revision
+        reset, changed, deleted = ticket_store.changes_since(since)
+        return JSONResponse({
+            "revision": revision,
+            "reset": reset,
+            "tickets": [_ticket_fields(t, projection) for t in changed],
+            "deleted": deleted,
+        }, headers={"ETag": etag})
+
+    # Read first: a change racing with the listing is then re-sent, never skipped.
+    headers = {"ETag": etag, "X-Revision": str(ticket_store.revision)}
+    tickets = ticket_store.query(status=status, category=category, group_id=group_id)
+    if created_after:
+        tickets = [t for t in tickets if (t.get("created_at") or "") > created_after]
+    if created_before:
+        tickets = [t for t in tickets if t.get("created_at") and t["created_at"] < created_before]
+
+    sort_field, descending = "", False
+    if sort:
+        descending = sort.startswith("-")
+        sort_field = sort.lstrip("-")
+        if sort_field not in TICKET_SORT_FIELDS:
+            raise HTTPException(status_code=400, detail=f"Cannot sort by '{sort_field}'")
+        tickets = sorted(tickets, key=lambda t: _sort_key(t, sort_field), reverse=descending)
+
+    if limit or cursor:
+        # Keyset pagination: the cursor is the sort key of the last ticket returned,
+        # so pages stay consistent while tickets are created or deleted.
+        keyed = [(_sort_key(t, sort_field), t) for t in tickets]
+        if not sort_field:
+            keyed.sort(key=lambda kt: kt[0])
+        if cursor:
+            after = _decode_cursor(cursor, sort or "")
+            keyed = [kt for kt in keyed if (kt[0] < after if descending else kt[0] > after)]
+        page_size = limit or TICKET_PAGE_MAX
+        if len(keyed) > page_size:
+            headers["X-Next-Cursor"] = _encode_cursor(sort or "", keyed[page_size - 1][0])
+        tickets = [t for _, t in keyed[:page_size]]
+
+    return JSONResponse([_ticket_fields(t, projection) for t in tickets], headers=headers)
+
+@app.get("/tickets/{ticket_id}")
+async def get_ticket(ticket_id: str):
+    ticket = ticket_store.get(ticket_id)
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return ticket
+
+CHANGE_KEEPALIVE_SECONDS = 15.0
+
+def _parse_last_event_id(value: Optional[str]):
+    """Splits an SSE Last-Event-ID of the form "<epoch>:<seq>"."""
+    try:
+        epoch, seq = value.split(":", 1)
+        return int(seq), int(epoch)
+    except (AttributeError, ValueError):
+        return None, None
+
+@app.get("/changes")
+async def get_changes(since: int = 0, epoch: Optional[int] = None, timeout: float = 25.0):
+    """
+    Long-poll fallback for the change feed. Returns as soon as there are events after
+    `since` (or after `timeout` seconds). When `reset` is true the client missed events
+    and should re-fetch /tickets, then resume from `latest`.
+    """
+    reset, events = await change_feed.wait(since, epoch, min(max(timeout, 0.0), 60.0))
+    return {"epoch": change_feed.epoch, "latest": change_feed.latest, "reset": reset, "events": events}
+
+@app.get("/changes/stream")
+async def stream_changes(request: Request, since: Optional[int] = None, epoch: Optional[int] = None):
+    """
+    Server-Sent Events change feed. Each event carries the id "<epoch>:<seq>", so a
+    reconnecting EventSource resumes via Last-Event-ID without missing anything.
+    Without a position the stream starts at the current sequence number.
+    """
+    last_seq, last_epoch = _parse_last_event_id(request.headers.get("last-event-id"))
+    if last_seq is not None:
+        since, epoch = last_seq, last_epoch
+
+    async def events():
+        seq = change_feed.latest if since is None else since
+        feed_epoch = change_feed.epoch if since is None else epoch
+        yield sse_event("hello", {"epoch": change_feed.epoch, "latest": change_feed.latest})
+        while not await request.is_disconnected():
+            reset, batch = await change_feed.wait(seq, feed_epoch, CHANGE_KEEPALIVE_SECONDS)
+            if reset:
+                seq, feed_epoch = change_feed.latest, change_feed.epoch
+                yield sse_event("reset", {"epoch": feed_epoch, "latest": seq}, event_id=f"{feed_epoch}:{seq}")
+                continue
+            if not batch:
+                yield ": keep-alive\n\n"
+                continue
+            for event in batch:
+                yield sse_event("change", event, event_id=f"{change_feed.epoch}:{event['seq']}")
+            seq = batch[-1]["seq"]
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Notification Outbox ---
+# Tickets waiting for the bot to tell the user are exactly those with notified == False
+# (set by broadcast/ask, cleared by the acks below). The ticket cache indexes that flag,
+# so reading the outbox costs O(pending), not O(all tickets).
+NOTIFY_STATUSES = ("Resolved", "Awaiting Info")
+
+class NotificationAckRequest(BaseModel):
+    ids: List[str]
+
+def _notification(t: dict) -> dict:
+    """The fields the bot needs to deliver one notification."""
+    last_admin_question = None
+    if t.get("status") == "Awaiting Info":
+        for h in reversed(t.get("history", [])):
+            if h.get("role") == "admin":
+                last_admin_question = h.get("message")
+                break
+    return {
+        "id": t.get("id"),
+        "status": t.get("status"),
+        "query": t.get("query"),
+        "final_answer": t.get("final_answer"),
+        "last_admin_question": last_admin_question,
+        "thread_id": t.get("thread_id"),
+        "users": t.get("users", []),
+    }
+
+@app.get("/notifications/pending")
+async def get_pending_notifications():
+    """Resolved / Awaiting Info tickets the user has not been told about yet."""
+    return [_notification(t) for t in ticket_store.query(notified=False) if t.get("status") in NOTIFY_STATUSES]
+
+@app.post("/notifications/ack")
+async def ack_notifications(req: NotificationAckRequest):
+    """Bulk version of ack_notification: confirms many delivered notifications at once."""
+    def apply(t):
+        t["notified"] = True
+
+    acked = ticket_store.update_many(req.ids, apply)
+    for t in acked:
+        change_feed.publish("ticket.acked", ticket=t)
+    acked_ids = {t["id"] for t in acked}
+    return {"acked": [t["id"] for t in acked], "missing": [i for i in req.ids if i not in acked_ids]}
 
 @app.post("/tickets/{ticket_id}/ack_notification")
 async def ack_notification(ticket_id: str):
     """Called by the bot to confirm it has notified the user."""
-    db = load_db()
-    for t in db:
-        if t["id"] == ticket_id:
-            t["notified"] = True
-            save_db(db)
-            return {"status": "acked"}
-    raise HTTPException(status_code=404, detail="Ticket not found")
+    def apply(t):
+        t["notified"] = True
+
+    ticket = ticket_store.update(ticket_id, apply)
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    change_feed.publish("ticket.acked", ticket=ticket)
+    return {"status": "acked"}
+
+@app.get("/llm/cache/stats")
+async def get_llm_cache_stats():
+    """Hit/miss counters for the Gemini response cache."""
+    return llm_cache.snapshot()
 
 @app.get("/knowledge-base")
 async def get_knowledge_base():
     """Returns the full Knowledge Base as JSON."""
-    if not KB_CSV.exists(): return []
-    data = []
-    try:
-        with open(KB_CSV, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            data = [row for row in reader]
-    except Exception as e:
-        print(f"Error reading KB: {e}")
-    return data
+    return kb_listing()
+
+KB_LISTING_CHUNK = 64 * 1024
+
+def kb_listing():
+    """The whole KB: the snapshot's JSON streamed from the mapping, else rows from the store."""
+    body = kb_index.snapshot_json()
+    if body is None:
+        return kb_store.all()
+    chunks = (bytes(body[i:i + KB_LISTING_CHUNK]) for i in range(0, len(body), KB_LISTING_CHUNK))
+    return StreamingResponse(chunks, media_type="application/json", headers={"Content-Length": str(len(body))})
+
+@app.get("/knowledge-base/terms")
+async def get_kb_terms():
+    """Sorted vocabulary of the KB's searchable fields (from the snapshot's token index)."""
+    return {"version": kb_index.version, "terms": kb_index.terms()}
 
 class ChatRequest(BaseModel):
     message: str
     history: List[dict] = [] # List of {"role": "user"|"model", "content": "..."}
 
-@app.post("/chat/analyze")
-async def analyze_chat(req: ChatRequest):
-    """
-    Analyzes chat context and returns an AI response + confidence.
-    Does NOT create a ticket yet.
-    """
-    print(f"DEBUG: 💬 Chat Request: {req.message}")
-    
+def wants_human(message: str) -> bool:
+    lower = message.lower()
+    return "ticket" in lower or "admin" in lower or "escalate" in lower
+
+def kb_fast_answer(req: ChatRequest) -> Optional[Dict[str, Any]]:
+    """Answers a close paraphrase of a KB question with its vetted resolution, or returns None."""
+    if wants_human(req.message) or KB_ANSWER_THRESHOLD > 1:
+        return None
+    match = match_kb_answer(req.message)
+    answered = bool(match and match[0] >= KB_ANSWER_THRESHOLD)
+    audit_kb_answer(req.message, match, answered)
+    if not answered:
+        return None
+    _, row = match
+    return {
+        "response": row['Resolution'],
+        "escalation_required": False,
+        "confidence": "high",
+        "is_it_related": True,
+        "metadata": {"title": row['Question'], "category": row.get('Category', 'Others'), "subcategory": ""},
+        "summary": row['Question'],
+        "source": "knowledge_base",
+        "kb_id": row.get('ID'),
+    }
+
+def chat_prompt(req: ChatRequest) -> str:
     # Construct context from history
     history_context = ""
     for msg in req.history[-5:]: # Last 5 messages for context
         role = "User" if msg.get("role") == "user" else "AI"
         history_context += f"{role}: {msg.get('content')}\n"
     
-    full_prompt = f"{history_context}\nUser: {req.message}"
-    
-    ai_result = analyze_with_gemini(full_prompt, mode="chat")
-    
+    return f"{history_context}\nUser: {req.message}"
+
+def chat_result(ai_result: Dict[str, Any], req: ChatRequest) -> Dict[str, Any]:
     # Check for keywords to force escalation logic if needed
-    escalate = ai_result.get("escalation_required", False)
-    if not escalate:
-        if "ticket" in req.message.lower() or "admin" in req.message.lower() or "escalate" in req.message.lower():
-             escalate = True
+    escalate = ai_result.get("escalation_required", False) or wants_human(req.message)
     
     return {
         "response": ai_result.get("solution_draft"),
@@ -357,6 +834,59 @@ async def analyze_chat(req: ChatRequest):
         "summary": ai_result.get("summary", req.message) # Return summary
     }
 
+@app.post("/chat/analyze")
+async def analyze_chat(req: ChatRequest):
+    """
+    Analyzes chat context and returns an AI response + confidence.
+    Does NOT create a ticket yet.
+    """
+    print(f"DEBUG: 💬 Chat Request: {req.message}")
+
+    # Fast path: a close paraphrase of a KB question gets the vetted resolution directly
+    fast = kb_fast_answer(req)
+    if fast:
+        return fast
+
+    ai_result = await run_llm(analyze_with_gemini, chat_prompt(req), mode="chat")
+    return chat_result(ai_result, req)
+
+@app.post("/chat/analyze/stream")
+async def analyze_chat_stream(req: ChatRequest):
+    """
+    Streaming variant of /chat/analyze over Server-Sent Events.
+    Events: "meta" (is_it_related, confidence, escalation_required, summary) as soon as they are
+    generated, "delta" ({"text": ...}) for each piece of the response, then "final" with the same
+    body /chat/analyze returns. "final" is authoritative; deltas are only for display.
+    """
+    print(f"DEBUG: 💬 Streaming Chat Request: {req.message}")
+
+    async def events():
+        fast = kb_fast_answer(req)
+        if fast:
+            yield sse_event("delta", {"text": fast["response"]})
+            yield sse_event("final", fast)
+            return
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def emit(event, data):
+            loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+        future = loop.run_in_executor(llm_executor, stream_chat_analysis, chat_prompt(req), emit)
+        future.add_done_callback(lambda _: queue.put_nowait(("done", None)))
+        while True:
+            event, data = await queue.get()
+            if event == "done":
+                break
+            if event == "meta":
+                data = {**data, "escalation_required": data.get("escalation_required", False) or wants_human(req.message)}
+            yield sse_event(event, data)
+        yield sse_event("final", chat_result(future.result(), req))
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/tickets")
 async def create_ticket(req: CreateTicketRequest):
     print(f"DEBUG: 📩 New Ticket Request: {req.query} (Force: {req.force_create})")
@@ -371,7 +901,7 @@ async def create_ticket(req: CreateTicketRequest):
         history_str = "\n".join([f"{m.get('role', 'User')}: {m.get('content', m.get('message', ''))}" for m in req.history])
         analysis_input = f"{history_str}\n\nUser Request: {req.query}"
 
-    ai_result = analyze_with_gemini(analysis_input, mode="ticket")
+    ai_result = await run_llm(analyze_with_gemini, analysis_input, mode="ticket")
     conf = ai_result.get("confidence", "low")
     meta = ai_result.get("ticket_metadata", {})
     draft = ai_result.get("solution_draft", "")
@@ -387,16 +917,8 @@ async def create_ticket(req: CreateTicketRequest):
         }
 
     # 3. Create Ticket (Low Confidence OR User Forced)
-    db = load_db()
-    
     # ID Generation
-    max_id = 1000
-    for t in db:
-        try:
-            tid = int(t.get("id", "TKT-1000").replace("TKT-", ""))
-            if tid > max_id: max_id = tid
-        except: pass
-    new_id = f"TKT-{max_id + 1}"
+    new_id = ticket_ids.next_id()
     
     # Prepare history
     ticket_history = []
@@ -433,11 +955,12 @@ async def create_ticket(req: CreateTicketRequest):
         "users": req.users,
         "history": ticket_history,
         "thread_id": req.thread_id,
-        "notified": True # Created by bot, so user knows.
+        "notified": True, # Created by bot, so user knows.
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
     }
     
-    db.append(new_ticket)
-    save_db(db)
+    ticket_store.insert(new_ticket)
+    change_feed.publish("ticket.created", ticket=new_ticket)
     
     return {
         "status": "created", 
@@ -448,37 +971,39 @@ async def create_ticket(req: CreateTicketRequest):
 
 def kb_entry_exists(new_query: str) -> bool:
     """Checks if a similar query already exists in the KB."""
-    if not KB_CSV.exists(): return False
-    
-    try:
-        with open(KB_CSV, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                existing_q = row.get('Question', '')
-                existing_i = row.get('Issue', '')
-                
-                # Check similarity against both Question and Issue fields
-                for text in [existing_q, existing_i]:
-                    if not text: continue
-                    ratio = SequenceMatcher(None, new_query.lower(), text.lower()).ratio()
-                    if ratio > 0.85: # High similarity threshold
-                        print(f"DEBUG: 🚫 KB Duplicate prevented: '{new_query}' similar to '{text}' ({ratio:.2f})")
-                        return True
-    except: pass
+    match = kb_duplicates.find_duplicate(new_query)
+    if match:
+        text, ratio = match
+        print(f"DEBUG: 🚫 KB Duplicate prevented: '{new_query}' similar to '{text}' ({ratio:.2f})")
+        return True
     return False
 
+STANDARDIZE_RULES = """Rules:
+        1. Remove pleasantries (Hi, Thanks, Sorry, 'I will...').
+        2. Use imperative or objective tone (e.g., 'Connect to VPN...' or 'Ticket #123 created for hardware replacement').
+        3. Keep it concise.
+        4. OUTPUT PLAIN TEXT ONLY. Do NOT use markdown formatting (no bold **, no italics *, no code blocks).
+        5. Do NOT include prefixes like "KB Resolution:" or "Resolution:". Start directly with the action."""
+
+# Batched standardization packs up to this many resolutions (and characters) into one request
+STANDARDIZE_BATCH_SIZE = int(os.getenv('STANDARDIZE_BATCH_SIZE', '20'))
+STANDARDIZE_BATCH_CHARS = int(os.getenv('STANDARDIZE_BATCH_CHARS', '12000'))
+
+def standardize_cache_key(text: str) -> str:
+    return LLMCache.make_key("standardize", normalize_prompt(text))
+
 def standardize_resolution(text: str) -> str:
     """Uses Gemini to rewrite a response into a standardized KB resolution."""
     if not text or not GOOGLE_API_KEY: return text
-    
+
+    cache_key = standardize_cache_key(text)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         prompt = f"""Rewrite the following support response into a standardized, technical resolution for a Knowledge Base. 
-        Rules:
-        1. Remove pleasantries (Hi, Thanks, Sorry, 'I will...').
-        2. Use imperative or objective tone (e.g., 'Connect to VPN...' or 'Ticket #123 created for hardware replacement').
-        3. Keep it concise.
-        4. OUTPUT PLAIN TEXT ONLY. Do NOT use markdown formatting (no bold **, no italics *, no code blocks).
-        5. Do NOT include prefixes like "KB Resolution:" or "Resolution:". Start directly with the action.
+        {STANDARDIZE_RULES}
         
         Input: "{text}"
         """
@@ -491,180 +1016,231 @@ def standardize_resolution(text: str) -> str:
         )
         
         if hasattr(response, "text"):
-            return response.text.strip()
+            result = response.text.strip()
         else:
-            return str(response).strip()
+            result = str(response).strip()
+        llm_cache.put(cache_key, result)
+        return result
     except Exception as e:
         print(f"Standardization Error: {e}")
         return text
 
+def _standardize_batch(texts: List[str]) -> List[str]:
+    """One Gemini request for several resolutions; per-item calls if the reply is unusable."""
+    prompt = f"""Rewrite each support response in the JSON array below into a standardized, technical resolution for a Knowledge Base.
+        {STANDARDIZE_RULES}
+        6. Return ONLY a JSON array of strings with exactly {len(texts)} items, in the same order as the input.
+
+        Input: {json.dumps(texts, ensure_ascii=False)}
+        """
+    try:
+        response = client.models.generate_content(model="gemini-3-pro", contents=prompt)
+        results = parse_gemini_json(response.text if hasattr(response, "text") else str(response))
+        if (isinstance(results, list) and len(results) == len(texts)
+                and all(isinstance(r, str) and r.strip() for r in results)):
+            results = [r.strip() for r in results]
+            for text, result in zip(texts, results):
+                llm_cache.put(standardize_cache_key(text), result)
+            return results
+        print(f"DEBUG: ⚠️ Malformed batch standardization reply, falling back to {len(texts)} single calls")
+    except Exception as e:
+        print(f"Batch Standardization Error: {e}")
+    return [standardize_resolution(t) for t in texts]
+
+def standardize_resolutions(texts: List[str]) -> List[str]:
+    """
+    Batch version of standardize_resolution. Cached items are answered from the cache;
+    the rest are sent in chunks of at most STANDARDIZE_BATCH_SIZE items /
+    STANDARDIZE_BATCH_CHARS characters, one Gemini request per chunk.
+    """
+    results = list(texts)
+    if not GOOGLE_API_KEY:
+        return results
+
+    todo = []
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        cached = llm_cache.get(standardize_cache_key(text))
+        if cached is not None:
+            results[i] = cached
+        else:
+            todo.append(i)
+
+    chunk, chunk_chars = [], 0
+    for i in todo + [None]:
+        full = i is not None and chunk and (len(chunk) >= STANDARDIZE_BATCH_SIZE
+                                            or chunk_chars + len(texts[i]) > STANDARDIZE_BATCH_CHARS)
+        if chunk and (i is None or full):
+            for j, result in zip(chunk, _standardize_batch([texts[j] for j in chunk])):
+                results[j] = result
+            chunk, chunk_chars = [], 0
+        if i is not None:
+            chunk.append(i)
+            chunk_chars += len(texts[i])
+    return results
+
+# --- Knowledge Base Learning Jobs ---
+# Resolutions are turned into KB entries in the background, so resolving a ticket only
+# costs the ticket update. Jobs persist in kb_jobs.db and are retried with backoff.
+async def learn_from_resolution(job: dict):
+    """Job handler: standardizes a resolution and appends it to the KB unless a duplicate exists."""
+    if kb_entry_exists(job["query"]):
+        print(f"DEBUG: ⏭️ Skipping KB update (Duplicate detected)")
+        return
+
+    std_resolution = await run_llm(standardize_resolution, job["final_answer"])
+    kb_row = {
+        'ID': str(uuid.uuid4())[:8],
+        'Category': job["category"], # Only Major Category
+        'Issue': "", # Empty Issue column
+        'Question': job["query"],
+        'Resolution': std_resolution,
+        'Tags': job["tags"]
+    }
+    kb_store.add(kb_row)
+    kb_index.add(kb_row)
+    print(f"DEBUG: 📚 Added solution to Knowledge Base")
+
+kb_jobs = JobQueue(
+    KB_JOBS_DB, learn_from_resolution,
+    workers=int(os.getenv('KB_LEARNING_WORKERS', '2')),
+    max_attempts=int(os.getenv('KB_LEARNING_MAX_ATTEMPTS', '5')),
+)
+
+@app.on_event("startup")
+async def start_kb_jobs():
+    kb_jobs.start()
+
+@app.get("/kb/learning/jobs")
+async def get_kb_learning_jobs(status: Optional[str] = None, limit: int = Query(100, ge=1, le=1000)):
+    """Counts per status plus the most recently updated KB learning jobs (optionally one status)."""
+    return {"counts": kb_jobs.counts(), "jobs": kb_jobs.list(status=status, limit=limit)}
+
 @app.post("/tickets/{ticket_id}/messages")
 async def append_ticket_message(ticket_id: str, req: MessageAppendRequest):
     """
     Appends a message to the ticket's history.
     """
-    db = load_db()
-    
-    # Simple search
-    ticket = None
-    for t in db:
-        if t["id"] == ticket_id:
-            ticket = t
-            break
-            
+    def apply(t):
+        t.setdefault("history", []).append(_history_entry(req.role, req.message))
+
+    ticket = ticket_store.update(ticket_id, apply)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
-    
-    if "history" not in ticket:
-        ticket["history"] = []
-        
-    ticket["history"].append({
-        "role": req.role,
-        "message": req.message,
-        "time": time.strftime("%H:%M")
-    })
-    
-    save_db(db)
+    change_feed.publish("ticket.message", ticket=ticket)
+
     return {"status": "updated", "history_length": len(ticket["history"])}
 
 @app.post("/broadcast")
 async def broadcast_solution(req: BroadcastRequest):
-    db = load_db()
-    
+    def apply(t):
+        t["status"] = "Resolved"
+        t["final_answer"] = req.final_answer
+        t["notified"] = False  # Trigger bot notification
+        t.setdefault("history", []).append(_history_entry("model", f"**Resolution:** {req.final_answer}"))
+
+    ticket = ticket_store.update(req.ticket_id, apply)
+    count = 1 if ticket else 0
+    if ticket:
+        change_feed.publish("ticket.resolved", ticket=ticket)
+
     # Find ticket info for KB learning
-    target_ticket_query = ""
-    target_category = ""
-    target_subcategory = ""
-    
-    for t in db:
-        if t["id"] == req.ticket_id:
-            target_ticket_query = t.get("query", "")
-            target_category = t.get("category", "Support")
-            target_subcategory = t.get("subcategory", "")
-            break
-
-    count = 0
-    for t in db:
-        if t["id"] == req.ticket_id:
-            t["status"] = "Resolved"
-            t["final_answer"] = req.final_answer
-            t["notified"] = False  # Trigger bot notification
-            t.setdefault("history", []).append({
-                "role": "model",
-                "message": f"**Resolution:** {req.final_answer}",
-                "time": time.strftime("%H:%M")
-            })
-            count += 1
-            
-    save_db(db)
+    target_ticket_query = ticket.get("query", "") if ticket else ""
+    target_category = ticket.get("category", "Support") if ticket else ""
+    target_subcategory = ticket.get("subcategory", "") if ticket else ""
     
-    # Knowledge Base Learning
+    # Knowledge Base Learning (background job, one per ticket)
+    kb_job = None
     if target_ticket_query and req.final_answer and is_quality_solution(req.final_answer):
-        # Check for duplicates
-        if kb_entry_exists(target_ticket_query):
-             print(f"DEBUG: ⏭️ Skipping KB update (Duplicate detected)")
-        else:
-            try:
-                with open(KB_CSV, 'a', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
-                    
-                    # Standardize resolution
-                    std_resolution = standardize_resolution(req.final_answer)
-                    
-                    # Generate ID
-                    new_id = str(uuid.uuid4())[:8]
-
-                    writer.writerow([
-                        new_id,
-                        target_category, # Only Major Category
-                        "", # Empty Issue column
-                        target_ticket_query, 
-                        std_resolution, 
-                        f"{target_category};{target_subcategory or ''};Resolved"
-                    ])
-                    print(f"DEBUG: 📚 Added solution to Knowledge Base")
-            except Exception as e:
-                print(f"DEBUG: ❌ Failed to update Knowledge Base: {e}")
-
-    return {"status": "success", "resolved": count}
+        kb_job = kb_jobs.enqueue(f"kb-learn:{req.ticket_id}", {
+            "query": target_ticket_query,
+            "category": target_category,
+            "tags": f"{target_category};{target_subcategory or ''};Resolved",
+            "final_answer": req.final_answer,
+        })["key"]
+
+    return {"status": "success", "resolved": count, "kb_job": kb_job}
 
 @app.post("/broadcast_all")
 async def broadcast_all(req: BroadcastAllRequest):
-    db = load_db()
-    count = 0
-    resolved_ids = []
-    
-    for t in db:
-        if t["status"] == "Pending":
-            update = False
-            if req.ticket_ids and t["id"] in req.ticket_ids:
-                update = True
-            elif req.category and t.get("category") == req.category:
-                 update = True
-            
-            if update:
-                t["status"] = "Resolved"
-                t["final_answer"] = req.final_answer
-                t["notified"] = False # Trigger notification
-                t.setdefault("history", []).append({
-                    "role": "model",
-                    "message": f"**Resolution Broadcast:** {req.final_answer}",
-                    "time": time.strftime("%H:%M")
-                })
-                count += 1
-                resolved_ids.append(t["id"])
-    
-    save_db(db)
+    """
+    Resolves many Pending tickets in one store update: every id in `ticket_ids`, plus
+    every ticket matching the filters (category, subcategory, max_age_minutes) when
+    any filter is given. Explicitly listed ids get a per-ticket result.
+    """
+    target_ids = {}
+    results = {}
+    for tid in dict.fromkeys(req.ticket_ids or []):
+        t = ticket_store.get(tid)
+        if t is None:
+            results[tid] = "not_found"
+        elif t.get("status") != "Pending":
+            results[tid] = f"skipped ({t.get('status')})"
+        else:
+            target_ids[tid] = True
+
+    if req.category or req.subcategory or req.max_age_minutes is not None:
+        # status/category come from the cache indexes; the rest is checked per candidate
+        candidates = ticket_store.query(status="Pending", category=req.category)
+        created_after = None
+        if req.max_age_minutes is not None:
+            cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=req.max_age_minutes)
+            created_after = cutoff.isoformat(timespec="seconds")
+        for t in candidates:
+            if req.subcategory and t.get("subcategory") != req.subcategory:
+                continue
+            # Tickets without created_at predate timestamps and never match an age filter
+            if created_after and (t.get("created_at") or "") < created_after:
+                continue
+            target_ids[t["id"]] = True
+
+    def apply(t):
+        t["status"] = "Resolved"
+        t["final_answer"] = req.final_answer
+        t["notified"] = False # Trigger notification
+        t.setdefault("history", []).append(_history_entry("model", f"**Resolution Broadcast:** {req.final_answer}"))
+
+    # One copy-on-write update, persisted as one batch (one journal append / one SQLite transaction)
+    resolved = ticket_store.update_many(target_ids, apply)
+    count = len(resolved)
+    resolved_ids = [t["id"] for t in resolved]
+    for tid in resolved_ids:
+        results[tid] = "resolved"
+    if resolved_ids:
+        # A single event: a large outage close should not flood feed clients ticket by ticket
+        change_feed.publish("tickets.resolved", ticket_ids=resolved_ids)
     
-    # Batch learning
+    # Batch learning (background job; the key is derived from the set of resolved tickets)
+    kb_job = None
     if count > 0 and is_quality_solution(req.final_answer):
         start_cat = req.category or "Batch"
-        batch_query = f"Batch Resolved: {count} tickets"
-        
-        if kb_entry_exists(batch_query):
-             print(f"DEBUG: ⏭️ Skipping Batch KB update (Duplicate detected)")
-        else:
-            try:
-                # Standardize batch resolution
-                std_batch_res = standardize_resolution(req.final_answer)
-                
-                # Generate ID
-                new_id = str(uuid.uuid4())[:8]
-
-                with open(KB_CSV, 'a', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
-                    writer.writerow([
-                        new_id,
-                        start_cat, # Major Category
-                        "", # Empty Issue
-                        batch_query,
-                        std_batch_res,
-                        f"{start_cat};BatchResolved"
-                    ])
-            except: pass
-
-    return {"status": "success", "resolved": count}
+        batch_key = hashlib.sha1(",".join(sorted(resolved_ids)).encode()).hexdigest()[:16]
+        kb_job = kb_jobs.enqueue(f"kb-learn-batch:{batch_key}", {
+            "query": f"Batch Resolved: {count} tickets",
+            "category": start_cat, # Major Category
+            "tags": f"{start_cat};BatchResolved",
+            "final_answer": req.final_answer,
+        })["key"]
+
+    return {"status": "success", "resolved": count, "kb_job": kb_job, "results": results}
 
 @app.delete("/tickets/{ticket_id}")
 async def delete_ticket(ticket_id: str):
-    db = load_db()
-    db = [t for t in db if t["id"] != ticket_id]
-    save_db(db)
+    if ticket_store.delete(ticket_id):
+        change_feed.publish("ticket.deleted", ticket_id=ticket_id)
     return {"status": "deleted"}
 
 @app.post("/tickets/{ticket_id}/ask")
 async def ask_user(ticket_id: str, req: AskRequest):
-    db = load_db()
-    for t in db:
-        if t["id"] == ticket_id:
-            t["status"] = "Awaiting Info"
-            t["notified"] = False  # Trigger notification
-            t["history"].append({
-                "role": "admin",
-                "message": req.question,
-                "time": time.strftime("%H:%M")
-            })
-    save_db(db)
+    def apply(t):
+        t["status"] = "Awaiting Info"
+        t["notified"] = False  # Trigger notification
+        t.setdefault("history", []).append(_history_entry("admin", req.question))
+
+    ticket = ticket_store.update(ticket_id, apply)
+    if ticket:
+        change_feed.publish("ticket.awaiting_info", ticket=ticket)
     return {"status": "sent"}
 
 @app.post("/tickets/{ticket_id}/resolve")
@@ -673,25 +1249,16 @@ async def resolve_ticket_user(ticket_id: str):
     Endpoint for users to mark their own ticket as resolved
     (e.g., if the AI suggestion worked).
     """
-    db = load_db()
-    found = False
-    for t in db:
-        if t["id"] == ticket_id:
-            t["status"] = "Self-Resolved"
-            t["final_answer"] = "User marked as resolved based on AI suggestion."
-            t["history"].append({
-                "role": "user",
-                "message": "This solution worked for me. Closing ticket.",
-                "time": time.strftime("%H:%M")
-            })
-            found = True
-            break
-    
-    if found:
-        save_db(db)
-        return {"status": "resolved"}
-    else:
+    def apply(t):
+        t["status"] = "Self-Resolved"
+        t["final_answer"] = "User marked as resolved based on AI suggestion."
+        t.setdefault("history", []).append(_history_entry("user", "This solution worked for me. Closing ticket."))
+
+    ticket = ticket_store.update(ticket_id, apply)
+    if ticket is None:
         raise HTTPException(status_code=404, detail="Ticket not found")
+    change_feed.publish("ticket.self_resolved", ticket=ticket)
+    return {"status": "resolved"}
 
 # --- Knowledge Base CRUD ---
 
@@ -706,18 +1273,7 @@ class KBEntry(BaseModel):
 @app.get("/knowledge-base")
 async def get_kb_entries():
     """Returns all KB entries."""
-    if not KB_CSV.exists():
-        return []
-    
-    entries = []
-    try:
-        with open(KB_CSV, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            entries = list(reader)
-    except Exception as e:
-        print(f"Error reading KB: {e}")
-        return []
-    return entries
+    return kb_listing()
 
 @app.post("/knowledge-base")
 async def create_kb_entry(entry: KBEntry):
@@ -726,106 +1282,98 @@ async def create_kb_entry(entry: KBEntry):
     entry.id = new_id
     
     # Standardize resolution if not already
-    entry.resolution = standardize_resolution(entry.resolution)
-    
-    fieldnames = ['ID', 'Category', 'Issue', 'Question', 'Resolution', 'Tags']
+    entry.resolution = await run_llm(standardize_resolution, entry.resolution)
     
+    kb_row = {
+        'ID': entry.id,
+        'Category': entry.category,
+        'Issue': "", # Deprecated/Empty
+        'Question': entry.question,
+        'Resolution': entry.resolution,
+        'Tags': entry.tags or ""
+    }
+
     try:
-        # Append to CSV
-        file_exists = KB_CSV.exists()
-        with open(KB_CSV, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            if not file_exists:
-                writer.writeheader()
-            writer.writerow({
-                'ID': entry.id,
-                'Category': entry.category,
-                'Issue': "", # Deprecated/Empty
-                'Question': entry.question,
-                'Resolution': entry.resolution,
-                'Tags': entry.tags or ""
-            })
+        kb_store.add(kb_row)
+        kb_index.add(kb_row)
         return {"status": "created", "entry": entry}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class KBBulkRequest(BaseModel):
+    entries: List[KBEntry]
+    standardize: bool = True # Rewrite resolutions into KB style (batched Gemini calls)
+
+@app.post("/knowledge-base/bulk")
+async def bulk_create_kb_entries(req: KBBulkRequest):
+    """
+    Imports many KB entries at once. Entries whose question duplicates the KB (or an
+    earlier entry in the same request) are skipped; resolutions are standardized in
+    batches and all rows are added in a single transaction.
+    """
+    accepted, skipped, seen = [], [], set()
+    for entry in req.entries:
+        key = normalize_prompt(entry.question)
+        if not key or key in seen or kb_entry_exists(entry.question):
+            skipped.append({"question": entry.question, "reason": "duplicate" if key else "empty"})
+            continue
+        seen.add(key)
+        accepted.append(entry)
+
+    resolutions = [e.resolution for e in accepted]
+    if req.standardize and accepted:
+        resolutions = await run_llm(standardize_resolutions, resolutions)
+
+    rows = [{
+        'ID': str(uuid.uuid4())[:8],
+        'Category': entry.category,
+        'Issue': "", # Deprecated/Empty
+        'Question': entry.question,
+        'Resolution': resolution,
+        'Tags': entry.tags or ""
+    } for entry, resolution in zip(accepted, resolutions)]
+
+    try:
+        kb_store.add_many(rows)
+        kb_index.add_many(rows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    print(f"DEBUG: 📚 Bulk import added {len(rows)} KB entries, skipped {len(skipped)}")
+    return {"status": "created", "created": [r['ID'] for r in rows], "skipped": skipped}
+
 @app.put("/knowledge-base/{entry_id}")
 async def update_kb_entry(entry_id: str, entry: KBEntry):
     """Updates an existing KB entry."""
-    if not KB_CSV.exists():
-        raise HTTPException(status_code=404, detail="KB not found")
-        
-    updated = False
-    temp_file = KB_CSV.with_suffix('.tmp')
-    
+    def apply(row):
+        row.update({
+            'Category': entry.category,
+            'Issue': "", # Deprecated/Empty
+            'Question': entry.question,
+            'Resolution': entry.resolution,
+            'Tags': entry.tags or row.get('Tags', "")
+        })
+
     try:
-        with open(KB_CSV, 'r', encoding='utf-8') as infile, \
-             open(temp_file, 'w', newline='', encoding='utf-8') as outfile:
-            
-            reader = csv.DictReader(infile)
-            fieldnames = reader.fieldnames
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for row in reader:
-                if row.get('ID') == entry_id:
-                    writer.writerow({
-                        'ID': entry_id,
-                        'Category': entry.category,
-                        'Issue': "", # Deprecated/Empty
-                        'Question': entry.question,
-                        'Resolution': entry.resolution, 
-                        'Tags': entry.tags or row.get('Tags', "")
-                    })
-                    updated = True
-                else:
-                    writer.writerow(row)
-        
-        if updated:
-            temp_file.replace(KB_CSV)
-            return {"status": "updated", "entry": entry}
-        else:
-            temp_file.unlink(missing_ok=True)
-            raise HTTPException(status_code=404, detail="Entry not found")
-            
+        updated = kb_store.update(entry_id, apply)
     except Exception as e:
-        if temp_file.exists(): temp_file.unlink()
         raise HTTPException(status_code=500, detail=str(e))
+    if not updated:
+        raise HTTPException(status_code=404, detail="Entry not found")
+    kb_index.update(updated)
+    return {"status": "updated", "entry": entry}
 
 @app.delete("/knowledge-base/{entry_id}")
 async def delete_kb_entry(entry_id: str):
     """Deletes a KB entry."""
-    if not KB_CSV.exists():
-        raise HTTPException(status_code=404, detail="KB not found")
-        
-    deleted = False
-    temp_file = KB_CSV.with_suffix('.tmp')
-    
     try:
-        with open(KB_CSV, 'r', encoding='utf-8') as infile, \
-             open(temp_file, 'w', newline='', encoding='utf-8') as outfile:
-            
-            reader = csv.DictReader(infile)
-            fieldnames = reader.fieldnames
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for row in reader:
-                if row.get('ID') == entry_id:
-                    deleted = True
-                    continue
-                writer.writerow(row)
-        
-        if deleted:
-            temp_file.replace(KB_CSV)
-            return {"status": "deleted"}
-        else:
-            temp_file.unlink(missing_ok=True)
-            raise HTTPException(status_code=404, detail="Entry not found")
-            
+        deleted = kb_store.delete(entry_id)
     except Exception as e:
-        if temp_file.exists(): temp_file.unlink()
         raise HTTPException(status_code=500, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Entry not found")
+    kb_index.remove(entry_id)
+    return {"status": "deleted"}
 
 if __name__ == "__main__":
     import uvicorn
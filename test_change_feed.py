@@ -0,0 +1,59 @@
+import asyncio
+import sys
+import threading
+
+from change_feed import ChangeFeed, KBChangePublisher
+
+
+def test_feed_since_edges():
+    feed = ChangeFeed(capacity=3)
+    assert feed.since(0) == (False, [])
+    for n in range(5):
+        feed.publish("ticket.created", n=n)
+    # Caught up, or exactly at the oldest buffered event.
+    assert feed.since(5) == (False, [])
+    assert [e["n"] for e in feed.since(2)[1]] == [2, 3, 4]
+    # Fell behind the buffer, is ahead of it, or is from another server run.
+    assert feed.since(1) == (True, [])
+    assert feed.since(6) == (True, [])
+    assert feed.since(5, epoch=feed.epoch + 1) == (True, [])
+    assert feed.since(5, epoch=feed.epoch) == (False, [])
+
+
+def test_wait_wakes_on_publish_from_another_thread():
+    async def scenario():
+        feed = ChangeFeed()
+        # Nothing new: returns empty once the timeout passes.
+        assert await feed.wait(0, feed.epoch, timeout=0.05) == (False, [])
+        timer = threading.Timer(0.05, feed.publish, args=("ticket.updated",), kwargs={"id": "TKT-1"})
+        timer.start()
+        reset, events = await feed.wait(0, feed.epoch, timeout=5)
+        timer.join()
+        assert not reset
+        assert [(e["seq"], e["type"], e["id"]) for e in events] == [(1, "ticket.updated", "TKT-1")]
+        # A stale epoch resets immediately instead of waiting.
+        assert await feed.wait(1, feed.epoch + 1, timeout=5) == (True, [])
+
+    asyncio.run(scenario())
+
+
+def test_kb_publisher_events():
+    feed = ChangeFeed()
+    publisher = KBChangePublisher(feed)
+    publisher.on_kb_add({"ID": "kb1"})
+    publisher.on_kb_remove("kb2")
+    publisher.on_kb_rebuild([1, 2, 3])
+    _, events = feed.since(0)
+    assert [(e["type"], e.get("entry_id"), e.get("count")) for e in events] == [
+        ("kb.updated", "kb1", None), ("kb.deleted", "kb2", None), ("kb.reloaded", None, 3)]
+
+
+if __name__ == "__main__":
+    try:
+        for name, test in list(globals().items()):
+            if name.startswith("test_"):
+                test()
+                print(f"SUCCESS: {name}")
+    except Exception as e:
+        print(f"FAILURE: {e}")
+        sys.exit(1)
@@ -0,0 +1,119 @@
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from job_queue import JobQueue
+
+
+def queue_path():
+    return Path(tempfile.mkdtemp()) / "kb_jobs.db"
+
+
+async def settle(queue, key, timeout=5.0):
+    """Waits until job `key` is done or failed; returns it."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(key)
+        if job["status"] in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {key} still {queue.get(key)['status']}")
+
+
+def test_failing_handler_is_retried_with_backoff():
+    calls = []
+
+    async def handler(payload):
+        calls.append(time.monotonic())
+        if len(calls) < 3:
+            raise RuntimeError("Gemini unavailable")
+
+    async def scenario():
+        queue = JobQueue(queue_path(), handler, workers=1, retry_delay=0.05)
+        queue.start()
+        queue.enqueue("TKT-1", {"ticket_id": "TKT-1"})
+        job = await settle(queue, "TKT-1")
+        await queue.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    assert (job["status"], job["attempts"], job["last_error"]) == ("done", 3, None)
+    # The delay doubles per attempt: 0.05s, then 0.1s.
+    assert calls[1] - calls[0] >= 0.05
+    assert calls[2] - calls[1] >= 0.1
+
+
+def test_exhausted_job_fails_and_can_be_requeued():
+    calls = []
+
+    async def handler(payload):
+        calls.append(payload["n"])
+        if payload["n"] == 1:
+            raise ValueError("bad ticket")
+
+    async def scenario():
+        queue = JobQueue(queue_path(), handler, workers=2, max_attempts=2, retry_delay=0.01)
+        queue.start()
+        queue.enqueue("TKT-1", {"n": 1})
+        failed = await settle(queue, "TKT-1")
+        assert queue.counts()["failed"] == 1
+        # A known key is not queued twice, unless its job failed.
+        queue.enqueue("TKT-1", {"n": 2})
+        done = await settle(queue, "TKT-1")
+        assert queue.enqueue("TKT-1", {"n": 3})["status"] == "done"
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return failed, done
+
+    failed, done = asyncio.run(scenario())
+    assert (failed["status"], failed["attempts"], failed["last_error"]) == ("failed", 2, "bad ticket")
+    assert (done["status"], done["attempts"], done["payload"]) == ("done", 1, {"n": 2})
+    assert calls == [1, 1, 2]
+
+
+def test_job_interrupted_by_stop_runs_after_reopen():
+    path = queue_path()
+    started = []
+
+    async def hang(payload):
+        started.append(payload)
+        await asyncio.Event().wait()
+
+    async def first_run():
+        queue = JobQueue(path, hang, workers=1)
+        queue.start()
+        queue.enqueue("TKT-1", {"ticket_id": "TKT-1"})
+        while not started:
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+    asyncio.run(first_run())
+    done = []
+
+    async def finish(payload):
+        done.append(payload)
+
+    async def second_run():
+        queue = JobQueue(path, finish, workers=1)
+        assert queue.get("TKT-1")["status"] == "queued"
+        queue.start()
+        job = await settle(queue, "TKT-1")
+        await queue.stop()
+        return job
+
+    job = asyncio.run(second_run())
+    assert (job["status"], job["attempts"]) == ("done", 2)
+    assert done == [{"ticket_id": "TKT-1"}]
+
+
+if __name__ == "__main__":
+    try:
+        for name, test in list(globals().items()):
+            if name.startswith("test_"):
+                test()
+                print(f"SUCCESS: {name}")
+    except Exception as e:
+        print(f"FAILURE: {e}")
+        sys.exit(1)
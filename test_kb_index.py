@@ -0,0 +1,229 @@
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from change_feed import ChangeFeed, KBChangePublisher
+from kb_dedup import KBDuplicateIndex
+from kb_index import KBIndex, tokenize
+from kb_store import KBStore
+
+FIELDS = ['ID', 'Category', 'Issue', 'Question', 'Resolution', 'Tags']
+
+ROWS = [
+    {"ID": "kb1", "Category": "Network", "Issue": "", "Question": "How do I connect to the VPN?", "Resolution": "Open the client.", "Tags": "vpn"},
+    {"ID": "kb2", "Category": "Account", "Issue": "", "Question": "How do I reset my SSO password?", "Resolution": "Use the portal.", "Tags": "password"},
+    {"ID": "kb3", "Category": "Hardware", "Issue": "Printer shows paper jam", "Question": "Printer paper jam", "Resolution": "Open tray B.", "Tags": "printer"},
+]
+
+
+def open_index(rows=ROWS, **kwargs):
+    """A KBStore and KBIndex over a fresh directory seeded with `rows` as the CSV."""
+    folder = Path(tempfile.mkdtemp())
+    with open(folder / "kb.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    store = KBStore(folder / "kb.db", folder / "kb.csv", FIELDS, export_delay=60)
+    dedup = KBDuplicateIndex()
+    kwargs.setdefault("check_interval", 60)
+    index = KBIndex(store, folder / "kb.snapshot", FIELDS, section_builders=[dedup], **kwargs)
+    index.subscribe(dedup)
+    return store, index, dedup
+
+
+def row(entry_id, question, **fields):
+    return {"ID": entry_id, "Category": "Hardware", "Issue": "", "Question": question,
+            "Resolution": "r", "Tags": "", **fields}
+
+
+def test_add_many_publishes_one_event():
+    store, index, _ = open_index()
+    feed = ChangeFeed()
+    index.subscribe(KBChangePublisher(feed))
+    rows = [row(f"new{n}", f"Monitor {n} flickers") for n in range(50)]
+    store.add_many(rows)
+    index.add_many(rows)
+    _, events = feed.since(0)
+    assert [e["type"] for e in events] == ["kb.reloaded", "kb.updated_many"]
+    assert events[1]["entry_ids"] == [r["ID"] for r in rows]
+    assert len(index) == len(ROWS) + 50
+    assert index.search("monitor flickers", k=1)[0][1]["ID"].startswith("new")
+    index.close()
+    store.close()
+
+
+def test_tokenize_lowercases_and_drops_stopwords():
+    assert tokenize("How do I reset my SSO-Password?") == ["reset", "sso", "password"]
+    assert tokenize("") == []
+
+
+def test_inverted_index_lookups():
+    store, index, _ = open_index()
+    try:
+        assert index.doc_freq("printer") == 1
+        assert index.doc_freq("unknown") == 0
+        assert {"vpn", "printer", "jam", "password"} <= set(index.terms())
+        assert "how" not in index.terms()
+        # Only rows sharing a query term are returned, and stopword-only queries match nothing.
+        assert [r["ID"] for _, r in index.search("paper jam", k=3)] == ["kb3"]
+        assert index.search("how do I", k=3) == []
+
+        index.add(row("kb4", "Printer offline"))
+        assert index.doc_freq("printer") == 2
+        assert "offline" in index.terms()
+    finally:
+        index.close()
+        store.close()
+
+
+def test_bm25f_weights_question_above_tags():
+    rows = [row("tagged", "Screen goes blank", Tags="docking"),
+            row("asked", "Docking station not detected")]
+    store, index, _ = open_index(rows)
+    try:
+        assert [r["ID"] for _, r in index.search("docking", k=2)] == ["asked", "tagged"]
+    finally:
+        index.close()
+        store.close()
+    # The weights are configurable; with Tags dominant the order flips.
+    store, index, _ = open_index(rows, field_weights={"Question": 1.0, "Tags": 5.0})
+    try:
+        assert [r["ID"] for _, r in index.search("docking", k=2)] == ["tagged", "asked"]
+    finally:
+        index.close()
+        store.close()
+
+
+def test_bm25f_rare_terms_and_short_rows_score_higher():
+    rows = [row("long", "Outlook crashes on startup after the update every single morning"),
+            row("short", "Outlook crashes"),
+            row("other", "Outlook slow"),
+            row("sync", "Outlook calendar sync")]
+    store, index, _ = open_index(rows)
+    try:
+        assert index.idf("calendar") > index.idf("outlook")
+        # Same matches, shorter document wins.
+        assert [r["ID"] for _, r in index.search("crashes", k=2)] == ["short", "long"]
+        # A rare term outweighs a term every row shares.
+        assert index.search("outlook calendar", k=1)[0][1]["ID"] == "sync"
+    finally:
+        index.close()
+        store.close()
+
+
+def test_bm25f_ties_keep_kb_order():
+    rows = [row("b", "Badge reader broken"), row("a", "Badge reader broken"), row("c", "Badge reader broken")]
+    store, index, _ = open_index(rows)
+    try:
+        assert [r["ID"] for _, r in index.search("badge", k=3)] == ["b", "a", "c"]
+        # An edited row keeps its place among equal scores.
+        index.update(row("b", "Badge reader broken", Resolution="Replace it"))
+        assert [r["ID"] for _, r in index.search("badge", k=3)] == ["b", "a", "c"]
+    finally:
+        index.close()
+        store.close()
+
+
+def wait_compacted(index, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while index.overlay_ids():
+        assert time.monotonic() < deadline, "overlay was not compacted"
+        time.sleep(0.01)
+
+
+def test_overlay_hides_replaced_and_removed_rows():
+    store, index, _ = open_index()
+    try:
+        version = index.version
+        store.update("kb3", lambda r: r.update(Question="Printer paper jam in tray B"))
+        index.update(store.get("kb3"))
+        store.delete("kb1")
+        assert index.remove("kb1") and not index.remove("kb1")
+
+        assert [r["Question"] for _, r in index.search("printer jam", k=3)] == ["Printer paper jam in tray B"]
+        assert index.search("vpn", k=3) == []
+        assert index.get("kb1") is None
+        assert [entry_id for entry_id, _ in index.items()] == ["kb2", "kb3"]
+        assert len(index) == 2
+        assert index.snapshot_json() is None  # not compiled in yet
+        assert index.version != version
+
+        # Adding and removing an entry leaves the content hash where it was.
+        version = index.version
+        index.add(row("kb9", "Scanner offline"))
+        index.remove("kb9")
+        assert index.version == version
+    finally:
+        index.close()
+        store.close()
+
+
+def test_compaction_matches_a_fresh_compile():
+    store, index, _ = open_index(compact_delay=0.01)
+    try:
+        rows = [row(f"new{n}", f"Laptop {n} overheats") for n in range(5)]
+        store.add_many(rows)
+        index.add_many(rows)
+        store.update("kb2", lambda r: r.update(Tags="password, sso"))
+        index.update(store.get("kb2"))
+        store.delete("kb1")
+        index.remove("kb1")
+        wait_compacted(index)
+
+        fresh = KBIndex(store, index.snapshot_path.with_name("fresh.snapshot"), FIELDS,
+                        section_builders=[KBDuplicateIndex()], check_interval=60)
+        try:
+            compacted, compiled = index.view()[0], fresh.view()[0]
+            assert compacted.version == compiled.version == index.version
+            assert set(compacted._sections) == set(compiled._sections)
+            for name in compiled._sections:
+                assert bytes(compacted.section(name)) == bytes(compiled.section(name)), name
+            assert json.loads(bytes(index.snapshot_json())) == store.all()
+        finally:
+            fresh.close()
+    finally:
+        index.close()
+        store.close()
+
+
+def test_reopen_maps_the_snapshot_and_catches_up_in_the_background():
+    store, index, _ = open_index()
+    index.close()
+    before = os.stat(index.snapshot_path)
+    reopened = KBIndex(store, index.snapshot_path, FIELDS, section_builders=[KBDuplicateIndex()], check_interval=60)
+    try:
+        after = os.stat(index.snapshot_path)
+        assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+        assert len(reopened) == len(ROWS)
+    finally:
+        reopened.close()
+
+    # The store moved on while the index was closed: the old snapshot is served at
+    # once and the new rows are compiled in behind it.
+    store.add(row("kb4", "Webcam not detected"))
+    reopened = KBIndex(store, index.snapshot_path, FIELDS, section_builders=[KBDuplicateIndex()],
+                       check_interval=60, compact_delay=0.01)
+    try:
+        deadline = time.monotonic() + 5
+        while len(reopened) != len(ROWS) + 1:
+            assert time.monotonic() < deadline, "outdated snapshot was not recompiled"
+            time.sleep(0.01)
+        assert reopened.search("webcam", k=1)[0][1]["ID"] == "kb4"
+    finally:
+        reopened.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    try:
+        for name, test in list(globals().items()):
+            if name.startswith("test_"):
+                test()
+                print(f"SUCCESS: {name}")
+    except Exception as e:
+        print(f"FAILURE: {e}")
+        sys.exit(1)
@@ -0,0 +1,73 @@
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from kb_snapshot import KBSnapshot, read_header, write_snapshot
+
+FIELDS = ['ID', 'Question', 'Tags']
+
+ROWS = [
+    {"ID": "kb2", "Question": "Café Wi-Fi login", "Tags": ""},
+    {"ID": "kb1", "Question": "Printer jam", "Tags": "printer"},
+    {"ID": "kb3", "Question": "", "Tags": "misc"},
+]
+COUNTS = [{"café": 3.0, "wi": 3.0, "fi": 3.0, "login": 3.0},
+          {"printer": 4.5, "jam": 3.0},
+          {"misc": 1.5}]
+HASHES = [1, 2**64 - 1, 12345]
+
+
+def compile_rows(extra=None):
+    path = Path(tempfile.mkdtemp()) / "kb.snapshot"
+    return path, write_snapshot(path, FIELDS, ROWS, COUNTS, HASHES, 7, "00000000000000ff", extra)
+
+
+def test_rows_and_lookups_roundtrip():
+    path, written = compile_rows({"custom.section": b"\x01\x02\x03"})
+    assert read_header(path) == (3, 7, 7, 21.0, "00000000000000ff")
+    snapshot = KBSnapshot(path, FIELDS)
+    assert [snapshot.row(i) for i in range(snapshot.rows)] == ROWS
+    assert json.loads(bytes(snapshot.json())) == ROWS
+    assert [snapshot.find(entry_id) for entry_id in ("kb1", "kb2", "kb3", "kb0", "kb4")] == [1, 0, 2, -1, -1]
+    assert snapshot.row_hashes() == HASHES
+    assert [snapshot.doc_len(i) for i in range(3)] == [12.0, 7.5, 1.5]
+    assert bytes(snapshot.section("custom.section")) == b"\x01\x02\x03"
+    assert snapshot.section("missing") is None
+    # The snapshot handed back by write_snapshot is the same compile.
+    assert written.row_hashes() == HASHES and written.generation == 7
+
+
+def test_token_index_roundtrip():
+    path, _ = compile_rows()
+    snapshot = KBSnapshot(path, FIELDS)
+    terms = list(snapshot.terms())
+    assert terms == sorted(t for counts in COUNTS for t in counts)
+    rows, tfs = snapshot.postings("printer")
+    assert (rows.tolist(), tfs.tolist()) == ([1], [4.5])
+    assert snapshot.postings("absent")[0].tolist() == []
+    assert [snapshot.term_counts(i, terms) for i in range(3)] == COUNTS
+
+
+def test_foreign_files_are_not_snapshots():
+    path = Path(tempfile.mkdtemp()) / "kb.snapshot"
+    assert read_header(path) is None
+    path.write_bytes(b"LBKBSNP2" + b"\0" * 64)
+    assert read_header(path) is None
+    try:
+        KBSnapshot(path, FIELDS)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("an older snapshot format must not be mapped")
+
+
+if __name__ == "__main__":
+    try:
+        for name, test in list(globals().items()):
+            if name.startswith("test_"):
+                test()
+                print(f"SUCCESS: {name}")
+    except Exception as e:
+        print(f"FAILURE: {e}")
+        sys.exit(1)
@@ -0,0 +1,115 @@
+import csv
+import sys
+import tempfile
+from pathlib import Path
+
+from kb_store import KBStore
+
+FIELDS = ['ID', 'Category', 'Issue', 'Question', 'Resolution', 'Tags']
+
+
+def entry(entry_id, question, resolution="r"):
+    return {"ID": entry_id, "Category": "Hardware", "Issue": "", "Question": question,
+            "Resolution": resolution, "Tags": ""}
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def open_store(rows):
+    folder = Path(tempfile.mkdtemp())
+    write_csv(folder / "kb.csv", rows)
+    return KBStore(folder / "kb.db", folder / "kb.csv", FIELDS, export_delay=60), folder
+
+
+def test_keyed_writes_are_logged_until_exported():
+    store, folder = open_store([entry("kb1", "Printer jam"), entry("kb2", "VPN drops")])
+    try:
+        generation = store.generation
+        store.add(entry("kb3", "Monitor flickers"))
+        assert store.update("kb1", lambda row: row.update(Resolution="Open tray B"))["Resolution"] == "Open tray B"
+        assert store.update("missing", lambda row: None) is None
+        assert store.delete("kb2") and not store.delete("kb2")
+        assert store.generation == generation + 3
+        assert [r["ID"] for r in store.all()] == ["kb1", "kb3"]
+        # The CSV is only rewritten by the (delayed) export.
+        assert [r["ID"] for r in read_csv(folder / "kb.csv")] == ["kb1", "kb2"]
+        assert store._pending()
+
+        store.export_csv()
+        assert not store._pending()
+        assert [(r["ID"], r["Resolution"]) for r in read_csv(folder / "kb.csv")] == [("kb1", "Open tray B"), ("kb3", "r")]
+        # Our own export is not mistaken for a hand edit.
+        assert not store.refresh()
+    finally:
+        store.close()
+
+
+def test_hand_edited_csv_keeps_unexported_api_writes():
+    original = [entry("kb1", "Printer jam"), entry("kb2", "VPN drops"), entry("kb3", "Monitor flickers")]
+    store, folder = open_store(original)
+    try:
+        store.update("kb1", lambda row: row.update(Resolution="api edit"))
+        store.delete("kb2")
+        store.add(entry("kb4", "Badge reader broken"))
+        # Someone edits the CSV that still predates those writes.
+        write_csv(folder / "kb.csv", [entry("kb1", "Printer jam", "hand edit"), entry("kb2", "VPN drops"),
+                                      entry("kb3", "Monitor flickers", "hand edit"), entry("kb5", "Mouse lag")])
+        assert store.refresh()
+        assert [(r["ID"], r["Resolution"]) for r in store.all()] == [
+            ("kb1", "api edit"), ("kb3", "hand edit"), ("kb5", "r"), ("kb4", "r")]
+        # The merged result reaches the CSV on the next export.
+        store.export_csv()
+        assert [r["ID"] for r in read_csv(folder / "kb.csv")] == ["kb1", "kb3", "kb5", "kb4"]
+    finally:
+        store.close()
+
+
+def test_pending_writes_are_exported_on_close_and_survive_reopen():
+    store, folder = open_store([entry("kb1", "Printer jam")])
+    store.add(entry("kb2", "VPN drops"))
+    store.close()
+    assert [r["ID"] for r in read_csv(folder / "kb.csv")] == ["kb1", "kb2"]
+
+    reopened = KBStore(folder / "kb.db", folder / "kb.csv", FIELDS, export_delay=60)
+    try:
+        assert [r["ID"] for r in reopened.all()] == ["kb1", "kb2"]
+        assert not reopened._pending()
+        assert not reopened.refresh()
+    finally:
+        reopened.close()
+
+
+def test_refresh_sees_writes_from_another_connection():
+    store, folder = open_store([entry("kb1", "Printer jam")])
+    other = KBStore(folder / "kb.db", folder / "kb.csv", FIELDS, export_delay=60)
+    try:
+        assert not store.refresh()
+        other.add(entry("kb2", "VPN drops"))
+        assert store.refresh()
+        assert not store.refresh()
+        assert store.get("kb2")["Question"] == "VPN drops"
+        assert store.generation == other.generation
+    finally:
+        other.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    try:
+        for name, test in list(globals().items()):
+            if name.startswith("test_"):
+                test()
+                print(f"SUCCESS: {name}")
+    except Exception as e:
+        print(f"FAILURE: {e}")
+        sys.exit(1)
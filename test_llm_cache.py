@@ -0,0 +1,69 @@
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from llm_cache import LLMCache, normalize_prompt
+
+
+def test_normalized_prompts_share_a_key():
+    assert normalize_prompt("  My VPN won't connect!! ") == normalize_prompt("my vpn won t connect")
+    assert LLMCache.make_key("analyze", "chat", normalize_prompt("Hi"), "v1") != \
+        LLMCache.make_key("analyze", "chat", normalize_prompt("Hi"), "v2")
+
+
+def test_lru_eviction_and_copies():
+    cache = LLMCache(max_entries=2)
+    cache.put("a", {"summary": "A"})
+    cache.put("b", {"summary": "B"})
+    assert cache.get("a") == {"summary": "A"}  # a is now the most recently used
+    cache.put("c", {"summary": "C"})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats["evictions"] == 1
+    # Callers get their own copy of a cached result.
+    cache.get("a")["summary"] = "changed"
+    assert cache.get("a") == {"summary": "A"}
+
+
+def test_entries_expire_after_ttl():
+    cache = LLMCache(ttl=0.05)
+    cache.put("k", [1, 2])
+    assert cache.get("k") == [1, 2]
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert cache.snapshot()["entries"] == 0
+
+
+def test_disk_tier_survives_restart_and_drops_expired():
+    path = Path(tempfile.mkdtemp()) / "llm_cache.db"
+    first = LLMCache(disk_path=path)
+    first.put("kept", {"summary": "kept"})
+    short = LLMCache(ttl=0.05, disk_path=path)
+    short.put("stale", {"summary": "stale"})
+    time.sleep(0.1)
+
+    restarted = LLMCache(disk_path=path)
+    assert restarted.get("kept") == {"summary": "kept"}
+    assert restarted.get("kept") == {"summary": "kept"}
+    assert restarted.get("stale") is None
+    stats = restarted.snapshot()
+    # The first lookup came from disk and was promoted into memory.
+    assert (stats["disk_hits"], stats["hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["persistent"]
+    # Expired rows were purged when the file was opened.
+    assert restarted._disk.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 1
+
+    restarted.clear()
+    assert LLMCache(disk_path=path).get("kept") is None
+
+
+if __name__ == "__main__":
+    try:
+        for name, test in list(globals().items()):
+            if name.startswith("test_"):
+                test()
+                print(f"SUCCESS: {name}")
+    except Exception as e:
+        print(f"FAILURE: {e}")
+        sys.exit(1)
@@ -0,0 +1,48 @@
+import json
+import sys
+
+from llm_stream import JsonFieldStream, sse_event
+
+
+def feed_all(stream, chunks):
+    return "".join(stream.feed(chunk) for chunk in chunks)
+
+
+def test_field_stream_chunk_boundaries():
+    body = '{"confidence": "high", "summary": "VPN", "solution_draft": "Line 1\\nsay \\"hi\\" \\u00e9", "x": "y"}'
+    # Split everywhere, including inside the key, escapes and \u sequences.
+    stream = JsonFieldStream("solution_draft")
+    assert feed_all(stream, list(body)) == 'Line 1\nsay "hi" é'
+    assert stream.done
+    assert stream.prefix == {"confidence": "high", "summary": "VPN"}
+
+
+def test_field_stream_fenced_and_missing():
+    stream = JsonFieldStream("solution_draft")
+    assert feed_all(stream, ['```json\n{"summary": "x", "solu', 'tion_draft": "ok"}\n```']) == "ok"
+    assert stream.prefix == {"summary": "x"}
+
+    stream = JsonFieldStream("solution_draft")
+    assert feed_all(stream, ['{"summary": "no draft here"}']) == ""
+    assert stream.prefix is None and not stream.done
+
+
+def test_sse_event_format():
+    message = sse_event("delta", {"text": "a\nb"}, event_id="7")
+    assert message.endswith("\n\n")
+    lines = message.rstrip("\n").split("\n")
+    assert lines[:2] == ["id: 7", "event: delta"]
+    # The payload stays on one data line even when it contains newlines.
+    assert json.loads(lines[2][len("data: "):]) == {"text": "a\nb"}
+    assert sse_event("done", {}).startswith("event: done\n")
+
+
+if __name__ == "__main__":
+    try:
+        for name, test in list(globals().items()):
+            if name.startswith("test_"):
+                test()
+                print(f"SUCCESS: {name}")
+    except Exception as e:
+        print(f"FAILURE: {e}")
+        sys.exit(1)
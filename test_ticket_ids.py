@@ -0,0 +1,65 @@
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+from ticket_store import TicketIdAllocator
+
+
+def seq_path():
+    return Path(tempfile.mkdtemp()) / "tickets_db.seq"
+
+
+def test_seeds_from_highest_existing_id():
+    ids = TicketIdAllocator(seq_path(), ["TKT-1004", "TKT-1017", "legacy", None, "TKT-1002"])
+    assert ids.next_id() == "TKT-1018"
+    assert ids.next_id() == "TKT-1019"
+
+
+def test_floor_applies_to_an_empty_store():
+    assert TicketIdAllocator(seq_path()).next_id() == "TKT-1001"
+    assert TicketIdAllocator(seq_path(), floor=5).next_id() == "TKT-6"
+
+
+def test_sequence_survives_reopen_and_deletes():
+    path = seq_path()
+    ids = TicketIdAllocator(path, ["TKT-1001"])
+    assert [ids.next_id() for _ in range(3)] == ["TKT-1002", "TKT-1003", "TKT-1004"]
+    # The newest tickets were deleted since; their ids are still never reused.
+    assert TicketIdAllocator(path, ["TKT-1001"]).next_id() == "TKT-1005"
+
+
+def test_seed_repairs_a_lagging_sequence_file():
+    path = seq_path()
+    path.write_text("1003")
+    assert TicketIdAllocator(path, ["TKT-1050"]).next_id() == "TKT-1051"
+    path.write_text("garbage")
+    assert TicketIdAllocator(path, ["TKT-1002"]).next_id() == "TKT-1003"
+
+
+def test_concurrent_allocations_are_unique():
+    ids = TicketIdAllocator(seq_path())
+    allocated = []
+
+    def worker():
+        for _ in range(200):
+            allocated.append(ids.next_id())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(allocated)) == 800
+    assert TicketIdAllocator.parse(max(allocated, key=TicketIdAllocator.parse)) == 1800
+
+
+if __name__ == "__main__":
+    try:
+        for name, test in list(globals().items()):
+            if name.startswith("test_"):
+                test()
+                print(f"SUCCESS: {name}")
+    except Exception as e:
+        print(f"FAILURE: {e}")
+        sys.exit(1)
@@ -0,0 +1,104 @@
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from ticket_store import CachedTicketStore, JsonTicketStore
+
+
+def make_store(snapshot, journal_text=""):
+    path = Path(tempfile.mkdtemp()) / "tickets_db.json"
+    path.write_text(json.dumps(snapshot))
+    path.with_name(path.name + ".journal").write_text(journal_text)
+    return path
+
+
+def journal(*records):
+    return "".join(json.dumps(r) + "\n" for r in records)
+
+
+def test_journal_replays_over_snapshot():
+    path = make_store(
+        [{"id": "TKT-1", "status": "Open"}, {"id": "TKT-2", "status": "Open"}],
+        journal(
+            {"op": "put", "ticket": {"id": "TKT-1", "status": "Resolved"}},
+            {"op": "put", "ticket": {"id": "TKT-3", "status": "Open"}},
+            {"op": "del", "id": "TKT-2"},
+        ),
+    )
+    store = JsonTicketStore(path, background=False)
+    assert {t["id"]: t["status"] for t in store.all()} == {"TKT-1": "Resolved", "TKT-3": "Open"}
+    store.close()
+    # Closing compacts the journal into the snapshot.
+    assert path.with_name(path.name + ".journal").stat().st_size == 0
+    assert {t["id"] for t in json.loads(path.read_text())} == {"TKT-1", "TKT-3"}
+
+
+def test_torn_tail_record_is_dropped():
+    torn = journal({"op": "put", "ticket": {"id": "TKT-2", "status": "Open"}}) + '{"op": "put", "tic'
+    path = make_store([{"id": "TKT-1", "status": "Open"}], torn)
+    store = JsonTicketStore(path, background=False)
+    assert sorted(t["id"] for t in store.all()) == ["TKT-1", "TKT-2"]
+    # New records start on a clean line after the repair.
+    store.insert({"id": "TKT-3", "status": "Open"})
+    assert sorted(t["id"] for t in store.all()) == ["TKT-1", "TKT-2", "TKT-3"]
+    store.close()
+
+
+def test_unreadable_snapshot_raises():
+    path = make_store([])
+    path.write_text("[{\"id\": \"TKT-1\",")
+    store = JsonTicketStore(path, background=False)
+    try:
+        store.all()
+    except RuntimeError as e:
+        assert "unreadable" in str(e)
+    else:
+        raise AssertionError("an unreadable snapshot must not read as empty")
+
+
+def test_corrupt_hand_edit_keeps_cache_and_writer():
+    path = make_store([{"id": "TKT-1", "status": "Open"}])
+    store = CachedTicketStore(JsonTicketStore(path, background=False), check_interval=0.05)
+    try:
+        time.sleep(0.02)
+        path.write_text('[{"id": "TKT-1", "status": "Re')  # half-saved hand edit
+        time.sleep(0.3)
+        # The idle check hit the broken file: the old tickets are still served...
+        assert store._writer.is_alive()
+        assert [t["id"] for t in store.all()] == ["TKT-1"]
+
+        path.write_text(json.dumps([{"id": "TKT-1", "status": "Open"}, {"id": "TKT-2", "status": "Open"}]))
+        time.sleep(0.3)
+        # ...and the fixed file is picked up on a later check.
+        assert sorted(t["id"] for t in store.all()) == ["TKT-1", "TKT-2"]
+        store.insert({"id": "TKT-3", "status": "Open"})
+        store.flush()
+        assert sorted(t["id"] for t in store.backing.all()) == ["TKT-1", "TKT-2", "TKT-3"]
+    finally:
+        store.close()
+
+
+def test_update_keeps_storage_order():
+    path = make_store([{"id": f"TKT-{n}", "status": "Open"} for n in (1001, 1002, 1003)])
+    store = CachedTicketStore(JsonTicketStore(path, background=False))
+    try:
+        store.update("TKT-1001", lambda t: t.update(status="Resolved"))
+        store.put_many([{"id": "TKT-1002", "status": "Resolved"}])
+        assert [t["id"] for t in store.all()] == ["TKT-1001", "TKT-1002", "TKT-1003"]
+        assert [t["id"] for t in store.query(status="Resolved")] == ["TKT-1001", "TKT-1002"]
+        assert [t["id"] for t in store.query(status="Open")] == ["TKT-1003"]
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    try:
+        for name, test in list(globals().items()):
+            if name.startswith("test_"):
+                test()
+                print(f"SUCCESS: {name}")
+    except Exception as e:
+        print(f"FAILURE: {e}")
+        sys.exit(1)
@@ -0,0 +1,63 @@
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("GOOGLE_API_KEY", "test")  # server builds its Gemini client on import
+
+from fastapi.testclient import TestClient
+
+from server import app
+from ticket_store import CachedTicketStore, JsonTicketStore
+
+
+def make_store(snapshot):
+    path = Path(tempfile.mkdtemp()) / "tickets_db.json"
+    path.write_text(json.dumps(snapshot))
+    return path
+
+
+def test_changes_since_floors_and_resets():
+    path = make_store([{"id": "TKT-1", "status": "Open", "revision": 5}])
+    store = CachedTicketStore(JsonTicketStore(path, background=False))
+    try:
+        assert store.changes_since(5) == (False, [], [])
+        # Older than the last load, or ahead of the store: resync.
+        assert store.changes_since(4)[0]
+        assert store.changes_since(6)[0]
+
+        store.update("TKT-1", lambda t: t.update(status="Resolved"))
+        store.insert({"id": "TKT-2", "status": "Open"})
+        store.delete("TKT-2")
+        reset, changed, deleted = store.changes_since(5)
+        assert not reset
+        assert [(t["id"], t["revision"]) for t in changed] == [("TKT-1", 6)]
+        assert deleted == ["TKT-2"]
+        assert store.changes_since(8) == (False, [], [])
+
+        store.replace_all([{"id": "TKT-9", "status": "Open"}])
+        assert store.changes_since(8)[0]
+        assert store.changes_since(store.revision) == (False, [], [])
+    finally:
+        store.close()
+
+
+def test_delta_mode_since_current_revision():
+    client = TestClient(app)
+    full = client.get("/tickets", params={"fields": "id"})
+    revision = int(full.headers["x-revision"])
+    delta = client.get("/tickets", params={"since": revision}).json()
+    assert delta == {"revision": revision, "reset": False, "tickets": [], "deleted": []}
+    assert client.get("/tickets", params={"since": revision + 1}).json()["reset"]
+
+
+if __name__ == "__main__":
+    try:
+        for name, test in list(globals().items()):
+            if name.startswith("test_"):
+                test()
+                print(f"SUCCESS: {name}")
+    except Exception as e:
+        print(f"FAILURE: {e}")
+        sys.exit(1)
@@ -0,0 +1,792 @@
+import copy
+import datetime
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Columns pulled out of the ticket document so they can be indexed.
+INDEXED_FIELDS = ("status", "category", "notified", "group_id")
+
+
+class TicketStore:
+    """Interface every ticket backend implements.
+
+    Tickets are plain dicts (the same shape that used to live in tickets_db.json).
+    `update` runs `mutate(ticket)` against a single ticket inside one transaction,
+    so concurrent requests touching different tickets never lose each other's writes.
+    """
+
+    def all(self) -> List[dict]:
+        raise NotImplementedError
+
+    def get(self, ticket_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def query(self, **filters) -> List[dict]:
+        """Returns tickets whose indexed fields (status, category, notified, group_id) match."""
+        raise NotImplementedError
+
+    def insert(self, ticket: dict) -> dict:
+        raise NotImplementedError
+
+    def update(self, ticket_id: str, mutate: Callable[[dict], None]) -> Optional[dict]:
+        """Applies `mutate` to one ticket and persists it. Returns None if the ticket is missing."""
+        raise NotImplementedError
+
+    def update_many(self, ticket_ids: Iterable[str], mutate: Callable[[dict], None]) -> List[dict]:
+        """Applies `mutate` to each existing ticket in `ticket_ids` in a single transaction."""
+        raise NotImplementedError
+
+    def put_many(self, tickets: List[dict]) -> None:
+        """Inserts or overwrites whole tickets without reading them first."""
+        raise NotImplementedError
+
+    def delete(self, ticket_id: str) -> bool:
+        raise NotImplementedError
+
+    def replace_all(self, tickets: List[dict]) -> None:
+        """Overwrites the whole store."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        return len(self.all())
+
+    def changed_externally(self) -> bool:
+        """True if another process modified the underlying storage since this store last looked."""
+        return False
+
+    def mark_stale(self) -> None:
+        """Makes the next `changed_externally()` return True, e.g. after reloading from it failed."""
+        pass
+
+    def close(self) -> None:
+        """Flushes pending writes. Called on server shutdown."""
+        pass
+
+
+def _matches(ticket: dict, filters: Dict) -> bool:
+    for key, value in filters.items():
+        if value is None:
+            continue
+        current = ticket.get(key, True) if key == "notified" else ticket.get(key)
+        if current != value:
+            return False
+    return True
+
+
+class JsonTicketStore(TicketStore):
+    """Single-file backend with an append-only mutation journal.
+
+    The snapshot (tickets_db.json) is only rewritten on compaction. Every mutation is
+    appended to `<snapshot>.journal` as one JSON line (`put` with the full ticket, or
+    `del` with its id) and replayed on top of the snapshot when reading. Journal writes
+    are flushed immediately and fsynced in batches at most `fsync_interval` seconds
+    apart; a background thread compacts the journal into a new snapshot once it grows
+    past `compact_bytes` or `compact_interval` seconds have passed since the last one.
+    """
+
+    def __init__(self, path: Path, fsync_interval: float = 0.05, compact_bytes: int = 1_000_000,
+                 compact_interval: float = 300.0, background: bool = True):
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self.compact_interval = compact_interval
+        self._lock = threading.RLock()
+        self._snapshot_stat = self._stat_snapshot()
+        self._repair_journal_tail()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._unsynced = False
+        self._last_fsync = time.monotonic()
+        self._last_compact = time.monotonic()
+        self._stop = threading.Event()
+        self._worker = None
+        if background:
+            self._worker = threading.Thread(target=self._background_loop, name="ticket-journal", daemon=True)
+            self._worker.start()
+
+    def _repair_journal_tail(self) -> None:
+        """Drops a partially written last record so new appends start on a clean line."""
+        if not self.journal_path.exists():
+            return
+        with open(self.journal_path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                print("DEBUG: ⚠️ Truncating partially written ticket journal record")
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def _stat_snapshot(self) -> Optional[tuple]:
+        try:
+            st = self.path.stat()
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def changed_externally(self) -> bool:
+        with self._lock:
+            current = self._stat_snapshot()
+            if current != self._snapshot_stat:
+                self._snapshot_stat = current
+                return True
+        return False
+
+    def mark_stale(self) -> None:
+        with self._lock:
+            # Never equal to a real stat, nor to None for a missing file.
+            self._snapshot_stat = ()
+
+    # --- Reading ---
+    def _read_snapshot(self) -> List[dict]:
+        if not self.path.exists():
+            return []
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            # Never fall back to an empty list here: the next write would persist it.
+            raise RuntimeError(f"Ticket snapshot {self.path} is unreadable: {e}") from e
+
+    def _read(self) -> List[dict]:
+        tickets = {t.get("id"): t for t in self._read_snapshot()}
+        if self.journal_path.exists():
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"DEBUG: ⚠️ Skipping corrupt journal record at line {line_no}")
+                        continue
+                    if record.get("op") == "put":
+                        tickets[record["ticket"]["id"]] = record["ticket"]
+                    elif record.get("op") == "del":
+                        tickets.pop(record["id"], None)
+        return list(tickets.values())
+
+    # --- Writing ---
+    def _append(self, records: List[dict]) -> None:
+        self._journal.write("".join(json.dumps(r) + "\n" for r in records))
+        self._journal.flush()
+        self._unsynced = True
+        if time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._fsync()
+
+    def _fsync(self) -> None:
+        if self._unsynced:
+            os.fsync(self._journal.fileno())
+            self._unsynced = False
+        self._last_fsync = time.monotonic()
+
+    def _write_snapshot(self, tickets: List[dict]) -> None:
+        tmp = self.path.with_suffix(".json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(tickets, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(self.path)
+        self._snapshot_stat = self._stat_snapshot()
+        # Replaying the old journal over the new snapshot is harmless, so truncating last is crash-safe.
+        self._journal.close()
+        self._journal = open(self.journal_path, "w", encoding="utf-8")
+        self._unsynced = False
+        self._last_compact = time.monotonic()
+
+    def compact(self) -> None:
+        """Folds the journal into a fresh snapshot and truncates it."""
+        with self._lock:
+            self._write_snapshot(self._read())
+
+    def _background_loop(self) -> None:
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                with self._lock:
+                    self._fsync()
+                    size = self.journal_path.stat().st_size if self.journal_path.exists() else 0
+                    due = time.monotonic() - self._last_compact >= self.compact_interval
+                    if size >= self.compact_bytes or (due and size > 0):
+                        print(f"DEBUG: 🗜️ Compacting ticket journal ({size} bytes)")
+                        self.compact()
+            except Exception as e:
+                print(f"DEBUG: ❌ Ticket journal maintenance failed: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._worker:
+            self._worker.join()
+        with self._lock:
+            self._fsync()
+            if self.journal_path.stat().st_size > 0:
+                self.compact()
+            self._journal.close()
+
+    # --- TicketStore API ---
+    def all(self) -> List[dict]:
+        with self._lock:
+            return self._read()
+
+    def get(self, ticket_id: str) -> Optional[dict]:
+        with self._lock:
+            for t in self._read():
+                if t.get("id") == ticket_id:
+                    return t
+        return None
+
+    def query(self, **filters) -> List[dict]:
+        with self._lock:
+            return [t for t in self._read() if _matches(t, filters)]
+
+    def insert(self, ticket: dict) -> dict:
+        with self._lock:
+            self._append([{"op": "put", "ticket": ticket}])
+        return ticket
+
+    def update(self, ticket_id: str, mutate: Callable[[dict], None]) -> Optional[dict]:
+        updated = self.update_many([ticket_id], mutate)
+        return updated[0] if updated else None
+
+    def update_many(self, ticket_ids: Iterable[str], mutate: Callable[[dict], None]) -> List[dict]:
+        wanted = set(ticket_ids)
+        with self._lock:
+            updated = []
+            for t in self._read():
+                if t.get("id") in wanted:
+                    mutate(t)
+                    updated.append(t)
+            if updated:
+                self._append([{"op": "put", "ticket": t} for t in updated])
+        return updated
+
+    def put_many(self, tickets: List[dict]) -> None:
+        with self._lock:
+            self._append([{"op": "put", "ticket": t} for t in tickets])
+
+    def delete(self, ticket_id: str) -> bool:
+        with self._lock:
+            if not any(t.get("id") == ticket_id for t in self._read()):
+                return False
+            self._append([{"op": "del", "id": ticket_id}])
+        return True
+
+    def replace_all(self, tickets: List[dict]) -> None:
+        with self._lock:
+            self._write_snapshot(tickets)
+
+
+class SqliteTicketStore(TicketStore):
+    """Embedded SQLite backend.
+
+    Each ticket is one row keyed by `id`; the full document is kept as JSON in `data`
+    and the indexed fields are mirrored into their own columns. Single-ticket updates
+    only read and write that row, so their cost does not grow with the table size.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tickets (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            status TEXT,
+            category TEXT,
+            notified INTEGER NOT NULL DEFAULT 1,
+            group_id TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets(status);
+        CREATE INDEX IF NOT EXISTS idx_tickets_category ON tickets(category);
+        CREATE INDEX IF NOT EXISTS idx_tickets_notified ON tickets(notified);
+        CREATE INDEX IF NOT EXISTS idx_tickets_group_id ON tickets(group_id);
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def changed_externally(self) -> bool:
+        # data_version only moves when a *different* connection commits.
+        with self._lock:
+            current = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            changed, self._data_version = current != self._data_version, current
+        return changed
+
+    def mark_stale(self) -> None:
+        with self._lock:
+            self._data_version = None
+
+    @staticmethod
+    def _columns(ticket: dict) -> tuple:
+        return (
+            ticket.get("status"),
+            ticket.get("category"),
+            1 if ticket.get("notified", True) else 0,
+            ticket.get("group_id"),
+            json.dumps(ticket),
+        )
+
+    def _select(self, where: str = "", params: tuple = ()) -> List[dict]:
+        rows = self._conn.execute(f"SELECT data FROM tickets {where} ORDER BY seq", params).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def all(self) -> List[dict]:
+        with self._lock:
+            return self._select()
+
+    def get(self, ticket_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM tickets WHERE id = ?", (ticket_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query(self, **filters) -> List[dict]:
+        clauses, params = [], []
+        for key, value in filters.items():
+            if key not in INDEXED_FIELDS:
+                raise ValueError(f"Cannot filter on non-indexed field '{key}'")
+            if value is None:
+                continue
+            clauses.append(f"{key} = ?")
+            params.append((1 if value else 0) if key == "notified" else value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            return self._select(where, tuple(params))
+
+    def insert(self, ticket: dict) -> dict:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO tickets (id, status, category, notified, group_id, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (ticket["id"],) + self._columns(ticket),
+            )
+        return ticket
+
+    def update(self, ticket_id: str, mutate: Callable[[dict], None]) -> Optional[dict]:
+        updated = self.update_many([ticket_id], mutate)
+        return updated[0] if updated else None
+
+    def update_many(self, ticket_ids: Iterable[str], mutate: Callable[[dict], None]) -> List[dict]:
+        updated = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for ticket_id in dict.fromkeys(ticket_ids):
+                    row = self._conn.execute("SELECT data FROM tickets WHERE id = ?", (ticket_id,)).fetchone()
+                    if not row:
+                        continue
+                    ticket = json.loads(row[0])
+                    mutate(ticket)
+                    self._conn.execute(
+                        "UPDATE tickets SET status = ?, category = ?, notified = ?, group_id = ?, data = ? WHERE id = ?",
+                        self._columns(ticket) + (ticket_id,),
+                    )
+                    updated.append(ticket)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return updated
+
+    def put_many(self, tickets: List[dict]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO tickets (id, status, category, notified, group_id, data) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET status = excluded.status, category = excluded.category, "
+                    "notified = excluded.notified, group_id = excluded.group_id, data = excluded.data",
+                    [(t["id"],) + self._columns(t) for t in tickets],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, ticket_id: str) -> bool:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM tickets WHERE id = ?", (ticket_id,))
+        return cur.rowcount > 0
+
+    def replace_all(self, tickets: List[dict]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM tickets")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO tickets (id, status, category, notified, group_id, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(t["id"],) + self._columns(t) for t in tickets],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedTicketStore(TicketStore):
+    """Process-wide in-memory view of a backing store.
+
+    Tickets are held in a dict keyed by id, with set indexes on the indexed fields, so
+    reads never touch disk. Writes are applied copy-on-write in memory and handed to a
+    single background thread that persists them to the backing store in order; a failed
+    write is retried with backoff (`retry_delay`, doubled up to `max_retry_delay`
+    seconds) until it succeeds. The backing store is polled at most every
+    `check_interval` seconds for changes made by other processes (e.g. hand edits to
+    tickets_db.json), which trigger a reload; the writer thread also checks while idle,
+    so a reload happens even when nothing reads, and `subscribe`d callbacks are told
+    about it. `version` increases on every change to the cached tickets (e.g. for ETags).
+
+    Every write also stamps the ticket with a store-wide `revision` and `updated_at`, and
+    deletions leave a tombstone, so `changes_since(rev)` can hand out deltas. Revisions
+    older than the last (re)load are not tracked; callers asking for them must resync.
+    """
+
+    def __init__(self, backing: TicketStore, check_interval: float = 1.0,
+                 retry_delay: float = 0.5, max_retry_delay: float = 30.0):
+        self.backing = backing
+        self.check_interval = check_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._closing = threading.Event()
+        self.version = 0
+        self.revision = 0
+        self._lock = threading.RLock()
+        self._writes = queue.Queue()
+        self._pending = 0
+        self._last_check = time.monotonic()
+        self._reload_listeners: List[Callable[[], None]] = []
+        self._load()
+        self._writer = threading.Thread(target=self._write_loop, name="ticket-cache-writer", daemon=True)
+        self._writer.start()
+
+    # --- Indexes ---
+    @staticmethod
+    def _index_key(ticket: dict, field: str):
+        return bool(ticket.get("notified", True)) if field == "notified" else ticket.get(field)
+
+    def _load(self) -> None:
+        with self._lock:
+            # Read before resetting anything, so a failed read leaves the current cache intact.
+            tickets = self.backing.all()
+            self._by_id: Dict[str, dict] = {}
+            self._order: Dict[str, int] = {}
+            self._indexes: Dict[str, Dict] = {field: {} for field in INDEXED_FIELDS}
+            self._next_order = 0
+            for t in tickets:
+                self._add(t)
+                self.revision = max(self.revision, t.get("revision") or 0)
+            self._floor = self.revision
+            self._changed: "OrderedDict[str, int]" = OrderedDict()
+            self._deleted: "OrderedDict[str, int]" = OrderedDict()
+        print(f"DEBUG: 🗂️ Ticket cache loaded {len(self._by_id)} tickets")
+
+    def _add(self, ticket: dict) -> None:
+        tid = ticket["id"]
+        current = self._by_id.get(tid)
+        if current is not None:
+            # Replaced in place, so an updated ticket keeps its position in storage order.
+            self._unindex(current)
+        else:
+            self._order[tid] = self._next_order
+            self._next_order += 1
+        self._by_id[tid] = ticket
+        self.version += 1
+        for field, index in self._indexes.items():
+            index.setdefault(self._index_key(ticket, field), set()).add(tid)
+
+    def _stamp(self, ticket: dict) -> None:
+        self.revision += 1
+        ticket["revision"] = self.revision
+        ticket["updated_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        tid = ticket["id"]
+        self._changed[tid] = self.revision
+        self._changed.move_to_end(tid)
+        self._deleted.pop(tid, None)
+
+    def _unindex(self, ticket: dict) -> None:
+        for field, index in self._indexes.items():
+            ids = index.get(self._index_key(ticket, field))
+            if ids is not None:
+                ids.discard(ticket["id"])
+                if not ids:
+                    del index[self._index_key(ticket, field)]
+
+    def _remove(self, ticket_id: str) -> Optional[dict]:
+        ticket = self._by_id.pop(ticket_id, None)
+        if ticket is None:
+            return None
+        self.version += 1
+        self._unindex(ticket)
+        return ticket
+
+    def subscribe(self, callback: Callable[[], None]) -> None:
+        """Calls `callback()` after every reload caused by an outside change."""
+        self._reload_listeners.append(callback)
+
+    def _refresh_if_stale(self) -> None:
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self.refresh()
+
+    def refresh(self) -> bool:
+        """Reloads the cache now if another process changed the backing store; returns True if it did."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            # Our own queued writes have not reached the backing store yet; check next time.
+            if self._pending or not self.backing.changed_externally():
+                return False
+            print("DEBUG: 🔄 Ticket storage changed on disk, reloading cache")
+            try:
+                self._load()
+            except Exception as e:
+                # E.g. a half-saved hand edit: keep serving the old cache and retry next check.
+                self.backing.mark_stale()
+                print(f"DEBUG: ❌ Ticket cache reload failed, keeping the cached tickets: {e}")
+                return False
+            for callback in self._reload_listeners:
+                callback()
+        return True
+
+    # --- Background persistence ---
+    def _enqueue(self, op: str, payload) -> None:
+        self._pending += 1
+        self._writes.put((op, payload))
+
+    def _write_loop(self) -> None:
+        while True:
+            try:
+                op, payload = self._writes.get(timeout=max(self.check_interval, 0.1))
+            except queue.Empty:
+                # Idle: look for outside changes, so they are announced even if nothing reads.
+                try:
+                    self._refresh_if_stale()
+                except Exception as e:
+                    print(f"DEBUG: ❌ Ticket storage check failed: {e}")
+                continue
+            if op == "stop":
+                self._writes.task_done()
+                return
+            self._persist(op, payload)
+            with self._lock:
+                self._pending -= 1
+            self._writes.task_done()
+
+    def _persist(self, op: str, payload) -> None:
+        """Applies one queued write, retrying with exponential backoff until it succeeds.
+
+        The write stays counted in `_pending` meanwhile (so no reload can discard it) and
+        later writes wait behind it, keeping their order. Once `close` is called a write
+        that still fails is reported as lost rather than blocking shutdown.
+        """
+        delay = self.retry_delay
+        while True:
+            try:
+                if op == "put":
+                    self.backing.put_many(payload)
+                elif op == "delete":
+                    self.backing.delete(payload)
+                elif op == "replace":
+                    self.backing.replace_all(payload)
+                return
+            except Exception as e:
+                if self._closing.is_set():
+                    print(f"DEBUG: ❌ Ticket change ({op}) was NOT persisted, giving up at shutdown: {e}")
+                    return
+                print(f"DEBUG: ❌ Failed to persist ticket change ({op}), retrying in {delay:.1f}s: {e}")
+            self._closing.wait(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+
+    def flush(self) -> None:
+        """Blocks until every queued write has reached the backing store."""
+        self._writes.join()
+
+    # --- TicketStore API ---
+    def all(self) -> List[dict]:
+        with self._lock:
+            self._refresh_if_stale()
+            return list(self._by_id.values())
+
+    def get(self, ticket_id: str) -> Optional[dict]:
+        with self._lock:
+            self._refresh_if_stale()
+            return self._by_id.get(ticket_id)
+
+    def query(self, **filters) -> List[dict]:
+        with self._lock:
+            self._refresh_if_stale()
+            ids = None
+            for field, value in filters.items():
+                if field not in INDEXED_FIELDS:
+                    raise ValueError(f"Cannot filter on non-indexed field '{field}'")
+                if value is None:
+                    continue
+                matched = self._indexes[field].get(value, set())
+                ids = set(matched) if ids is None else ids & matched
+            if ids is None:
+                return list(self._by_id.values())
+            return [self._by_id[tid] for tid in sorted(ids, key=self._order.__getitem__)]
+
+    def insert(self, ticket: dict) -> dict:
+        with self._lock:
+            self._stamp(ticket)
+            self._add(ticket)
+            self._enqueue("put", [ticket])
+        return ticket
+
+    def update(self, ticket_id: str, mutate: Callable[[dict], None]) -> Optional[dict]:
+        updated = self.update_many([ticket_id], mutate)
+        return updated[0] if updated else None
+
+    def update_many(self, ticket_ids: Iterable[str], mutate: Callable[[dict], None]) -> List[dict]:
+        with self._lock:
+            updated = []
+            for tid in dict.fromkeys(ticket_ids):
+                current = self._by_id.get(tid)
+                if current is None:
+                    continue
+                # Copy-on-write: readers and the writer thread keep seeing a consistent old version.
+                ticket = copy.deepcopy(current)
+                mutate(ticket)
+                updated.append(ticket)
+            for ticket in updated:
+                self._stamp(ticket)
+                self._add(ticket)
+            if updated:
+                self._enqueue("put", updated)
+        return updated
+
+    def put_many(self, tickets: List[dict]) -> None:
+        with self._lock:
+            for t in tickets:
+                self._stamp(t)
+                self._add(t)
+            self._enqueue("put", list(tickets))
+
+    def delete(self, ticket_id: str) -> bool:
+        with self._lock:
+            if self._remove(ticket_id) is None:
+                return False
+            self._order.pop(ticket_id, None)
+            self.revision += 1
+            self._deleted[ticket_id] = self.revision
+            self._changed.pop(ticket_id, None)
+            self._enqueue("delete", ticket_id)
+        return True
+
+    def replace_all(self, tickets: List[dict]) -> None:
+        with self._lock:
+            self._by_id, self._order = {}, {}
+            self._indexes = {field: {} for field in INDEXED_FIELDS}
+            for t in tickets:
+                self._add(t)
+            # A wholesale replacement has no per-ticket history; delta clients must resync.
+            self.revision += 1
+            self._floor = self.revision
+            self._changed.clear()
+            self._deleted.clear()
+            self._enqueue("replace", list(tickets))
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._by_id)
+
+    def changes_since(self, revision: int):
+        """Returns (resync_required, tickets changed after `revision`, ids deleted after it)."""
+        with self._lock:
+            self._refresh_if_stale()
+            if revision < self._floor or revision > self.revision:
+                return True, [], []
+            changed = []
+            for tid, rev in reversed(self._changed.items()):
+                if rev <= revision:
+                    break
+                changed.append(self._by_id[tid])
+            deleted = []
+            for tid, rev in reversed(self._deleted.items()):
+                if rev <= revision:
+                    break
+                deleted.append(tid)
+            return False, changed[::-1], deleted[::-1]
+
+    def close(self) -> None:
+        self._writes.put(("stop", None))
+        self._closing.set()
+        self._writer.join()
+        self.backing.close()
+
+
+class TicketIdAllocator:
+    """Monotonic `TKT-####` sequence persisted to a small sidecar file.
+
+    Seeded once from the highest existing ticket id; afterwards each allocation is a
+    lock-protected increment plus a tiny atomic file write, independent of ticket count.
+    """
+
+    PREFIX = "TKT-"
+
+    def __init__(self, path: Path, existing_ids: Iterable[str] = (), floor: int = 1000):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        seeded = max([floor] + [n for n in map(self.parse, existing_ids) if n is not None])
+        # The seed also repairs a sequence file that lags behind the data (e.g. after a restore).
+        self._current = max(seeded, self._read())
+        self._write(self._current)
+
+    @classmethod
+    def parse(cls, ticket_id: Optional[str]) -> Optional[int]:
+        try:
+            return int(str(ticket_id).replace(cls.PREFIX, ""))
+        except ValueError:
+            return None
+
+    def _read(self) -> int:
+        try:
+            return int(self.path.read_text().strip())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write(self, value: int) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(str(value))
+        tmp.replace(self.path)
+
+    def next_id(self) -> str:
+        with self._lock:
+            self._current += 1
+            self._write(self._current)
+            return f"{self.PREFIX}{self._current}"
+
+
+def import_json(store: TicketStore, json_path: Path) -> int:
+    """One-shot import of a legacy tickets_db.json into `store`. Returns the number of tickets imported."""
+    json_path = Path(json_path)
+    if not json_path.exists():
+        return 0
+    with open(json_path, "r") as f:
+        tickets = json.load(f)
+    tickets = [t for t in tickets if t.get("id")]
+    store.replace_all(tickets)
+    return len(tickets)
+
+
+def open_store(backend: str, json_path: Path, sqlite_path: Path, **json_options) -> TicketStore:
+    """Builds the configured backend. A fresh SQLite store is seeded from the JSON file once."""
+    if backend == "sqlite":
+        store = SqliteTicketStore(sqlite_path)
+        if store.count() == 0 and Path(json_path).exists():
+            imported = import_json(store, json_path)
+            print(f"DEBUG: 📦 Imported {imported} tickets from {Path(json_path).name} into SQLite")
+        return store
+    return JsonTicketStore(json_path, **json_options)